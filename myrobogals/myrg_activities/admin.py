@@ -33,6 +33,8 @@ class SubActivityAdmin(admin.ModelAdmin):
     search_fields = ('name','description',)
     ordering = ('-date_rsvp_close','parent',)
 
+    list_select_related = ('parent',)
+
 class ParticipantAdmin(admin.ModelAdmin):
     list_display = (
                     'activity',
@@ -46,6 +48,8 @@ class ParticipantAdmin(admin.ModelAdmin):
     search_fields = ('activity','participant_user','participant_role_class','participant_group',)
     ordering = ('-last_changed','activity',)
 
+    list_select_related = ('activity','user_role__user','user_role__role_class','user_role__group',)
+
     def participant_user(self, instance):
         return instance.user_role.user
 
@@ -67,6 +71,11 @@ class PecuniaryTransactionAdmin(admin.ModelAdmin):
     search_fields = ()
     ordering = ('-date',)
 
+    list_select_related = (
+                            'initiator_role__user','initiator_role__role_class','initiator_role__group',
+                            'participant__user_role__user','participant__user_role__role_class','participant__user_role__group',
+                          )
+
     def participant_role(self, instance):
         return instance.participant.user_role
 
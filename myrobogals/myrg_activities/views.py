@@ -12,6 +12,8 @@ from django.db.models import Q
 from django.db import transaction
 from django.utils import timezone
 
+from myrg_core.serializers import serializer_for
+
 from .models import Activity
 from .serializers import ActivitySerializer
 
@@ -54,11 +56,8 @@ class ListActivities(APIView):
         
         
         # Activity model
-        serializer = ActivitySerializer
         activity_model = Activity
         
-        serializer.Meta.model = activity_model
-        
         # Filter
         filter_dict = {}
         sort_fields = []
@@ -112,7 +111,7 @@ class ListActivities(APIView):
         
         
         # Serialize
-        serializer.Meta.fields = fields
+        serializer = serializer_for(ActivitySerializer, fields, activity_model)
         serialized_query = serializer(query, many=True)
         
         
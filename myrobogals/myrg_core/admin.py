@@ -28,6 +28,8 @@ class APILogAdmin(admin.ModelAdmin):
                     
     ordering = ('-date',)
 
+    list_select_related = ('user_role__user', 'user_role__group', 'user_role__role_class',)
+
     def get_user_from_role(self, obj):
         if obj.user_role is None:
             return None
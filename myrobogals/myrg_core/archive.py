@@ -0,0 +1,179 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import datetime
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import APILog
+
+# APILog retention.
+#
+# Rows older than `MAX_AGE_DAYS` are moved out of the APILog table into
+# gzip-compressed JSON lines files, one per UTC day:
+#
+#   <ARCHIVE_DIR>/<YYYY>/<MM>/apilog-<YYYY>-<MM>-<DD>.jsonl.gz
+#
+# Each run appends a new gzip member to the day's file, so an archive file
+# may consist of several members; `gzip` reads these transparently.
+#
+# Rows are only deleted from the hot table once the batch holding them has
+# been written to disk. If a run is interrupted between the two steps the
+# rows are archived again by the next run; `iter_archived_api_logs` skips
+# such duplicates.
+#
+# Refer to API_LOG_RETENTION in myrg_core/settings.py
+
+DEFAULTS = {
+    "MAX_AGE_DAYS": 90,
+    "ARCHIVE_DIR": None,
+    "BATCH_SIZE": 1000,
+}
+
+ARCHIVE_FIELDS = ("id", "user_role_id", "ip", "api_url", "api_body", "note", "date")
+
+
+def get_retention_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "API_LOG_RETENTION", {}))
+
+    if not options["ARCHIVE_DIR"]:
+        options["ARCHIVE_DIR"] = os.path.join(settings.BASE_DIR, "apilog_archive")
+
+    return options
+
+def get_archive_path(archive_dir, day):
+    return os.path.join(archive_dir,
+                        "{:04d}".format(day.year),
+                        "{:02d}".format(day.month),
+                        "apilog-{}.jsonl.gz".format(day.isoformat()))
+
+def _utc_day(value):
+    if timezone.is_aware(value):
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+
+################################################################################
+# Writer
+################################################################################
+def _write_day(archive_dir, day, rows):
+    path = get_archive_path(archive_dir, day)
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    archive_file = gzip.open(path, "ab")
+
+    try:
+        for row in rows:
+            row = dict(row)
+            row["date"] = row["date"].isoformat()
+            archive_file.write((json.dumps(row) + "\n").encode("utf-8"))
+    finally:
+        archive_file.close()
+
+    # Make sure the rows are on disk before they are deleted from the table
+    with open(path, "rb") as written_file:
+        os.fsync(written_file.fileno())
+
+def archive_api_logs(max_age_days=None, archive_dir=None, batch_size=None, max_batches=None):
+    """Moves APILog rows older than `max_age_days` into the archive.
+
+    Rows are archived and deleted in batches of `batch_size`, oldest first.
+    Returns the number of rows archived.
+    """
+    options = get_retention_settings()
+
+    if max_age_days is None:
+        max_age_days = options["MAX_AGE_DAYS"]
+    if archive_dir is None:
+        archive_dir = options["ARCHIVE_DIR"]
+    if batch_size is None:
+        batch_size = options["BATCH_SIZE"]
+
+    cutoff = timezone.now() - datetime.timedelta(days=max_age_days)
+
+    archived_count = 0
+    batch_count = 0
+
+    while max_batches is None or batch_count < max_batches:
+        rows = list(APILog.objects.filter(date__lt=cutoff)
+                                  .order_by("date", "id")
+                                  .values(*ARCHIVE_FIELDS)[:batch_size])
+
+        if not rows:
+            break
+
+        # Group by day, keeping date order
+        days = []
+        rows_by_day = {}
+
+        for row in rows:
+            day = _utc_day(row["date"])
+
+            if day not in rows_by_day:
+                days.append(day)
+                rows_by_day[day] = []
+
+            rows_by_day[day].append(row)
+
+        for day in days:
+            _write_day(archive_dir, day, rows_by_day[day])
+
+        with transaction.atomic():
+            APILog.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+
+        archived_count += len(rows)
+        batch_count += 1
+
+    return archived_count
+
+
+
+################################################################################
+# Reader
+################################################################################
+def iter_archived_api_logs(date_start, date_end, archive_dir=None):
+    """Yields archived APILog rows as dicts for date_start <= date < date_end,
+    in archive order.
+
+    `date` values are returned as datetimes.
+    """
+    if archive_dir is None:
+        archive_dir = get_retention_settings()["ARCHIVE_DIR"]
+
+    day = _utc_day(date_start)
+    last_day = _utc_day(date_end)
+
+    while day <= last_day:
+        path = get_archive_path(archive_dir, day)
+
+        if os.path.exists(path):
+            seen_ids = set()
+            archive_file = gzip.open(path, "rb")
+
+            try:
+                for line in archive_file:
+                    row = json.loads(line.decode("utf-8"))
+
+                    if row["id"] in seen_ids:
+                        continue
+                    seen_ids.add(row["id"])
+
+                    row["date"] = parse_datetime(row["date"])
+
+                    if date_start <= row["date"] < date_end:
+                        yield row
+            finally:
+                archive_file.close()
+
+        day += datetime.timedelta(days=1)
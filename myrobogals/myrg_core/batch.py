@@ -0,0 +1,322 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+import json
+import threading
+
+from django.conf import settings
+from django.core.urlresolvers import resolve
+from django.db import close_old_connections, connection, transaction
+from django.http import Http404, HttpRequest, QueryDict
+from django.utils.encoding import smart_text
+
+from rest_framework.response import Response
+
+# Batched API calls.
+#
+# `api/1.0/batch` runs several API calls in one HTTP request:
+#
+#   {
+#       "role_id": "...",
+#       "atomic": false,
+#       "concurrent": false,
+#       "requests": [
+#           {"url": "/api/1.0/self/whoami", "body": {}},
+#           {"url": "/api/1.0/self/roles", "method": "GET"},
+#           {"url": "/api/1.0/groups/list", "body": {...}, "if_none_match": "\"...\""}
+#       ]
+#   }
+#
+# and answers with one entry per sub-request, in order:
+#
+#   {"responses": [{"status": 200, "body": {...}, "etag": "\"...\""}, ...]}
+#
+# Sub-requests are dispatched in-process to the RobogalsAPIView behind their
+# URL. They act as the user and role resolved for the batch request, whose
+# API log entry covers them all; a "role_id" in a sub-request body is ignored.
+# Every sub-request is validated before any of them runs.
+#
+# With "atomic", all sub-requests run in one transaction, which is rolled back
+# if any of them fails: answers with status >= 400, or reports failed items
+# (a non-empty entry under "fail", as the edit, create and delete routes do
+# within a 200). The batch then answers 400 BATCH_ROLLED_BACK with the
+# responses up to the failed one.
+#
+# With "concurrent" (and without "atomic"), consecutive read-only
+# sub-requests (views with `read_only = True`) run in parallel on a thread
+# pool of `MAX_WORKERS` threads. Writes still run one at a time, in order, so
+# reads after a write see it.
+#
+# Refer to BATCH in myrg_core/settings.py
+
+DEFAULTS = {
+    "MAX_REQUESTS": 20,
+    "MAX_WORKERS": 4,
+}
+
+METHODS = ("GET", "POST")
+
+
+def get_batch_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "BATCH", {}))
+    return options
+
+
+class BatchError(Exception):
+    def __init__(self, detail):
+        super(BatchError, self).__init__(detail)
+        self.detail = detail
+
+class BatchRolledBack(Exception):
+    pass
+
+
+class BatchContext(object):
+    """What sub-requests take from the batch request, in place of resolving it
+    again. Read by RobogalsAPIView.initial.
+    """
+    def __init__(self, view):
+        self.user_obj = view.user_obj
+        self.user_id = view.user_id
+        self.role_obj = view.role_obj
+        self.role_id = view.role_id
+
+        # Replica the sub-requests read from (see myrg_core.replicas)
+        self.read_database = None
+
+class SubRequest(object):
+    def __init__(self, method, path, query_string, body, if_none_match, resolver_match):
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.body = body
+        self.if_none_match = if_none_match
+        self.resolver_match = resolver_match
+        self.read_only = resolver_match.func.cls.read_only
+
+
+
+################################################################################
+# Parsing
+################################################################################
+def parse_subrequest(data, batch_view_class):
+    from .classes import RobogalsAPIView
+
+    if not isinstance(data, dict) or not isinstance(data.get("url"), six.string_types):
+        raise BatchError("DATA_FORMAT_INVALID")
+
+    method = smart_text(data.get("method", "POST")).upper()
+
+    if method not in METHODS:
+        raise BatchError("BATCH_METHOD_INVALID")
+
+    body = data.get("body", {})
+
+    if not isinstance(body, dict):
+        raise BatchError("DATA_FORMAT_INVALID")
+
+    if_none_match = data.get("if_none_match")
+
+    if if_none_match is not None and not isinstance(if_none_match, six.string_types):
+        raise BatchError("DATA_FORMAT_INVALID")
+
+    path, separator, query_string = smart_text(data.get("url")).partition("?")
+
+    if not path.startswith("/"):
+        path = "/" + path
+
+    try:
+        resolver_match = resolve(path)
+    except Http404:
+        raise BatchError("BATCH_URL_INVALID")
+
+    # Only API views can be batched, and batches cannot be nested
+    view_class = getattr(resolver_match.func, "cls", None)
+
+    if view_class is None or not issubclass(view_class, RobogalsAPIView) or issubclass(view_class, batch_view_class):
+        raise BatchError("BATCH_URL_INVALID")
+
+    return SubRequest(method, path, query_string, body, if_none_match, resolver_match)
+
+def parse_subrequests(data, batch_view_class):
+    """Validates the "requests" of a batch request.
+
+    Raises BatchError if any of them is invalid.
+    """
+    requested_subrequests = data.get("requests")
+
+    if not isinstance(requested_subrequests, list):
+        raise BatchError("DATA_FORMAT_INVALID")
+
+    if not requested_subrequests:
+        raise BatchError("DATA_INSUFFICIENT")
+
+    if len(requested_subrequests) > get_batch_settings()["MAX_REQUESTS"]:
+        raise BatchError("BATCH_TOO_LARGE")
+
+    return [parse_subrequest(subrequest_data, batch_view_class) for subrequest_data in requested_subrequests]
+
+
+
+################################################################################
+# Execution
+################################################################################
+def build_request(parent_request, subrequest, context):
+    """Builds the HttpRequest for `subrequest` from the batch's HttpRequest."""
+    if subrequest.method == "POST":
+        body = json.dumps(subrequest.body).encode("utf-8")
+    else:
+        body = b""
+
+    http_request = HttpRequest()
+    http_request.method = subrequest.method
+    http_request.path = http_request.path_info = subrequest.path
+    http_request.resolver_match = subrequest.resolver_match
+
+    http_request.META = dict(parent_request.META)
+    http_request.META.pop("HTTP_IF_NONE_MATCH", None)
+    http_request.META.update({
+        "REQUEST_METHOD": subrequest.method,
+        "PATH_INFO": subrequest.path,
+        "QUERY_STRING": subrequest.query_string,
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+    })
+
+    if subrequest.if_none_match is not None:
+        http_request.META["HTTP_IF_NONE_MATCH"] = subrequest.if_none_match
+
+    http_request.GET = QueryDict(subrequest.query_string.encode("utf-8"))
+    http_request.COOKIES = parent_request.COOKIES
+
+    http_request._body = body
+    http_request._stream = BytesIO(body)
+    http_request._read_started = False
+
+    if hasattr(parent_request, "session"):
+        http_request.session = parent_request.session
+
+    if hasattr(parent_request, "user"):
+        http_request.user = parent_request.user
+
+    # Authenticate as the batch request's user without running the
+    # authentication classes again
+    if context.user_obj is not None:
+        http_request._force_auth_user = context.user_obj
+
+    http_request.myrg_batch = context
+
+    return http_request
+
+def get_response_body(response):
+    if isinstance(response, Response):
+        return response.data
+
+    if getattr(response, "streaming", False):
+        content = b"".join(response.streaming_content)
+    else:
+        content = response.content
+
+    if not content:
+        return None
+
+    try:
+        return json.loads(content.decode("utf-8"))
+    except ValueError:
+        return smart_text(content)
+
+def run_subrequest(parent_request, subrequest, context):
+    resolver_match = subrequest.resolver_match
+
+    response = resolver_match.func(build_request(parent_request, subrequest, context),
+                                   *resolver_match.args, **resolver_match.kwargs)
+
+    result = {
+        "status": response.status_code,
+        "body": get_response_body(response),
+    }
+
+    if response.has_header("ETag"):
+        result["etag"] = response["ETag"]
+
+    return result
+
+def run_subrequest_in_pool(args):
+    try:
+        return run_subrequest(*args)
+    finally:
+        # Pool threads each hold their own database connection
+        close_old_connections()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(get_batch_settings()["MAX_WORKERS"])
+
+    return _pool
+
+def run_subrequests(parent_request, subrequests, context, concurrent=False):
+    """Runs `subrequests` in order, except that runs of consecutive read-only
+    sub-requests may be run in parallel. Returns their results, in order.
+    """
+    # Other threads would not see changes made in the current transaction
+    concurrent = concurrent and get_batch_settings()["MAX_WORKERS"] > 1 and not connection.in_atomic_block
+
+    results = []
+    idx = 0
+
+    while idx < len(subrequests):
+        group_end = idx + 1
+
+        if concurrent and subrequests[idx].read_only:
+            while group_end < len(subrequests) and subrequests[group_end].read_only:
+                group_end += 1
+
+        if group_end - idx > 1:
+            results.extend(get_pool().map(run_subrequest_in_pool,
+                                          [(parent_request, subrequest, context) for subrequest in subrequests[idx:group_end]]))
+        else:
+            results.append(run_subrequest(parent_request, subrequests[idx], context))
+
+        idx = group_end
+
+    return results
+
+def has_failed(result):
+    """Whether a sub-request failed, as a whole or for some of its items."""
+    if result["status"] >= 400:
+        return True
+
+    body = result["body"]
+    failed = body.get("fail") if isinstance(body, dict) else None
+
+    return isinstance(failed, dict) and any(failed.values())
+
+def run_subrequests_atomically(parent_request, subrequests, context):
+    """Runs `subrequests` in order in one transaction.
+
+    Returns (results, rolled_back). The transaction is rolled back, and no
+    further sub-requests are run, once one of them fails.
+    """
+    results = []
+
+    try:
+        with transaction.atomic():
+            for subrequest in subrequests:
+                results.append(run_subrequest(parent_request, subrequest, context))
+
+                if has_failed(results[-1]):
+                    raise BatchRolledBack()
+    except BatchRolledBack:
+        return results, True
+
+    return results, False
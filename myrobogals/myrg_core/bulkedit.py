@@ -0,0 +1,247 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import copy
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections, router, transaction
+from django.utils.encoding import smart_text
+
+from .signals import send_queryset_updated
+
+# Bulk editing for the Edit* views.
+#
+# Editing objects one at a time cost a fetch, a uniqueness check per unique
+# field, an UPDATE and a transaction per object. `edit_objects` instead:
+#
+#   * fetches every object with in_bulk;
+#   * validates each edit with one serializer (see
+#     myrg_core.serializers.BulkSerializerMixin), and the changed unique fields
+#     of all objects with a query per field;
+#   * in one transaction, writes the objects changing the same columns with
+#     one UPDATE per `UPDATE_BATCH_SIZE` objects, each column set through a
+#     CASE on the primary key, and once committed announces them with
+#     queryset_updated (see myrg_core.signals). Objects also changing
+#     many-to-many or reverse relations, or fields of parent models, are
+#     saved individually.
+#
+# Should the transaction fail, e.g. on a row changed meanwhile, objects are
+# saved one at a time instead to find the ones which fail.
+
+UPDATE_BATCH_SIZE = 500
+
+
+def fetch_in_bulk(queryset, object_ids):
+    """Returns {smart_text(pk): object} of the objects of `queryset` among
+    `object_ids`.
+    """
+    connection = connections[queryset.db]
+    object_ids = list(set(object_ids))
+    objects = {}
+
+    # In as few queries as the database's limit on query parameters allows
+    batch_size = max(connection.ops.bulk_batch_size(["pk"], object_ids), 1)
+
+    for idx in range(0, len(object_ids), batch_size):
+        for pk, obj in six.iteritems(queryset.in_bulk(object_ids[idx:idx + batch_size])):
+            objects[smart_text(pk)] = obj
+
+    return objects
+
+def get_changed_fields(original, instance):
+    """Returns the concrete fields whose value differs between `original` and
+    `instance`, with auto_now fields updated if any has changed.
+    """
+    fields = [field for field in instance._meta.fields
+              if getattr(original, field.attname) != getattr(instance, field.attname)]
+
+    if fields:
+        for field in instance._meta.fields:
+            if getattr(field, "auto_now", False) and field not in fields:
+                field.pre_save(instance, False)
+                fields.append(field)
+
+    return fields
+
+def get_unique_conflicts(model, changes):
+    """Returns the keys of `changes`, {key: (instance, changed fields)}, whose
+    instance would duplicate the unique fields of another row or another
+    instance.
+    """
+    conflicts = set()
+
+    for field in model._meta.fields:
+        if not field.unique or field.primary_key:
+            continue
+
+        # {value: key of the first instance claiming it}
+        claims = {}
+
+        for key, (instance, fields) in sorted(six.iteritems(changes)):
+            if field not in fields:
+                continue
+
+            value = getattr(instance, field.attname)
+
+            if value is None:
+                continue
+
+            if value in claims:
+                conflicts.add(key)
+            else:
+                claims[value] = key
+
+        if not claims:
+            continue
+
+        values = list(claims)
+        connection = connections[router.db_for_write(model)]
+        batch_size = max(connection.ops.bulk_batch_size([field.attname], values), 1)
+
+        for idx in range(0, len(values), batch_size):
+            existing = model._default_manager.filter(**{field.attname + "__in": values[idx:idx + batch_size]})
+
+            for pk, value in existing.values_list("pk", field.attname):
+                # Values matched only by the column's collation are left to
+                # the database to refuse
+                if value in claims and smart_text(pk) != claims[value]:
+                    conflicts.add(claims[value])
+
+    if model._meta.unique_together:
+        for key, (instance, fields) in six.iteritems(changes):
+            try:
+                instance.validate_unique()
+            except ValidationError:
+                conflicts.add(key)
+
+    return conflicts
+
+def saves_individually(instance, fields):
+    return (bool(getattr(instance, "_m2m_data", None)) or
+            bool(getattr(instance, "_related_data", None)) or
+            any(field not in instance._meta.local_fields for field in fields))
+
+def update_objects(model, instances_fields):
+    """Writes the changed `fields` of each (instance, fields) of
+    `instances_fields`, which all change the same fields.
+    """
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    pk_field = model._meta.pk
+    fields = instances_fields[0][1]
+
+    # Each row takes a key and a value per column, and a key in the WHERE
+    batch_size = max(min(connection.ops.bulk_batch_size([pk_field] * (2 * len(fields) + 1), instances_fields), UPDATE_BATCH_SIZE), 1)
+
+    cursor = connection.cursor()
+
+    for idx in range(0, len(instances_fields), batch_size):
+        batch = [instance for instance, instance_fields in instances_fields[idx:idx + batch_size]]
+        pks = [pk_field.get_db_prep_value(instance.pk, connection) for instance in batch]
+
+        assignments = []
+        params = []
+
+        # ELSE keeps the column's own type for the CASE, e.g. for NULLs
+        for field in fields:
+            assignments.append("{column} = CASE {pk} {whens} ELSE {column} END".format(
+                                   column=qn(field.column),
+                                   pk=qn(pk_field.column),
+                                   whens=" ".join(["WHEN %s THEN %s"] * len(batch))))
+
+            for pk, instance in zip(pks, batch):
+                params.extend([pk, field.get_db_prep_save(getattr(instance, field.attname), connection)])
+
+        params.extend(pks)
+
+        cursor.execute("UPDATE {table} SET {assignments} WHERE {pk} IN ({pks})".format(
+                           table=qn(model._meta.db_table),
+                           assignments=", ".join(assignments),
+                           pk=qn(pk_field.column),
+                           pks=", ".join(["%s"] * len(batch))),
+                       params)
+
+def save_objects(model, serializer, changes):
+    """Saves the instances of `changes`, {key: (instance, changed fields)}, in
+    the current transaction. Returns the primary keys of those written with
+    UPDATEs, which send no post_save.
+    """
+    # {tuple of changed fields: [(instance, fields)]}
+    groups = {}
+
+    for key, (instance, fields) in sorted(six.iteritems(changes)):
+        if saves_individually(instance, fields):
+            serializer.save_object(instance)
+        else:
+            groups.setdefault(tuple(fields), []).append((instance, fields))
+
+    for instances_fields in groups.values():
+        update_objects(model, instances_fields)
+
+    return [instance.pk for instances_fields in groups.values() for instance, fields in instances_fields]
+
+def edit_objects(queryset, serializer, updates, failed, completed):
+    """Applies `updates`, [(id, update dict)], to the objects of `queryset`.
+
+    `serializer` is a BulkSerializerMixin serializer created with
+    `partial=True`. Reports the outcome of each update in `failed`, {id:
+    reason}, and `completed`, [id], as the Edit* views do.
+    """
+    model = queryset.model
+    originals = fetch_in_bulk(queryset, [object_id for object_id, update_dict in updates])
+
+    # {key: instance as edited}, the ids of the updates applied to each, and
+    # [(key, id)] of the updates applied in order
+    edited = {}
+    edited_ids = {}
+    applied = []
+
+    for object_id, update_dict in updates:
+        key = smart_text(object_id)
+
+        if key not in originals:
+            failed.update({object_id: "OBJECT_NOT_FOUND"})
+            continue
+
+        # Later updates of the same object apply on top of earlier ones
+        [(instance, errors)] = serializer.restore_objects([update_dict], [copy.copy(edited.get(key, originals[key]))])
+
+        if instance is None:
+            failed.update({object_id: "DATA_VALIDATION_FAILED"})
+            continue
+
+        edited[key] = instance
+        edited_ids.setdefault(key, []).append(object_id)
+        applied.append((key, object_id))
+
+    serializer.prepare_objects(list(edited.values()))
+
+    changes = dict((key, (instance, get_changed_fields(originals[key], instance)))
+                   for key, instance in six.iteritems(edited))
+
+    for key in get_unique_conflicts(model, changes):
+        for object_id in edited_ids.pop(key):
+            failed.update({object_id: "DATA_VALIDATION_FAILED"})
+
+        del changes[key]
+
+    # Unchanged objects need no writing
+    changes = dict((key, change) for key, change in six.iteritems(changes) if change[1])
+
+    try:
+        with transaction.atomic():
+            updated_pks = save_objects(model, serializer, changes)
+    except DatabaseError:
+        for key, (instance, fields) in sorted(six.iteritems(changes)):
+            try:
+                with transaction.atomic():
+                    serializer.save_object(instance)
+            except:
+                for object_id in edited_ids.pop(key):
+                    failed.update({object_id: "OBJECT_NOT_MODIFIED"})
+    else:
+        if updated_pks:
+            send_queryset_updated(model, updated_pks)
+
+    completed.extend(object_id for key, object_id in applied if key in edited_ids)
@@ -6,13 +6,24 @@ from rest_framework import status, exceptions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.utils.datastructures import SortedDict
+from django.utils.encoding import smart_text
 
 from .functions import log_api_call
+from .versions import get_model_version, track_model_versions, versions_are_shared
+from . import metrics
+from . import replicas
 
 from django.db.models import Q
 from django.db import transaction
 from django.utils import timezone
 
+from myrg_groups.rolecache import get_active_role
+
+import hashlib
+import json
+import math
+import time
+
 class RoleInvalidException(exceptions.APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = "ROLE_INVALID"
@@ -21,19 +32,144 @@ class CallNotProcessedException(exceptions.APIException):
     status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
     default_detail = "CALL_NOT_PROCESSED"
 
+class NotModifiedException(exceptions.APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = ""
+
+class ThrottledException(exceptions.Throttled):
+    default_detail = "THROTTLED"
+    
+    def __init__(self, wait):
+        self.detail = self.default_detail
+        self.wait = math.ceil(wait)
+
 class RobogalsAPIView(APIView):
     role_obj = None
     role_id = None
     user_obj = None
     user_id = None
     
+    # Conditional requests
+    #
+    # Views whose response depends only on the rows of `etag_models`, the
+    # requesting user and role and the request itself set `etag_models`. Their
+    # responses then carry a strong ETag built from the models' versions (see
+    # myrg_core.versions) and a hash of the normalized request, and requests
+    # whose `If-None-Match` header holds the current ETag are answered with
+    # 304 Not Modified before the handler runs.
+    #
+    # This applies to POST as well as GET, as the list calls are read-only
+    # POSTs: clients resend the ETag of the previous response to the same call
+    # in `If-None-Match`.
+    #
+    # Views whose output also changes with time (e.g. role validity windows)
+    # set `etag_period` to the number of seconds an ETag may stay valid.
+    etag_models = ()
+    etag_period = None
+    etag = None
+    
+    # Views which never write set `read_only`, which lets api/1.0/batch run
+    # them concurrently (see myrg_core.batch) and their reads go to a replica
+    # (see myrg_core.replicas)
+    read_only = False
+    
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Measures the request for myrg_core.metrics, with its reads sent to
+        the database chosen by get_read_database.
+        """
+        with replicas.read_from(self.get_read_database(request)):
+            if not metrics.get_metrics_settings()["ENABLED"]:
+                response = super(RobogalsAPIView, self).dispatch(request, *args, **kwargs)
+            else:
+                started = time.time()
+                
+                with metrics.QueryCounter() as query_counter:
+                    response = super(RobogalsAPIView, self).dispatch(request, *args, **kwargs)
+                    
+                    # Render now so that the response size is known
+                    if hasattr(response, "render") and callable(response.render):
+                        response.render()
+                
+                metrics.record_request(request, response, time.time() - started, query_counter)
+        
+        if self.writes(request):
+            replicas.pin(response)
+        
+        return response
+    
+    def get_read_database(self, request):
+        """
+        Returns the replica the request reads from, or None for the default
+        database.
+        """
+        batch_context = getattr(request, "myrg_batch", None)
+        
+        if batch_context is not None:
+            return batch_context.read_database
+        
+        if self.read_only and not replicas.is_pinned(request):
+            return replicas.choose_replica()
+        
+        return None
+    
+    def writes(self, request):
+        """
+        Whether the request may have written, so that the client's next reads
+        should see it.
+        """
+        return not self.read_only and request.method == "POST"
+    
     def initial(self, request, *args, **kwargs):
         """
         Runs anything that needs to occur prior to calling the method handler.
         """
         self.format_kwarg = self.get_format_suffix(**kwargs)
         
-        request_body = request.body
+        batch_context = getattr(request._request, "myrg_batch", None)
+        
+        if batch_context is not None:
+            # Sub-request of api/1.0/batch: the user and role were resolved,
+            # and the call logged, for the batch request
+            self.user_obj = batch_context.user_obj
+            self.user_id = batch_context.user_id
+            self.role_obj = batch_context.role_obj
+            self.role_id = batch_context.role_id
+        else:
+            self.resolve(request)
+            
+            
+        # Throttled calls are refused before they are logged (see
+        # myrg_core.throttling); calls refused below are still logged
+        self.check_throttles(request)
+        
+        if batch_context is None:
+            self.log(request)
+        
+        # Ensure that the incoming request is permitted
+        self.perform_authentication(request)
+        self.check_permissions(request)
+
+        # Perform content negotiation and store the accepted info on the request
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        
+        # Conditional request. ETags come from the versions of the default
+        # database's rows, so they are not given to responses a replica may
+        # not have caught up for, nor when other processes' writes do not
+        # change the versions seen here
+        if self.etag_models and replicas.get_read_database() is None and versions_are_shared():
+            self.etag = self.get_etag(request)
+            
+            if self.etag in [tag.strip() for tag in request.META.get("HTTP_IF_NONE_MATCH", "").split(",")]:
+                raise NotModifiedException()
+    
+    def resolve(self, request):
+        """
+        Sets the user and role the request acts as.
+        """
+        # Read before request.DATA consumes the stream
+        self.request_body = request.body
         
         # Set user/role information
         user_obj = request.user
@@ -50,25 +186,63 @@ class RobogalsAPIView(APIView):
         
         try:
             if not (role_id is None):
-                role_query = user_obj.role_set.filter(Q(date_start__lte=timezone.now()) & (Q(date_end__isnull=True) | Q(date_end__gte=timezone.now()))).get(pk = str(role_id))
+                role_query = get_active_role(user_obj, role_id)
                 self.role_id = role_id
                 self.role_obj = role_query
         except:
             raise RoleInvalidException()
-            
-        # Log the call
-        if not log_api_call(request, request_body, role_query):
+    
+    def log(self, request):
+        """
+        Logs the call.
+        """
+        if not log_api_call(request, self.request_body, self.role_obj):
             raise CallNotProcessedException()
-            
-            
-        # Ensure that the incoming request is permitted
-        self.perform_authentication(request)
-        self.check_permissions(request)
-        self.check_throttles(request)
-
-        # Perform content negotiation and store the accepted info on the request
-        neg = self.perform_content_negotiation(request)
-        request.accepted_renderer, request.accepted_media_type = neg
+    
+    def throttled(self, request, wait):
+        raise ThrottledException(wait)
+    
+    def get_etag(self, request):
+        """
+        Returns the ETag for the response to `request`.
+        """
+        versions = []
+        
+        for model in self.etag_models:
+            track_model_versions(model)
+            versions.append(get_model_version(model))
+        
+        request_digest = hashlib.sha1(json.dumps([
+            request.method,
+            request.get_full_path(),
+            request.DATA,
+            request.accepted_media_type,
+        ], sort_keys=True, separators=(",", ":"), default=smart_text).encode("utf-8"))
+        
+        etag_digest = hashlib.sha1(json.dumps([
+            type(self).__module__ + "." + type(self).__name__,
+            versions,
+            self.user_id,
+            self.role_id,
+            int(time.time() // self.etag_period) if self.etag_period else None,
+            request_digest.hexdigest(),
+        ], default=smart_text).encode("utf-8"))
+        
+        return "\"{}\"".format(etag_digest.hexdigest())
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModifiedException):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        
+        return super(RobogalsAPIView, self).handle_exception(exc)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(RobogalsAPIView, self).finalize_response(request, response, *args, **kwargs)
+        
+        if self.etag is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = self.etag
+        
+        return response
         
         
          
@@ -3,7 +3,10 @@ from future.builtins import *
 import six
 
 
+from django.conf import settings
+
 from .models import APILog
+from .logbuffer import get_log_buffer
 
 def log_api_call(request, request_body, role = None, note = None):    
     log_dict = {
@@ -16,6 +19,13 @@ def log_api_call(request, request_body, role = None, note = None):
     
     new_log = APILog(**log_dict)
     
+    # Buffered logs are written in the background; see myrg_core.logbuffer
+    log_buffer = get_log_buffer()
+    
+    if log_buffer is not None:
+        # Not saved yet, so there is no instance to return
+        return log_buffer.put(new_log)
+    
     try:
         new_log.save()
     except:
@@ -23,6 +33,33 @@ def log_api_call(request, request_body, role = None, note = None):
         
     return new_log
 
+def get_remote_ip(request):
+    """
+    Returns the address of the client of `request` as seen by the server,
+    trusting X-Forwarded-For only as far as it was added by TRUSTED_PROXIES.
+    Use this rather than get_client_ip wherever the address grants or limits
+    access.
+    """
+    trusted_proxies = getattr(settings, "TRUSTED_PROXIES", ())
+    ip = request.META.get("REMOTE_ADDR")
+    
+    if ip not in trusted_proxies:
+        return ip
+    
+    # Each proxy appends the address it received the request from
+    for forwarded_ip in reversed(request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")):
+        forwarded_ip = forwarded_ip.strip()
+        
+        if not forwarded_ip:
+            break
+        
+        ip = forwarded_ip
+        
+        if ip not in trusted_proxies:
+            break
+    
+    return ip
+
 # http://stackoverflow.com/a/4581997
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -0,0 +1,889 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from collections import OrderedDict
+from functools import reduce
+import datetime
+import decimal
+import hashlib
+import json
+import operator
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.db.models import FileField, Q, SubfieldBase
+from django.http import StreamingHttpResponse
+from django.utils.datastructures import SortedDict
+from django.utils.encoding import smart_text
+
+from rest_framework import status
+from rest_framework.fields import Field, WritableField
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .search import search_indexes
+from .serializers import serializer_for
+from .versions import get_model_version, track_model_versions, versions_are_shared
+
+# List query engine.
+#
+# All List* API views accept the same request body:
+#
+#   {
+#       "query": [{"field": ..., "search": ..., "order": "a"|"d", "visibility": ...}, ...],
+#       "pagination": {"page": ..., "length": ...}
+#   }
+#
+# Instead of "page", "pagination" may carry a "cursor": null for the first
+# page, then the "next_cursor" returned in the previous response's "meta".
+# Cursors hold the sort key values of the last row returned, with the primary
+# key as tiebreaker, and the next page is selected by comparing against these
+# (keyset pagination) instead of by OFFSET, so deep pages cost the same as the
+# first one.
+#
+# "pagination" may also name the "count" strategy used for "meta.size":
+#   "exact"         COUNT(*) on every request.
+#   "cached"        Exact counts memoized per list and search values for
+#                   `CACHE_TIMEOUT` seconds. Entries are keyed on the model's
+#                   version (see myrg_core.versions), so writes invalidate them;
+#                   an exact count while versions are not shared.
+#   "estimated"     The query planner's row estimate, on backends which provide
+#                   one (PostgreSQL, MySQL); an exact count elsewhere.
+# "meta.size_type" tells which kind of count was returned: "exact", "cached"
+# or "estimated".
+#
+# With "stream": true in the request body, the response is written as it is
+# serialized instead of being built in memory first. Rows are read
+# `STREAM_CHUNK_SIZE` at a time, each chunk continuing from the last row of
+# the previous one in keyset order, so memory use does not depend on the page
+# length even where the database driver cannot read results incrementally
+# (e.g. SQLite). Ties in the requested order are therefore always broken by
+# primary key. The envelope is the same, except that "meta" comes after the
+# rows, so that "next_cursor" can be taken from the last row written.
+#
+# A "search" string in the request body runs a full-text search over the
+# fields indexed for the model (see myrg_core.search), on lists of models which
+# have an index. Matching rows are ordered by the requested sort fields, then
+# by relevance. Cursor and streamed requests keep their key order, so only
+# page-numbered requests are ranked.
+#
+# Refer to LIST_COUNT in myrg_core/settings.py
+#
+# Each listable model is registered once (at import time of its views module)
+# with `list_engine.register`, which precomputes the valid, protected,
+# searchable, sortable and listable fields of the model. A request is reduced
+# to its shape - which fields are named, searched, ordered and shown - and
+# compiled into a ListPlan, which is cached per shape. Only the search values
+# and pagination are taken from the request itself when the plan is executed.
+#
+# Plans only select the columns they serialize or sort on. When every
+# serialized field is a plain column (or a foreign key's id) rendered by the
+# stock DRF field classes, rows are fetched with values_list() and passed
+# straight to the serializer fields' to_native, without creating model
+# instances; otherwise the model instances are loaded with only().
+
+PAGINATION_MAX_LENGTH = 1000
+PLAN_CACHE_SIZE = 512
+
+CURSOR_SALT = "myrg_core.listing.cursor"
+
+COUNT_DEFAULTS = {
+    "DEFAULT_STRATEGY": "exact",
+    "CACHE_ALIAS": "default",
+    "CACHE_TIMEOUT": 60,
+}
+
+STREAM_CHUNK_SIZE = 100
+
+COUNT_STRATEGIES = ("exact", "cached", "estimated")
+COUNT_KEY_PREFIX = "myrg_count:"
+
+# Backends which sort NULL after every other value in ascending order
+NULLS_LARGEST_VENDORS = ("postgresql", "oracle")
+
+
+class ListQueryError(Exception):
+    def __init__(self, detail):
+        super(ListQueryError, self).__init__(detail)
+        self.detail = detail
+
+
+class ListPlan(object):
+    """A compiled list request.
+
+    `search_lookups` and `or_search_lookups` are (position, lookup) pairs,
+    where `position` is the index of the field in the request's "query" list.
+    `base_query` is the ordered base queryset, if the spec's is static.
+    `keyset_keys` are (lookup path, descending, attname, field) tuples
+    describing the sort order used with cursors, ending in the primary key.
+    `columns` are the model fields selected, with `keyset_columns` the indices
+    of the keyset keys among them. `row_fields` are (key, serializer field,
+    column index) tuples if rows are fetched as values_list() tuples, or None
+    if they are model instances.
+    """
+    def __init__(self, search_lookups, or_search_lookups, sort_fields, fields, serializer_class, keyset_keys, columns, keyset_columns, row_fields=None, base_query=None):
+        self.search_lookups = search_lookups
+        self.or_search_lookups = or_search_lookups
+        self.sort_fields = sort_fields
+        self.fields = fields
+        self.serializer_class = serializer_class
+        self.keyset_keys = keyset_keys
+        self.keyset_order = tuple(("-" if descending else "") + path for path, descending, attname, field in keyset_keys)
+        self.columns = columns
+        self.keyset_columns = keyset_columns
+        self.row_fields = row_fields
+        self.base_query = base_query
+
+    def project(self, query):
+        """Restricts `query` to the plan's columns."""
+        if self.row_fields is not None:
+            return query.values_list(*self.columns)
+        return query.only(*self.columns)
+
+    def get_key_values(self, row):
+        """Returns the keyset key values of `row`."""
+        if self.row_fields is not None:
+            return [row[idx] for idx in self.keyset_columns]
+        return [getattr(row, attname) for path, descending, attname, field in self.keyset_keys]
+
+    def serialize_row(self, row):
+        """Serializes a values_list() row like the serializer would serialize
+        the model instance.
+        """
+        data = SortedDict()
+
+        for key, field, idx in self.row_fields:
+            data[key] = field.to_native(row[idx])
+
+        return {"id": data.pop("id"), "data": data}
+
+
+class ListPagination(object):
+    """Requested page: either `start`/`end` indices, or a page of `length`
+    rows after `cursor` (None for the first page) if `keyset` is set.
+    `count` is the count strategy and `search` the full-text search, if any.
+    """
+    def __init__(self, start=None, end=None, keyset=False, cursor=None, length=None, count="exact", search=None):
+        self.start = start
+        self.end = end
+        self.keyset = keyset
+        self.cursor = cursor
+        self.length = length
+        self.count = count
+        self.search = search
+
+
+
+################################################################################
+# Counts
+################################################################################
+def get_count_settings():
+    options = dict(COUNT_DEFAULTS)
+    options.update(getattr(settings, "LIST_COUNT", {}))
+    return options
+
+def get_count_cache_key(spec, plan, requested_fields, search=None):
+    """Cache key for the count of a request, which depends only on the list,
+    its search values and the model version.
+    """
+    searches = sorted([lookup, smart_text(requested_fields[position]["search"])]
+                      for position, lookup in plan.search_lookups + plan.or_search_lookups)
+
+    digest = hashlib.md5(json.dumps([spec.name, searches, search]).encode("utf-8")).hexdigest()
+
+    return "{}{}:{}:{}".format(COUNT_KEY_PREFIX, spec.name, get_model_version(spec.model), digest)
+
+def get_cached_count(spec, plan, query, requested_fields, search=None):
+    """Returns (count, size_type)."""
+    from django.core.cache import get_cache
+
+    options = get_count_settings()
+    cache = get_cache(options["CACHE_ALIAS"])
+    key = get_count_cache_key(spec, plan, requested_fields, search)
+
+    count = cache.get(key)
+
+    if count is not None:
+        return count, "cached"
+
+    count = query.count()
+    cache.set(key, count, options["CACHE_TIMEOUT"])
+
+    return count, "exact"
+
+def _explain_postgresql(cursor, sql, params):
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    explain = cursor.fetchone()[0]
+
+    if isinstance(explain, six.string_types):
+        explain = json.loads(explain)
+
+    return int(explain[0]["Plan"]["Plan Rows"])
+
+def _explain_mysql(cursor, sql, params):
+    cursor.execute("EXPLAIN " + sql, params)
+    columns = [column[0].lower() for column in cursor.description]
+    row = dict(zip(columns, cursor.fetchone()))
+
+    rows = float(row.get("rows") or 0)
+
+    if row.get("filtered") is not None:
+        rows = rows * float(row["filtered"]) / 100
+
+    return int(rows)
+
+ESTIMATORS = {
+    "postgresql": _explain_postgresql,
+    "mysql": _explain_mysql,
+}
+
+def get_estimated_count(query):
+    """Returns (count, size_type), falling back to an exact count where the
+    backend has no estimate.
+    """
+    connection = connections[query.db]
+    estimator = ESTIMATORS.get(connection.vendor)
+
+    if estimator is not None:
+        sql, params = query.order_by().query.sql_with_params()
+
+        try:
+            cursor = connection.cursor()
+
+            try:
+                return estimator(cursor, sql, params), "estimated"
+            finally:
+                cursor.close()
+        except Exception:
+            pass
+
+    return query.count(), "exact"
+
+
+
+################################################################################
+# Cursors
+################################################################################
+def _dump_key_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return smart_text(value)
+    return value
+
+def encode_cursor(plan, spec, row):
+    return signing.dumps({
+        "list": spec.name,
+        "order": plan.keyset_order,
+        "values": [_dump_key_value(value) for value in plan.get_key_values(row)],
+    }, salt=CURSOR_SALT, compress=True)
+
+def decode_cursor(plan, spec, cursor):
+    """Returns the key values held by `cursor`.
+
+    Raises ListQueryError unless the cursor was issued for the same list
+    and sort order.
+    """
+    try:
+        payload = signing.loads(smart_text(cursor), salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise ListQueryError("PAGINATION_CURSOR_INVALID")
+
+    if (payload.get("list") != spec.name) or (tuple(payload.get("order") or ()) != plan.keyset_order):
+        raise ListQueryError("PAGINATION_CURSOR_INVALID")
+
+    values = payload.get("values") or ()
+
+    if len(values) != len(plan.keyset_keys):
+        raise ListQueryError("PAGINATION_CURSOR_INVALID")
+
+    try:
+        return [None if value is None else field.to_python(value) for (path, descending, attname, field), value in zip(plan.keyset_keys, values)]
+    except Exception:
+        raise ListQueryError("PAGINATION_CURSOR_INVALID")
+
+def keyset_filter(keyset_keys, values, nulls_largest):
+    """Q object selecting rows after `values` in the keyset order, or None if
+    no row can follow.
+
+    (a, b, pk) > (x, y, z) expands to
+    a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z),
+    with comparisons flipped for descending keys and NULLs placed where the
+    database sorts them.
+    """
+    alternatives = []
+    equalities = []
+
+    for (path, descending, attname, field), value in zip(keyset_keys, values):
+        nulls_last = (nulls_largest != descending)
+
+        if value is None:
+            after = None if nulls_last else Q(**{path + "__isnull": False})
+            equal = Q(**{path + "__isnull": True})
+        else:
+            after = Q(**{path + ("__lt" if descending else "__gt"): value})
+            equal = Q(**{path: value})
+
+            if nulls_last:
+                after |= Q(**{path + "__isnull": True})
+
+        if after is not None:
+            alternatives.append(reduce(operator.and_, equalities + [after]))
+
+        equalities.append(equal)
+
+    if not alternatives:
+        return None
+
+    return reduce(operator.or_, alternatives)
+
+
+
+################################################################################
+# Model registration
+################################################################################
+class ListSpec(object):
+    """Describes how a model is listed.
+
+    `queryset`              Base queryset, or a callable returning it for
+                            querysets which depend on the time of the request;
+                            defaults to all objects.
+    `default_fields`        Fields always serialized.
+    `or_search_fields`      Fields whose non-empty searches are combined with
+                            OR rather than AND.
+    `post_process`          Callable receiving the output list before it is
+                            returned.
+    """
+    def __init__(self, engine, name, model, serializer_class, output_key, queryset=None, default_fields=("id",), or_search_fields=(), post_process=None):
+        self.engine = engine
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.output_key = output_key
+        self.queryset = queryset if queryset is not None else model._default_manager.all()
+        self.default_fields = tuple(default_fields)
+        self.or_search_fields = frozenset(or_search_fields)
+        self.post_process = post_process
+        self.search_index = search_indexes.get_index(model)
+
+        # The model is always given explicitly, so that subclasses of the
+        # serializer's model (e.g. Chapter for Group) get their own fields
+        self.serializer_model = model
+
+        self.valid_fields = frozenset(model._meta.get_all_field_names())
+        self.column_fields = dict((field.name, field) for field in model._meta.fields)
+        self.protected_fields = frozenset(getattr(model, "PROTECTED_FIELDS", ()))
+
+        self.search_lookups = {}
+        self.sortable_fields = set()
+
+        # {name: (lookup path, attname, field)}; foreign keys are compared
+        # on their own column, rather than the related model's ordering
+        self.keyset_keys = {}
+
+        for field in model._meta.fields:
+            if field.rel is None:
+                self.search_lookups[field.name] = field.name + "__icontains"
+                self.keyset_keys[field.name] = (field.name, field.attname, field)
+            else:
+                related_field = field.rel.get_related_field()
+
+                self.search_lookups[field.name] = "{}__{}__icontains".format(field.name, related_field.name)
+                self.keyset_keys[field.name] = ("{}__{}".format(field.name, related_field.name), field.attname, related_field)
+
+            self.sortable_fields.add(field.name)
+
+        self.keyset_keys["pk"] = ("pk", model._meta.pk.attname, model._meta.pk)
+
+        serializer_fields = serializer_for(serializer_class, (), model=self.serializer_model)().fields
+        self.listable_fields = frozenset(name for name in serializer_fields if name in self.valid_fields)
+
+    def get_serializer_class(self, fields):
+        return serializer_for(self.serializer_class, fields, model=self.serializer_model)
+
+    def get_row_fields(self, serializer_class, columns):
+        """Returns the `row_fields` of a plan serializing with
+        `serializer_class`, or None unless all of its fields can be rendered
+        from column values alone.
+        """
+        if six.get_unbound_function(serializer_class.to_native) is not six.get_unbound_function(BaseSerializer.to_native):
+            return None
+
+        plain_field_to_native = (six.get_unbound_function(Field.field_to_native),
+                                 six.get_unbound_function(WritableField.field_to_native))
+
+        row_fields = []
+
+        for key, field in six.iteritems(serializer_class().fields):
+            # BaseSerializer.to_native leaves these out
+            if getattr(field, "write_only", False):
+                continue
+
+            model_field = self.column_fields.get(key)
+
+            if (model_field is None) or (field.source not in (None, key)) or hasattr(serializer_class, "transform_" + key):
+                return None
+
+            # The model attribute is not the column value for these
+            if isinstance(model_field, FileField) or isinstance(type(model_field), SubfieldBase):
+                return None
+
+            if isinstance(field, PrimaryKeyRelatedField):
+                if field.many or model_field.rel is None:
+                    return None
+            elif (six.get_unbound_function(type(field).field_to_native) not in plain_field_to_native) or (model_field.rel is not None):
+                return None
+
+            row_fields.append((key, field, columns.index(key)))
+
+        return tuple(row_fields)
+
+    def compile(self, shape):
+        """Compiles a request shape into a ListPlan.
+
+        Raises ListQueryError if the shape names unusable fields.
+        """
+        search_lookups = []
+        or_search_lookups = []
+        sort_fields = []
+        keyset_keys = []
+        keyset_names = []
+        fields = list(self.default_fields)
+
+        for position, (field_name, searched, order, visible) in enumerate(shape):
+            # Block protected fields like passwords
+            if field_name in self.protected_fields:
+                raise ListQueryError("`{}` is a protected field.".format(field_name))
+
+            if field_name not in self.valid_fields:
+                raise ListQueryError("`{}` is not a valid field name.".format(field_name))
+
+            if searched:
+                if field_name not in self.search_lookups:
+                    raise ListQueryError("`{}` is not a searchable field.".format(field_name))
+
+                if field_name in self.or_search_fields:
+                    or_search_lookups.append((position, self.search_lookups[field_name]))
+                else:
+                    search_lookups.append((position, self.search_lookups[field_name]))
+
+            if order in ("a", "d"):
+                if field_name not in self.sortable_fields:
+                    raise ListQueryError("`{}` is not a sortable field.".format(field_name))
+
+                sort_fields.append(field_name if order == "a" else "-" + field_name)
+                keyset_keys.append(self.keyset_keys[field_name][:1] + (order == "d",) + self.keyset_keys[field_name][1:])
+                keyset_names.append(field_name)
+
+            if visible:
+                if field_name not in self.listable_fields:
+                    raise ListQueryError("`{}` is not a listable field.".format(field_name))
+
+                fields.append(field_name)
+
+        # The primary key makes the cursor order total
+        pk_path, pk_attname, pk_field = self.keyset_keys["pk"]
+        keyset_keys.append((pk_path, False, pk_attname, pk_field))
+        keyset_names.append("pk")
+
+        # Only the columns which are serialized or sorted on are selected
+        columns = []
+
+        for name in [name for name in fields if name in self.column_fields] + keyset_names:
+            if name not in columns:
+                columns.append(name)
+
+        serializer_class = self.get_serializer_class(fields)
+
+        plan = ListPlan(tuple(search_lookups),
+                        tuple(or_search_lookups),
+                        tuple(sort_fields),
+                        tuple(fields),
+                        serializer_class,
+                        tuple(keyset_keys),
+                        tuple(columns),
+                        tuple(columns.index(name) for name in keyset_names),
+                        row_fields=self.get_row_fields(serializer_class, columns))
+
+        if not callable(self.queryset):
+            plan.base_query = plan.project(self.queryset.order_by(*sort_fields))
+
+        return plan
+
+
+
+    ############################################################################
+    # Request handling
+    ############################################################################
+    def parse(self, data):
+        """Returns (requested_fields, shape, pagination) for a request body.
+
+        Raises ListQueryError on malformed requests.
+        """
+        try:
+            requested_fields = list(data.get("query"))
+            requested_pagination = dict(data.get("pagination"))
+        except Exception:
+            raise ListQueryError("DATA_FORMAT_INVALID")
+
+        if (not requested_fields) or (not requested_pagination):
+            raise ListQueryError("DATA_INSUFFICIENT")
+
+
+        # Pagination
+        pagination_count = requested_pagination.get("count") or get_count_settings()["DEFAULT_STRATEGY"]
+
+        if pagination_count not in COUNT_STRATEGIES:
+            raise ListQueryError("DATA_INVALID")
+
+        pagination_page_index = requested_pagination.get("page")
+        pagination_page_length = requested_pagination.get("length")
+        pagination_keyset = "cursor" in requested_pagination
+
+        if (pagination_page_length is None) or ((pagination_page_index is None) and not pagination_keyset):
+            raise ListQueryError("DATA_INSUFFICIENT")
+
+        search = data.get("search")
+
+        if search is not None:
+            if not isinstance(search, six.string_types):
+                raise ListQueryError("DATA_FORMAT_INVALID")
+
+            if self.search_index is None:
+                raise ListQueryError("`search` is not supported by this list.")
+
+        try:
+            pagination_page_length = int(pagination_page_length)
+
+            if not pagination_keyset:
+                pagination_page_index = int(pagination_page_index)
+        except (TypeError, ValueError):
+            raise ListQueryError("DATA_FORMAT_INVALID")
+
+        if pagination_keyset:
+            if pagination_page_length < 1:
+                raise ListQueryError("PAGINATION_NEGATIVE_INDEX_UNSUPPORTED")
+
+            pagination = ListPagination(keyset=True,
+                                        cursor=requested_pagination.get("cursor"),
+                                        length=min(pagination_page_length, PAGINATION_MAX_LENGTH),
+                                        count=pagination_count,
+                                        search=search)
+        else:
+            pagination_start_index = pagination_page_index * pagination_page_length
+            pagination_end_index = pagination_start_index + min(pagination_page_length, PAGINATION_MAX_LENGTH)
+
+            if pagination_start_index < 0 or pagination_end_index < 0:
+                raise ListQueryError("PAGINATION_NEGATIVE_INDEX_UNSUPPORTED")
+
+            pagination = ListPagination(start=pagination_start_index, end=pagination_end_index, count=pagination_count, search=search)
+
+
+        # Shape
+        shape = []
+
+        for field_object in requested_fields:
+            try:
+                field_name = field_object.get("field")
+                field_order = field_object.get("order")
+
+                shape.append((smart_text(field_name) if field_name is not None else None,
+                              field_object.get("search") is not None,
+                              smart_text(field_order) if field_order is not None else None,
+                              not (field_object.get("visibility") == False)))
+            except AttributeError:
+                raise ListQueryError("DATA_FORMAT_INVALID")
+
+            if field_name is None:
+                raise ListQueryError("FIELD_IDENTIFIER_MISSING")
+
+        return requested_fields, tuple(shape), pagination
+
+    def build_queryset(self, plan, requested_fields, search=None):
+        if plan.base_query is not None:
+            query = plan.base_query
+        else:
+            query = plan.project(self.queryset().order_by(*plan.sort_fields))
+
+        filter_dict = {}
+        or_filter = None
+
+        for position, lookup in plan.search_lookups:
+            filter_dict[lookup] = smart_text(requested_fields[position]["search"])
+
+        for position, lookup in plan.or_search_lookups:
+            field_query = smart_text(requested_fields[position]["search"])
+
+            if field_query == "":
+                filter_dict[lookup] = field_query
+            elif or_filter is None:
+                or_filter = Q(**{lookup: field_query})
+            else:
+                or_filter |= Q(**{lookup: field_query})
+
+        if search is not None:
+            query = self.search_index.filter(query, search, plan.sort_fields)
+
+        if or_filter is not None:
+            return query.filter(or_filter, **filter_dict)
+        if filter_dict:
+            return query.filter(**filter_dict)
+
+        # Never hand out the plan's own queryset
+        return query.all()
+
+    def prepare(self, data):
+        """Returns (plan, queryset, pagination, requested_fields) for a
+        request body, without touching the database.
+        """
+        requested_fields, shape, pagination = self.parse(data)
+
+        plan = self.engine.get_plan(self, shape)
+
+        return plan, self.build_queryset(plan, requested_fields, pagination.search), pagination, requested_fields
+
+    def get_count(self, plan, query, pagination, requested_fields):
+        """Returns (count, size_type) using the requested count strategy."""
+        if pagination.count == "cached" and versions_are_shared():
+            return get_cached_count(self, plan, query, requested_fields, pagination.search)
+        if pagination.count == "estimated":
+            return get_estimated_count(query)
+        return query.count(), "exact"
+
+    def get_keyset_query(self, plan, query, pagination):
+        """Returns the queryset for a cursor request, ordered for keyset
+        pagination and limited to the rows after the cursor, or None if no
+        rows follow it.
+        """
+        query = query.order_by(*plan.keyset_order)
+
+        if pagination.cursor is not None:
+            values = decode_cursor(plan, self, pagination.cursor)
+            after = keyset_filter(plan.keyset_keys, values, connections[query.db].vendor in NULLS_LARGEST_VENDORS)
+
+            if after is None:
+                return None
+
+            query = query.filter(after)
+
+        # One extra row tells whether there is a next page
+        return query[:pagination.length + 1]
+
+    def get_keyset_page(self, plan, query, pagination):
+        """Returns (rows, next_cursor) for a cursor request."""
+        query = self.get_keyset_query(plan, query, pagination)
+
+        if query is None:
+            return [], None
+
+        rows = list(query)
+
+        if len(rows) <= pagination.length:
+            return rows, None
+
+        rows = rows[:pagination.length]
+
+        return rows, encode_cursor(plan, self, rows[-1])
+
+    def serialize_instances(self, plan, rows):
+        """Returns the output list for model instances."""
+        serialized_query = plan.serializer_class(rows, many=True)
+
+        output_list = []
+
+        for list_object in serialized_query.data:
+            new_dict = {}
+            new_dict.update({"id": list_object.pop("id")})
+            new_dict.update({"data": list_object})
+
+            output_list.append(new_dict)
+
+        return output_list
+
+    def serialize(self, plan, rows):
+        """Returns the output list for `rows`."""
+        if plan.row_fields is not None:
+            output_list = [plan.serialize_row(row) for row in rows]
+        else:
+            output_list = self.serialize_instances(plan, rows)
+
+        if self.post_process is not None:
+            self.post_process(output_list)
+
+        return output_list
+
+    def respond(self, request):
+        if request.DATA.get("stream"):
+            return self.respond_streaming(request)
+
+        try:
+            plan, query, pagination, requested_fields = self.prepare(request.DATA)
+
+            meta = {}
+
+            if pagination.keyset:
+                page, meta["next_cursor"] = self.get_keyset_page(plan, query, pagination)
+            else:
+                page = query[pagination.start:pagination.end]
+        except ListQueryError as e:
+            return Response({"detail": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        meta["size"], meta["size_type"] = self.get_count(plan, query, pagination, requested_fields)
+
+
+        return Response({
+                            "meta": meta,
+                            self.output_key: self.serialize(plan, page)
+                        })
+
+
+
+    ############################################################################
+    # Streaming
+    ############################################################################
+    def respond_streaming(self, request):
+        try:
+            plan, query, pagination, requested_fields = self.prepare(request.DATA)
+
+            cursor_values = None
+
+            if pagination.keyset and pagination.cursor is not None:
+                cursor_values = decode_cursor(plan, self, pagination.cursor)
+        except ListQueryError as e:
+            return Response({"detail": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        meta = {}
+        meta["size"], meta["size_type"] = self.get_count(plan, query, pagination, requested_fields)
+
+        return StreamingHttpResponse(self.iter_stream(plan, query, pagination, cursor_values, meta),
+                                     content_type="application/json")
+
+    def iter_chunks(self, plan, query, pagination, cursor_values=None):
+        """Yields the rows of the requested page in lists of at most
+        STREAM_CHUNK_SIZE rows. Cursor requests get one extra row at the end,
+        if there is a next page.
+        """
+        query = query.order_by(*plan.keyset_order)
+        nulls_largest = connections[query.db].vendor in NULLS_LARGEST_VENDORS
+
+        if pagination.keyset:
+            offset = 0
+            remaining = pagination.length + 1
+        else:
+            offset = pagination.start
+            remaining = pagination.end - pagination.start
+
+        values = cursor_values
+
+        while remaining > 0:
+            chunk_query = query
+
+            if values is not None:
+                after = keyset_filter(plan.keyset_keys, values, nulls_largest)
+
+                if after is None:
+                    return
+
+                chunk_query = query.filter(after)
+
+            chunk = list(chunk_query[offset:offset + min(STREAM_CHUNK_SIZE, remaining)])
+
+            if not chunk:
+                return
+
+            yield chunk
+
+            offset = 0
+            remaining -= len(chunk)
+            values = plan.get_key_values(chunk[-1])
+
+    def iter_stream(self, plan, query, pagination, cursor_values, meta):
+        def dumps(value):
+            return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        yield "{{{}:[".format(json.dumps(self.output_key)).encode("utf-8")
+
+        written = 0
+        last_row = None
+        has_next = False
+
+        for chunk in self.iter_chunks(plan, query, pagination, cursor_values):
+            if pagination.keyset and written + len(chunk) > pagination.length:
+                # The extra row fetched for the cursor is not returned
+                chunk = chunk[:pagination.length - written]
+                has_next = True
+
+            if chunk:
+                output_list = self.serialize(plan, chunk)
+
+                yield (b"," if written else b"") + b",".join(dumps(output) for output in output_list)
+
+                written += len(chunk)
+                last_row = chunk[-1]
+
+        if pagination.keyset:
+            meta["next_cursor"] = encode_cursor(plan, self, last_row) if has_next else None
+
+        yield b"],\"meta\":" + dumps(meta) + b"}"
+
+
+
+
+################################################################################
+# Engine
+################################################################################
+class ListEngine(object):
+    def __init__(self, plan_cache_size=PLAN_CACHE_SIZE):
+        self.specs = {}
+        self.plan_cache_size = plan_cache_size
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, name, model, serializer_class, output_key, **options):
+        """Registers `model` under `name` and returns its ListSpec."""
+        spec = ListSpec(self, name, model, serializer_class, output_key, **options)
+
+        # Cached counts are keyed on the model version
+        track_model_versions(model)
+
+        with self.lock:
+            self.specs[name] = spec
+
+        return spec
+
+    def get_spec(self, name):
+        return self.specs[name]
+
+    def get_plan(self, spec, shape):
+        key = (spec.name, shape)
+
+        with self.lock:
+            plan = self.plans.pop(key, None)
+
+            if plan is not None:
+                # Most recently used plans are kept at the end
+                self.plans[key] = plan
+                return plan
+
+        # Invalid shapes raise here and are never cached
+        plan = spec.compile(shape)
+
+        with self.lock:
+            self.plans[key] = plan
+
+            while len(self.plans) > self.plan_cache_size:
+                self.plans.popitem(last=False)
+
+        return plan
+
+    def clear_plans(self):
+        with self.lock:
+            self.plans.clear()
+
+
+list_engine = ListEngine()
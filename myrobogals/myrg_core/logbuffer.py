@@ -0,0 +1,388 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from six.moves import queue
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+# Buffered APILog writer.
+#
+# `log_api_call` used to INSERT one APILog row synchronously for every API
+# request. Entries are now placed on a bounded in-process queue and written
+# with `bulk_create` by a background thread, either once `BATCH_SIZE` entries
+# are waiting or every `FLUSH_INTERVAL_MS` milliseconds, whichever comes first.
+#
+# When the queue is full the `BACKPRESSURE` policy decides what happens:
+#   "block"         Wait up to `BLOCK_TIMEOUT_MS` for space, then give up.
+#   "drop_oldest"   Discard the oldest queued entry to make room.
+#   "spill"         Append the entry to `SPILL_PATH` (JSON lines), which is
+#                   replayed into the database once the queue has drained.
+#
+# A batch which fails to be written is appended to `SPILL_PATH` if it is set.
+# Otherwise it is written again by each of the next `RETRY_ATTEMPTS` flushes,
+# ahead of the queue, which waits meanwhile; a batch failing every attempt is
+# dropped and logged.
+#
+# A process replaying the spill file renames it to `<SPILL_PATH>.<pid>.replay`
+# first. Replay files left by processes which died replaying are replayed by
+# the next process to replay its spill file.
+#
+# Refer to API_LOG_BUFFER in myrg_core/settings.py
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MAX_SIZE": 10000,
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL_MS": 500,
+    "BACKPRESSURE": "block",
+    "BLOCK_TIMEOUT_MS": 1000,
+    "SPILL_PATH": None,
+    "RETRY_ATTEMPTS": 5,
+}
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+logger = logging.getLogger(__name__)
+
+
+def get_buffer_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "API_LOG_BUFFER", {}))
+
+    if options["BACKPRESSURE"] not in BACKPRESSURE_POLICIES:
+        raise ValueError("API_LOG_BUFFER BACKPRESSURE must be one of {}".format(", ".join(BACKPRESSURE_POLICIES)))
+
+    if options["BACKPRESSURE"] == "spill" and not options["SPILL_PATH"]:
+        raise ValueError("API_LOG_BUFFER SPILL_PATH is required for the spill policy")
+
+    return options
+
+
+class APILogBuffer(object):
+    def __init__(self, max_size, batch_size, flush_interval_ms, backpressure, block_timeout_ms=None, spill_path=None, retry_attempts=0):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.backpressure = backpressure
+        self.block_timeout = (block_timeout_ms / 1000.0) if block_timeout_ms is not None else None
+        self.spill_path = spill_path
+        self.retry_attempts = retry_attempts
+
+        self.queue = queue.Queue(maxsize=max_size)
+
+        # The batch which failed to be written, without a spill file, and how
+        # many times it has been retried
+        self._retry_entries = []
+        self._retry_count = 0
+
+        # Counters
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+
+        self._counter_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+    def _count(self, counter, amount=1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self):
+        with self._counter_lock:
+            return {
+                "queued": self.queue.qsize(),
+                "retrying": len(self._retry_entries),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "failed": self.failed,
+            }
+
+
+
+    ############################################################################
+    # Producer side
+    ############################################################################
+    def put(self, log_entry):
+        """Queues an unsaved APILog instance for writing.
+
+        Returns False if the entry could not be accepted, which only happens
+        under the "block" policy when no space became free in time.
+        """
+        self._ensure_started()
+
+        try:
+            self.queue.put_nowait(log_entry)
+        except queue.Full:
+            if self.backpressure == "block":
+                try:
+                    self.queue.put(log_entry, timeout=self.block_timeout)
+                except queue.Full:
+                    self._count("dropped")
+                    return False
+            elif self.backpressure == "drop_oldest":
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                        self._count("dropped")
+                    except queue.Empty:
+                        pass
+
+                    try:
+                        self.queue.put_nowait(log_entry)
+                        break
+                    except queue.Full:
+                        continue
+            else:
+                self._spill([log_entry])
+                self._count("enqueued")
+                return True
+
+        self._count("enqueued")
+
+        if self.queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+        return True
+
+
+
+    ############################################################################
+    # Consumer side
+    ############################################################################
+    def _ensure_started(self):
+        # A forked WSGI worker inherits the parent's buffer object, but not its
+        # flusher thread.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._flush_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+
+            if self._pid is not None and self._pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.max_size)
+                self._retry_entries = []
+                self._retry_count = 0
+
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="myrg-apilog-flusher")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            try:
+                self.flush()
+            finally:
+                # Don't keep a stale connection open on the flusher thread
+                close_old_connections()
+
+    def _drain(self, limit):
+        entries = []
+
+        while len(entries) < limit:
+            try:
+                entries.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return entries
+
+    def flush(self):
+        """Writes everything currently queued. Safe to call from any thread."""
+        from .models import APILog
+
+        with self._flush_lock:
+            while True:
+                entries = self._retry_entries or self._drain(self.batch_size)
+
+                if not entries:
+                    break
+
+                try:
+                    with transaction.atomic():
+                        APILog.objects.bulk_create(entries)
+                    self._count("written", len(entries))
+                except Exception:
+                    self._count("failed", len(entries))
+
+                    if self.spill_path:
+                        self._spill(entries)
+                        continue
+
+                    if self._retry_count < self.retry_attempts:
+                        # Next flush; the queue waits until then
+                        self._retry_entries = entries
+                        self._retry_count += 1
+                        break
+
+                    logger.exception("Dropped %d API log entries after %d failed writes", len(entries), self._retry_count + 1)
+                    self._count("dropped", len(entries))
+
+                self._retry_entries = []
+                self._retry_count = 0
+
+            if self.spill_path and self.queue.empty():
+                self._replay_spill()
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        self._wakeup.set()
+
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+        self.flush()
+
+
+
+    ############################################################################
+    # Spill file
+    ############################################################################
+    # Entries are stored as JSON lines. Role instances are stored by primary
+    # key and dates as ISO 8601 strings.
+    def _spill(self, entries, respill=False):
+        with self._spill_lock:
+            with open(self.spill_path, "a") as spill_file:
+                for entry in entries:
+                    spill_file.write(json.dumps({
+                        "user_role_id": entry.user_role_id,
+                        "ip": entry.ip,
+                        "api_url": entry.api_url,
+                        "api_body": entry.api_body,
+                        "note": entry.note,
+                        "date": entry.date.isoformat() if entry.date else None,
+                    }) + "\n")
+
+        # Entries replayed and spilled again were counted the first time
+        if not respill:
+            self._count("spilled", len(entries))
+
+    def _get_replay_path(self, pid):
+        return "{}.{}.replay".format(self.spill_path, pid)
+
+    def _find_orphaned_replays(self):
+        """Returns the replay files of other processes which are no longer
+        running.
+        """
+        from .metrics import is_process_alive
+
+        spill_dir, spill_name = os.path.split(os.path.abspath(self.spill_path))
+        replay_re = re.compile(r"^{}\.(\d+)\.replay$".format(re.escape(spill_name)))
+        paths = []
+
+        for name in sorted(os.listdir(spill_dir)):
+            match = replay_re.match(name)
+
+            if match is None:
+                continue
+
+            pid = int(match.group(1))
+
+            if pid != os.getpid() and not is_process_alive(pid):
+                paths.append(os.path.join(spill_dir, name))
+
+        return paths
+
+    def _replay_spill(self):
+        replay_path = self._get_replay_path(os.getpid())
+
+        # This process removes its own replay file once replayed, so one found
+        # here was left by an earlier process with the same PID
+        if os.path.exists(replay_path):
+            self._replay_file(replay_path)
+
+        for orphaned_path in self._find_orphaned_replays():
+            try:
+                # Claimed by whichever process renames it first
+                os.rename(orphaned_path, replay_path)
+            except OSError:
+                continue
+
+            self._replay_file(replay_path)
+
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path) or not os.path.getsize(self.spill_path):
+                return
+
+            # Claim the current file so that new spills go to a fresh one
+            os.rename(self.spill_path, replay_path)
+
+        self._replay_file(replay_path)
+
+    def _replay_file(self, replay_path):
+        from django.utils.dateparse import parse_datetime
+        from .models import APILog
+
+        entries = []
+
+        with open(replay_path) as replay_file:
+            for line in replay_file:
+                if not line.strip():
+                    continue
+
+                entry_dict = json.loads(line)
+                entry_dict["date"] = parse_datetime(entry_dict["date"]) if entry_dict.get("date") else None
+                entries.append(APILog(**entry_dict))
+
+        try:
+            for start in range(0, len(entries), self.batch_size):
+                with transaction.atomic():
+                    APILog.objects.bulk_create(entries[start:start + self.batch_size])
+                self._count("written", len(entries[start:start + self.batch_size]))
+        except Exception:
+            # Leave the unwritten remainder for the next attempt
+            self._count("failed", len(entries) - start)
+            self._spill(entries[start:], respill=True)
+
+        os.remove(replay_path)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_log_buffer():
+    """Returns the process-wide APILogBuffer, or None if buffering is disabled."""
+    global _buffer
+
+    if _buffer is None:
+        options = get_buffer_settings()
+
+        if not options["ENABLED"]:
+            return None
+
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = APILogBuffer(options["MAX_SIZE"],
+                                       options["BATCH_SIZE"],
+                                       options["FLUSH_INTERVAL_MS"],
+                                       options["BACKPRESSURE"],
+                                       block_timeout_ms=options["BLOCK_TIMEOUT_MS"],
+                                       spill_path=options["SPILL_PATH"],
+                                       retry_attempts=options["RETRY_ATTEMPTS"])
+                atexit.register(_buffer.stop)
+
+    return _buffer
@@ -0,0 +1,74 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from myrg_core.archive import archive_api_logs, iter_archived_api_logs
+
+class Command(BaseCommand):
+    args = "[--export <start> <end>]"
+    help = "Moves old APILog rows into compressed daily archive files, or exports archived rows as JSON lines."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--days", type="int", dest="max_age_days", default=None,
+                    help="Archive rows older than this many days (default: API_LOG_RETENTION MAX_AGE_DAYS)."),
+        make_option("--batch-size", type="int", dest="batch_size", default=None,
+                    help="Rows archived and deleted per batch (default: API_LOG_RETENTION BATCH_SIZE)."),
+        make_option("--archive-dir", dest="archive_dir", default=None,
+                    help="Archive directory (default: API_LOG_RETENTION ARCHIVE_DIR)."),
+        make_option("--loop", type="int", dest="loop", default=None,
+                    help="Keep running, archiving every LOOP seconds."),
+        make_option("--export", action="store_true", dest="export", default=False,
+                    help="Write archived rows between <start> and <end> (ISO 8601 dates or datetimes) to stdout."),
+    )
+
+    def handle(self, *args, **options):
+        if options["export"]:
+            return self.export(args, options)
+
+        while True:
+            archived_count = archive_api_logs(max_age_days=options["max_age_days"],
+                                              archive_dir=options["archive_dir"],
+                                              batch_size=options["batch_size"])
+
+            if int(options["verbosity"]) > 0:
+                self.stdout.write("Archived {} API log entries.".format(archived_count))
+
+            if not options["loop"]:
+                break
+
+            time.sleep(options["loop"])
+
+    def export(self, args, options):
+        if len(args) != 2:
+            raise CommandError("--export requires <start> and <end>.")
+
+        date_range = [self.parse_date_argument(value) for value in args]
+
+        for row in iter_archived_api_logs(date_range[0], date_range[1], archive_dir=options["archive_dir"]):
+            row["date"] = row["date"].isoformat()
+            self.stdout.write(json.dumps(row))
+
+    def parse_date_argument(self, value):
+        parsed = parse_datetime(value)
+
+        if parsed is None:
+            parsed_date = parse_date(value)
+
+            if parsed_date is None:
+                raise CommandError("`{}` is not a valid date.".format(value))
+
+            parsed = datetime.datetime(parsed_date.year, parsed_date.month, parsed_date.day)
+
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, timezone.utc)
+
+        return parsed
@@ -0,0 +1,61 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.encoding import smart_text
+
+from myrg_users.models import RobogalsUser, UserSession
+from myrg_users.sessions import get_session_user_id
+
+# Records the user of each unexpired session which has no UserSession row
+# (see myrg_users.sessions), i.e. sessions logged in to before UserSession
+# existed. Run once when upgrading to UserSession; safe to run repeatedly.
+# Until it has run, those sessions are only revoked with
+# USER_SESSIONS['LEGACY_SCAN'] on.
+
+
+class Command(BaseCommand):
+    help = "Records the owning user of sessions created before UserSession existed."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--batch-size", type="int", dest="batch_size", default=1000,
+                    help="Sessions decoded per query (default: 1000)."),
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        query = (Session.objects.filter(expire_date__gte=now)
+                                .exclude(session_key__in=UserSession.objects.values("session_key"))
+                                .order_by("session_key"))
+        last_key = None
+        scanned = 0
+        recorded = 0
+
+        # Walked in key order rather than with OFFSET
+        while True:
+            batch = list((query if last_key is None else query.filter(session_key__gt=last_key))[:options["batch_size"]])
+
+            if not batch:
+                break
+
+            owners = dict((session.session_key, smart_text(get_session_user_id(session)))
+                          for session in batch
+                          if get_session_user_id(session) is not None)
+            user_ids = set(RobogalsUser.objects.filter(pk__in=set(owners.values())).values_list("pk", flat=True))
+
+            with transaction.atomic():
+                UserSession.objects.bulk_create([UserSession(session_key=session_key, user_id=user_id)
+                                                 for session_key, user_id in sorted(owners.items())
+                                                 if user_id in user_ids])
+
+            scanned += len(batch)
+            recorded += len([user_id for user_id in owners.values() if user_id in user_ids])
+            last_key = batch[-1].session_key
+
+        self.stdout.write("{} session(s) scanned, {} recorded.".format(scanned, recorded))
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import json
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myrg_core.querybudget import QueryRecorder
+
+from .bench_routes import disable_throttling, make_client
+
+# CreateUsers throughput benchmark.
+#
+# Posts `--requests` requests to api/1.0/users/create, each creating `--users`
+# new users (a chapter's membership import), as the fixture admin of a
+# generate_fixture database, and reports users created per second and queries
+# per request. With --fast-hasher passwords are hashed with MD5, so that
+# password hashing does not dominate the timings.
+#
+# Everything is rolled back afterwards, unless --keep is given.
+
+
+class Rollback(Exception):
+    pass
+
+def make_body(users):
+    user_objects = []
+
+    for idx in range(users):
+        nonce = uuid4().hex
+        data = {
+            "username": "bulk" + nonce,
+            "primary_email": nonce + "@example.com",
+            "given_name": "Bulk",
+            "family_name": "User {}".format(idx),
+            "password": "bulk" + nonce,
+        }
+
+        user_objects.append({"nonce": nonce, "data": data})
+
+    return {"user": user_objects}
+
+
+class Command(BaseCommand):
+    help = "Times creating users in bulk through api/1.0/users/create."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--users", type="int", dest="users", default=2000,
+                    help="Users created per request (default: 2000)."),
+        make_option("--requests", type="int", dest="requests", default=3,
+                    help="Requests sent (default: 3)."),
+        make_option("--fast-hasher", action="store_true", dest="fast_hasher", default=False,
+                    help="Hash the new users' passwords with MD5."),
+        make_option("--password", dest="password", default="fixture",
+                    help="Password given to generate_fixture (default: fixture)."),
+        make_option("--keep", action="store_true", dest="keep", default=False,
+                    help="Keep the created users instead of rolling back."),
+    )
+
+    def handle(self, *args, **options):
+        disable_throttling()
+
+        # The buffer's writer thread would contend with the benchmark's
+        # transaction for SQLite's database lock
+        settings.API_LOG_BUFFER = dict(getattr(settings, "API_LOG_BUFFER", {}), ENABLED=False)
+
+        client = make_client(options["password"])
+
+        if options["fast_hasher"]:
+            settings.PASSWORD_HASHERS = ("django.contrib.auth.hashers.MD5PasswordHasher",) + tuple(settings.PASSWORD_HASHERS)
+            hashers.load_hashers(settings.PASSWORD_HASHERS)
+        total_seconds = 0
+        total_users = 0
+
+        try:
+            with transaction.atomic():
+                for idx in range(options["requests"]):
+                    body = json.dumps(make_body(options["users"]))
+
+                    with QueryRecorder() as recorder:
+                        started = time.time()
+                        response = client.post("/api/1.0/users/create", body, content_type="application/json")
+                        seconds = time.time() - started
+
+                    if response.status_code != 200:
+                        raise CommandError("users/create answered {}: {}".format(response.status_code, response.content[:200]))
+
+                    created = len(json.loads(response.content.decode("utf-8"))["success"]["nonce_id"])
+                    total_seconds += seconds
+                    total_users += created
+
+                    self.stdout.write("request {}: {} users in {:.2f} s ({:.0f} users/s), {} queries".format(
+                                          idx + 1, created, seconds, created / seconds, len(recorder.queries)))
+
+                self.stdout.write("{} users in {:.2f} s: {:.0f} users/s".format(total_users, total_seconds, total_users / total_seconds))
+
+                if not options["keep"]:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write("Rolled back.")
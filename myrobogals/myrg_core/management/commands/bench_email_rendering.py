@@ -0,0 +1,72 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+
+from myrg_messages.rendering import clear_email_templates, get_email_template, inline_css, render_email
+
+# Email rendering benchmark.
+#
+# Renders `--messages` messages with `--template`, each with its own title and
+# body, in each of LANGUAGES:
+#
+#   * with render_to_string, as send_email used to;
+#   * with render_to_string and then inlining its CSS, the work Mandrill's
+#     `inline_css` used to repeat for every send;
+#   * through myrg_messages.rendering, once its template is built.
+#
+# and reports the time per message of each, and the time building the
+# template took.
+
+
+class Command(BaseCommand):
+    help = "Times rendering email templates per message and through the template pipeline."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--messages", type="int", dest="messages", default=2000,
+                    help="Messages rendered per run (default: 2000)."),
+        make_option("--template", dest="template", default="myrg_standard_email_template.html",
+                    help="Template rendered (default: myrg_standard_email_template.html)."),
+    )
+
+    def handle(self, *args, **options):
+        template = options["template"]
+        languages = [code for code, name in settings.LANGUAGES]
+        contexts = [{
+            "title": "Message {} & co".format(idx),
+            "body": "Hi user {},<br>\n<br>\nThis is <a href='https://beta.my.robogals.org/?id={}'>message {}</a>.<br>".format(idx, idx, idx),
+        } for idx in range(options["messages"])]
+
+        self.stdout.write("{} messages of {} per run, languages {}".format(len(contexts), template, ", ".join(languages)))
+
+        clear_email_templates()
+        started = time.time()
+
+        for language in languages:
+            get_email_template(template, language, ["body", "title"])
+
+        self.stdout.write("{:<18} {:>8.3f} s   for {} language(s)".format("build (once)", time.time() - started, len(languages)))
+
+        runs = (
+            ("render_to_string", lambda context, language: render_to_string(template, context)),
+            ("+ inline_css", lambda context, language: inline_css(render_to_string(template, context))),
+            ("pipeline", lambda context, language: render_email(template, context, language)),
+        )
+
+        for name, render in runs:
+            started = time.time()
+
+            for idx, context in enumerate(contexts):
+                render(context, languages[idx % len(languages)])
+
+            self.report(name, time.time() - started, len(contexts))
+
+    def report(self, name, elapsed, count):
+        self.stdout.write("{:<18} {:>8.3f} s   {:>10.1f} us/message   {:>10.1f} messages/s".format(
+                              name, elapsed, elapsed / count * 1e6, count / elapsed))
@@ -0,0 +1,187 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.encoding import smart_text
+
+from myrg_core.listing import PAGINATION_MAX_LENGTH, ListPlan
+from myrg_users.models import RobogalsUser
+from myrg_users.serializers import RobogalsUserSerializer
+from myrg_users.views import user_list
+
+if hasattr(time, "process_time"):
+    cpu_time = time.process_time
+else:
+    cpu_time = time.clock
+
+FIXTURE_PREFIX = "benchlist"
+
+BENCH_REQUESTS = (
+    {
+        "query": [
+            {"field": "username", "order": "a"},
+            {"field": "given_name"},
+            {"field": "family_name"},
+            {"field": "primary_email"},
+        ],
+        "pagination": {"page": 0, "length": 50},
+    },
+    {
+        "query": [
+            {"field": "username", "search": FIXTURE_PREFIX + "0001"},
+            {"field": "given_name", "order": "d"},
+            {"field": "date_joined", "visibility": False},
+        ],
+        "pagination": {"page": 2, "length": 20},
+    },
+    {
+        "query": [
+            {"field": "family_name", "search": "Bench", "order": "a"},
+            {"field": "preferred_name"},
+            {"field": "gender"},
+            {"field": "postcode"},
+            {"field": "mobile"},
+        ],
+        "pagination": {"page": 10, "length": 100},
+    },
+)
+
+
+# Stands in for the shared serializer class the view used to mutate
+class LegacyUserSerializer(RobogalsUserSerializer):
+    class Meta(RobogalsUserSerializer.Meta):
+        pass
+
+def legacy_prepare(data):
+    """The per-request work ListUsers did before the list engine."""
+    requested_fields = list(data.get("query"))
+    requested_pagination = dict(data.get("pagination"))
+
+    pagination_page_index = int(requested_pagination.get("page"))
+    pagination_page_length = int(requested_pagination.get("length"))
+
+    pagination_start_index = pagination_page_index * pagination_page_length
+    pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
+
+    filter_dict = {}
+    sort_fields = []
+    fields = ["id"]
+
+    for field_object in requested_fields:
+        field_name = smart_text(field_object.get("field"))
+        field_query = field_object.get("search")
+        field_order = field_object.get("order")
+        field_visibility = field_object.get("visibility")
+
+        if field_name in RobogalsUser.PROTECTED_FIELDS:
+            raise ValueError(field_name)
+
+        try:
+            RobogalsUser._meta.get_field_by_name(field_name)
+        except FieldDoesNotExist:
+            raise ValueError(field_name)
+
+        if (field_query is not None):
+            filter_dict.update({field_name+"__icontains": smart_text(field_query)})
+
+        if (field_order is not None):
+            field_order = smart_text(field_order)
+
+            if field_order == "a":
+                sort_fields.append(field_name)
+            if field_order == "d":
+                sort_fields.append("-"+field_name)
+
+        if not (field_visibility == False):
+            fields.append(field_name)
+
+    query = RobogalsUser.objects.filter(is_active=True)
+    query = query.filter(**filter_dict)
+    query = query.order_by(*sort_fields)
+
+    serializer = LegacyUserSerializer
+    serializer.Meta.fields = fields
+
+    return serializer, query, pagination_start_index, pagination_end_index
+
+def create_user_fixture(rows, stdout=None):
+    """Makes sure at least `rows` fixture users exist."""
+    existing = RobogalsUser.objects.filter(username__startswith=FIXTURE_PREFIX).count()
+
+    if existing >= rows:
+        return
+
+    if stdout is not None:
+        stdout.write("Creating {} fixture users...".format(rows - existing))
+
+    batch = []
+
+    with transaction.atomic():
+        for idx in range(existing, rows):
+            batch.append(RobogalsUser(username="{}{:07d}".format(FIXTURE_PREFIX, idx),
+                                      primary_email="{}{:07d}@example.com".format(FIXTURE_PREFIX, idx),
+                                      given_name="Given{}".format(idx % 997),
+                                      family_name="Bench{}".format(idx % 1009),
+                                      password="!"))
+
+            if len(batch) >= 1000:
+                RobogalsUser.objects.bulk_create(batch)
+                batch = []
+
+        RobogalsUser.objects.bulk_create(batch)
+
+def engine_prepare(data):
+    plan, query, pagination, requested_fields = user_list.prepare(data)
+    return plan, query, pagination.start, pagination.end
+
+def execute(prepared):
+    serializer, query, pagination_start_index, pagination_end_index = prepared
+    query.count()
+
+    if isinstance(serializer, ListPlan):
+        return user_list.serialize(serializer, query[pagination_start_index:pagination_end_index])
+
+    return serializer(query[pagination_start_index:pagination_end_index], many=True).data
+
+
+class Command(BaseCommand):
+    help = "Compares the per-request CPU overhead of the list engine with the previous ListUsers implementation."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--rows", type="int", dest="rows", default=100000,
+                    help="Number of fixture users to list (default: 100000)."),
+        make_option("--iterations", type="int", dest="iterations", default=5000,
+                    help="Requests prepared per implementation (default: 5000)."),
+        make_option("--full-iterations", type="int", dest="full_iterations", default=30,
+                    help="Requests executed end to end per implementation (default: 30)."),
+    )
+
+    def handle(self, *args, **options):
+        create_user_fixture(options["rows"], self.stdout if int(options["verbosity"]) > 0 else None)
+
+        for name, prepare in (("legacy", legacy_prepare), ("engine", engine_prepare)):
+            # Warm up (and, for the engine, fill the plan cache)
+            for data in BENCH_REQUESTS:
+                execute(prepare(data))
+
+            started = cpu_time()
+
+            for idx in range(options["iterations"]):
+                prepare(BENCH_REQUESTS[idx % len(BENCH_REQUESTS)])
+
+            prepare_time = (cpu_time() - started) / options["iterations"]
+
+            started = cpu_time()
+
+            for idx in range(options["full_iterations"]):
+                execute(prepare(BENCH_REQUESTS[idx % len(BENCH_REQUESTS)]))
+
+            full_time = (cpu_time() - started) / options["full_iterations"]
+
+            self.stdout.write("{:<8} prepare: {:8.1f} us/request    end to end: {:8.2f} ms/request (CPU)".format(name, prepare_time * 1e6, full_time * 1e3))
@@ -0,0 +1,131 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myrg_groups.models import Group
+from myrg_groups.views import group_lists
+from myrg_users.models import RobogalsUser
+from myrg_users.views import user_list
+
+from .bench_list_engine import create_user_fixture
+
+FIXTURE_PREFIX = "benchproj"
+
+BENCH_SHAPES = (
+    # (label, spec, query)
+    ("users", user_list, [
+        {"field": "username", "order": "a"},
+        {"field": "given_name"},
+        {"field": "family_name"},
+    ]),
+    ("groups", group_lists["general"], [
+        {"field": "name", "order": "a"},
+        {"field": "status"},
+    ]),
+)
+
+
+def create_group_fixture(rows, description_length, stdout=None):
+    """Makes sure at least `rows` fixture groups exist, each with a
+    `description_length` character description.
+    """
+    existing = Group.objects.filter(name__startswith=FIXTURE_PREFIX).count()
+
+    if existing >= rows:
+        return
+
+    if stdout is not None:
+        stdout.write("Creating {} fixture groups...".format(rows - existing))
+
+    create_user_fixture(1)
+    creator = RobogalsUser.objects.order_by("pk")[0]
+    description = "x" * description_length
+
+    batch = []
+
+    with transaction.atomic():
+        for idx in range(existing, rows):
+            batch.append(Group(name="{}{:07d}".format(FIXTURE_PREFIX, idx),
+                               creator=creator,
+                               description=description,
+                               status=1))
+
+            if len(batch) >= 1000:
+                Group.objects.bulk_create(batch)
+                batch = []
+
+        Group.objects.bulk_create(batch)
+
+def time_page(fetch, serialize, iterations):
+    """Returns the mean (fetch, serialize) wall times of a page, in seconds."""
+    fetch_time = 0.0
+    serialize_time = 0.0
+
+    for idx in range(iterations):
+        started = time.time()
+        rows = fetch()
+        fetched = time.time()
+        serialize(rows)
+        fetch_time += fetched - started
+        serialize_time += time.time() - fetched
+
+    return fetch_time / iterations, serialize_time / iterations
+
+
+class Command(BaseCommand):
+    help = "Compares fetching and serializing list pages as full model instances, with only() and as values_list() rows."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--rows", type="int", dest="rows", default=20000,
+                    help="Number of fixture users and groups (default: 20000)."),
+        make_option("--description-length", type="int", dest="description_length", default=4096,
+                    help="Length of the fixture groups' descriptions (default: 4096)."),
+        make_option("--length", type="int", dest="length", default=1000,
+                    help="Rows per page (default: 1000)."),
+        make_option("--iterations", type="int", dest="iterations", default=20,
+                    help="Pages fetched per mode (default: 20)."),
+    )
+
+    def handle(self, *args, **options):
+        stdout = self.stdout if int(options["verbosity"]) > 0 else None
+
+        create_user_fixture(options["rows"], stdout)
+        create_group_fixture(options["rows"], options["description_length"], stdout)
+
+        length = options["length"]
+
+        self.stdout.write("{:<8}  {:<8}  {:>10}  {:>14}  {:>10}".format("list", "mode", "fetch ms", "serialize ms", "total ms"))
+
+        for label, spec, requested_fields in BENCH_SHAPES:
+            plan, query, pagination, requested_fields = spec.prepare({
+                "query": requested_fields,
+                "pagination": {"page": 0, "length": length},
+            })
+
+            full_query = spec.queryset.order_by(*plan.sort_fields)
+
+            modes = [
+                ("full", lambda: list(full_query[:length]), lambda rows: spec.serialize_instances(plan, rows)),
+                ("only", lambda: list(full_query.only(*plan.columns)[:length]), lambda rows: spec.serialize_instances(plan, rows)),
+            ]
+
+            if plan.row_fields is not None:
+                modes.append(("values", lambda: list(query[:length]), lambda rows: spec.serialize(plan, rows)))
+
+            for mode, fetch, serialize in modes:
+                # Warm up
+                serialize(fetch())
+
+                fetch_time, serialize_time = time_page(fetch, serialize, options["iterations"])
+
+                self.stdout.write("{:<8}  {:<8}  {:>10.2f}  {:>14.2f}  {:>10.2f}".format(label,
+                                                                                       mode,
+                                                                                       fetch_time * 1000,
+                                                                                       serialize_time * 1000,
+                                                                                       (fetch_time + serialize_time) * 1000))
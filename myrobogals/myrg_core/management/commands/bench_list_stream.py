@@ -0,0 +1,151 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import json
+import os
+import resource
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from myrg_core import listing
+from myrg_users.models import RobogalsUser
+from myrg_users.views import ListUsers
+
+from .bench_list_engine import create_user_fixture
+
+BENCH_FIELDS = ("username", "primary_email", "given_name", "family_name", "preferred_name",
+                "dob", "gender", "preferred_language", "mobile", "postcode", "date_joined")
+
+
+def get_peak_rss_kb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Bytes on OS X, kilobytes elsewhere
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+
+    return peak_rss
+
+def make_request(user, length, stream):
+    body = {
+        "query": [{"field": field} for field in BENCH_FIELDS],
+        "pagination": {"length": length, "cursor": None},
+        "stream": stream,
+    }
+
+    request = APIRequestFactory().post("/api/1.0/users/list", json.dumps(body), content_type="application/json")
+    force_authenticate(request, user=user)
+
+    # RobogalsAPIView falls back to the session's role
+    request.session = {}
+
+    return request
+
+def run_request(user, length, stream):
+    """Runs one list request and consumes its response.
+
+    Returns the response size in bytes.
+    """
+    response = ListUsers.as_view()(make_request(user, length, stream))
+
+    if response.status_code != 200:
+        raise CommandError("List request failed with status {}".format(response.status_code))
+
+    if stream:
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    response.render()
+    return len(response.content)
+
+def measure(user, length, stream):
+    """Runs the request in a forked child, so that each measurement starts
+    from the same peak RSS.
+
+    Returns (peak RSS growth in KB, seconds, response bytes).
+    """
+    read_fd, write_fd = os.pipe()
+
+    # The child must not share the parent's database connection
+    connection.close()
+
+    pid = os.fork()
+
+    if pid == 0:
+        try:
+            os.close(read_fd)
+
+            # Warm up imports and cached serializers
+            run_request(user, 10, stream)
+
+            peak_before = get_peak_rss_kb()
+            started = time.time()
+            size = run_request(user, length, stream)
+            duration = time.time() - started
+            peak_after = get_peak_rss_kb()
+
+            os.write(write_fd, json.dumps([peak_after - peak_before, duration, size]).encode("utf-8"))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+
+    result = b""
+
+    while True:
+        data = os.read(read_fd, 4096)
+
+        if not data:
+            break
+
+        result += data
+
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+
+    if not result:
+        raise CommandError("Benchmark child process failed")
+
+    return json.loads(result.decode("utf-8"))
+
+
+class Command(BaseCommand):
+    help = "Compares peak memory of buffered and streamed list responses over a range of page lengths."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--rows", type="int", dest="rows", default=100000,
+                    help="Number of fixture users (default: 100000)."),
+        make_option("--lengths", dest="lengths", default="100,1000,10000,50000",
+                    help="Comma separated page lengths (default: 100,1000,10000,50000)."),
+    )
+
+    def handle(self, *args, **options):
+        if not hasattr(os, "fork"):
+            raise CommandError("This benchmark requires os.fork.")
+
+        lengths = [int(length) for length in options["lengths"].split(",")]
+
+        create_user_fixture(max(options["rows"], max(lengths)), self.stdout if int(options["verbosity"]) > 0 else None)
+
+        user = RobogalsUser.objects.filter(is_active=True).order_by("pk")[0]
+
+        # Allow pages beyond the API maximum, to show how memory scales
+        listing.PAGINATION_MAX_LENGTH = max(lengths)
+
+        self.stdout.write("{:>8}  {:>10}  {:>14}  {:>10}  {:>12}".format("length", "mode", "peak RSS +KB", "ms", "bytes"))
+
+        for length in lengths:
+            for stream in (False, True):
+                peak_growth, duration, size = measure(user, length, stream)
+
+                self.stdout.write("{:>8}  {:>10}  {:>14}  {:>10.1f}  {:>12}".format(length,
+                                                                                  "streamed" if stream else "buffered",
+                                                                                  peak_growth,
+                                                                                  duration * 1000,
+                                                                                  size))
@@ -0,0 +1,151 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myrg_messages import outbox
+from myrg_messages.models import EmailDefinition, EmailOutbox
+from myrg_messages.standin import start_standin
+from myrg_messages.transports import get_transport_settings, reset_transport
+from myrg_users.models import RobogalsUser
+
+from .bench_routes import disable_throttling, make_client
+from .generate_fixture import ADMIN_ROLE_ID
+
+# End to end email throughput benchmark.
+#
+# For each of `--workers` sender counts, queues email through the API, as the
+# fixture admin of a generate_fixture database:
+#
+#   * `--messages` messages/send requests, each to `--recipients` users;
+#   * one utils/pwdreset/initiate request for `--resets` users (the bulk
+#     path, queueing an email per user);
+#
+# then drains the outbox (see myrg_messages.outbox) with that many senders,
+# and reports emails per second queued by the API, sent by the senders, and
+# end to end.
+#
+# Emails are sent to a Mandrill stand-in (see myrg_messages.standin) started
+# in process with `--latency` and `--failure-rate`, or with --memory to the
+# in-memory transport. Failed sends are retried without delay. The emails
+# queued are deleted afterwards, unless --keep is given.
+
+
+class Command(BaseCommand):
+    help = "Times queueing email through the API and sending it through the outbox."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--messages", type="int", dest="messages", default=200,
+                    help="messages/send requests per run (default: 200)."),
+        make_option("--recipients", type="int", dest="recipients", default=1,
+                    help="Recipients per message (default: 1)."),
+        make_option("--resets", type="int", dest="resets", default=200,
+                    help="Users in the pwdreset/initiate request per run (default: 200)."),
+        make_option("--workers", dest="workers", default="1,4,16",
+                    help="Comma separated sender counts (default: 1,4,16)."),
+        make_option("--latency", type="float", dest="latency", default=50,
+                    help="Milliseconds the stand-in takes per call (default: 50)."),
+        make_option("--failure-rate", type="float", dest="failure_rate", default=0.0,
+                    help="Fraction of stand-in calls failing (default: 0)."),
+        make_option("--memory", action="store_true", dest="memory", default=False,
+                    help="Send to the in-memory transport instead of the stand-in."),
+        make_option("--seed", type="int", dest="seed", default=0,
+                    help="Random seed (default: 0)."),
+        make_option("--password", dest="password", default="fixture",
+                    help="Password given to generate_fixture (default: fixture)."),
+        make_option("--keep", action="store_true", dest="keep", default=False,
+                    help="Keep the queued emails and their definitions."),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            worker_counts = [int(workers) for workers in options["workers"].split(",")]
+        except ValueError:
+            raise CommandError("--workers must be a comma separated list of integers.")
+
+        if EmailOutbox.objects.filter(status__in=(outbox.PENDING, outbox.SENDING)).exists():
+            raise CommandError("The outbox holds unsent emails; run drain_outbox first.")
+
+        rng = random.Random(options["seed"])
+        users = list(RobogalsUser.objects.filter(is_active=True).values_list("pk", "primary_email")[:max(options["resets"], options["recipients"] * 10, 100)])
+
+        if len(users) < options["resets"]:
+            raise CommandError("The database holds too few users; run generate_fixture first.")
+
+        disable_throttling()
+
+        # The senders write from their own threads; don't contend with the
+        # log buffer's writer for SQLite's database lock as well
+        settings.API_LOG_BUFFER = dict(getattr(settings, "API_LOG_BUFFER", {}), ENABLED=False)
+        settings.EMAIL_OUTBOX = dict(getattr(settings, "EMAIL_OUTBOX", {}), RETRY_DELAY=0, POLL_SECONDS=0.05)
+
+        server = None
+
+        if options["memory"]:
+            settings.EMAIL_TRANSPORT = dict(get_transport_settings(), BACKEND="memory")
+            target = "in-memory transport"
+        else:
+            server = start_standin(latency=options["latency"] / 1000.0, failure_rate=options["failure_rate"], seed=options["seed"])
+            settings.EMAIL_TRANSPORT = dict(get_transport_settings(), BACKEND="http", URL="http://127.0.0.1:{}/api/1.0/".format(server.server_port))
+            target = "stand-in, {:.0f} ms per call, {:.0%} failing".format(options["latency"], options["failure_rate"])
+
+        reset_transport()
+
+        client = make_client(options["password"])
+        last_definition = EmailDefinition.objects.order_by("-pk").values_list("pk", flat=True).first()
+
+        self.stdout.write("{} messages/send x {} recipient(s) + pwdreset for {} users per run, to the {}".format(
+                              options["messages"], options["recipients"], options["resets"], target))
+
+        try:
+            for workers in worker_counts:
+                started = time.time()
+
+                for idx in range(options["messages"]):
+                    self.post(client, "/api/1.0/messages/send", {
+                        "role": ADMIN_ROLE_ID,
+                        "message": [{"nonce": "bench{}".format(idx), "data": {"email": {
+                            "from_name": "Benchmark",
+                            "subject": "Benchmark {}".format(idx),
+                            "body": "Benchmark message {}".format(idx),
+                            "html": False,
+                            "recipients": [{"user": user_id} for user_id, primary_email in rng.sample(users, options["recipients"])],
+                        }}}],
+                    })
+
+                self.post(client, "/api/1.0/utils/pwdreset/initiate", {
+                    "primary_email": [primary_email for user_id, primary_email in rng.sample(users, options["resets"])],
+                })
+
+                queued_seconds = time.time() - started
+                queued = EmailOutbox.objects.filter(status=outbox.PENDING).count()
+
+                started = time.time()
+                counts = outbox.drain(workers=workers, once=True)
+                sent_seconds = time.time() - started
+
+                self.stdout.write("{:>3} sender(s): {:>5} emails   queued {:>7.1f}/s   sent {:>7.1f}/s   end to end {:>7.1f}/s   ({} retried, {} dead)".format(
+                                      workers, queued, queued / queued_seconds, counts["sent"] / sent_seconds,
+                                      counts["sent"] / (queued_seconds + sent_seconds), counts["retried"], counts["dead"]))
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+            if not options["keep"]:
+                # Cascades to the outbox and EmailMessage rows
+                EmailDefinition.objects.filter(pk__gt=last_definition or 0).delete()
+                self.stdout.write("Deleted the queued emails.")
+
+    def post(self, client, path, body):
+        response = client.post(path, json.dumps(body), content_type="application/json")
+
+        if response.status_code != 200 or json.loads(response.content.decode("utf-8"))["fail"].get("nonce"):
+            raise CommandError("{} answered {}: {}".format(path, response.status_code, response.content[:200]))
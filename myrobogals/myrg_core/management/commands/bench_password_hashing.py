@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import multiprocessing
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from myrg_users.hashing import close_pool, make_passwords
+
+# Password hashing throughput benchmark.
+#
+# Hashes `--passwords` passwords with the default hasher, inline as
+# make_password does and then through myrg_users.hashing with each of
+# `--workers` pool processes, and reports passwords (i.e. new users) hashed
+# per second against the number of cores. The pool is started before timing,
+# as it is once per process in production.
+
+
+def time_inline(passwords):
+    started = time.time()
+
+    for password in passwords:
+        make_password(password)
+
+    return time.time() - started
+
+def time_pool(passwords, workers):
+    original = getattr(settings, "PASSWORD_HASHING", None)
+    settings.PASSWORD_HASHING = dict(original or {}, ENABLED=True, WORKERS=workers)
+
+    try:
+        close_pool()
+        make_passwords(passwords[:workers])
+
+        started = time.time()
+        make_passwords(passwords)
+        return time.time() - started
+    finally:
+        close_pool()
+
+        if original is None:
+            del settings.PASSWORD_HASHING
+        else:
+            settings.PASSWORD_HASHING = original
+
+
+class Command(BaseCommand):
+    help = "Times hashing passwords inline and on process pools of several sizes."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--passwords", type="int", dest="passwords", default=200,
+                    help="Passwords hashed per run (default: 200)."),
+        make_option("--workers", dest="workers", default=None,
+                    help="Comma separated pool sizes (default: 1, 2, 4, ... up to the core count)."),
+    )
+
+    def handle(self, *args, **options):
+        cores = multiprocessing.cpu_count()
+
+        if options["workers"]:
+            try:
+                worker_counts = [int(workers) for workers in options["workers"].split(",")]
+            except ValueError:
+                raise CommandError("--workers must be a comma separated list of integers.")
+        else:
+            worker_counts = [1]
+
+            while worker_counts[-1] * 2 <= cores:
+                worker_counts.append(worker_counts[-1] * 2)
+
+            if worker_counts[-1] != cores:
+                worker_counts.append(cores)
+
+        passwords = [uuid4().hex for idx in range(options["passwords"])]
+
+        self.stdout.write("{} passwords, hasher {}, {} core(s)".format(len(passwords), get_hasher("default").algorithm, cores))
+
+        elapsed = time_inline(passwords)
+        self.stdout.write("{:<12} {:>8.2f} s   {:>8.1f} users/s".format("inline", elapsed, len(passwords) / elapsed))
+
+        for workers in worker_counts:
+            elapsed = time_pool(passwords, workers)
+            self.stdout.write("{:<12} {:>8.2f} s   {:>8.1f} users/s".format("{} worker(s)".format(workers), elapsed, len(passwords) / elapsed))
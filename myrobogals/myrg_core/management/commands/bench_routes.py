@@ -0,0 +1,367 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import io
+import json
+import random
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import resolve
+from django.db import close_old_connections
+from django.test.client import Client
+from django.utils import timezone
+
+from myrg_core import metrics
+from myrg_core.urls import api_urlpatterns
+from myrg_groups.models import Group, RoleClass, Role
+from myrg_permissions.models import PermissionList
+from myrg_repo.models import RepoContainer, RepoFile
+from myrg_users.models import RobogalsUser
+
+from .generate_fixture import ADMIN_EMAIL, ADMIN_ROLE_ID
+
+# End to end load benchmark of the API routes.
+#
+# Drives every route in myrg_core.urls through Django's test client, one route
+# at a time, from `--concurrency` threads, against a database filled by
+# `generate_fixture`. Latency is measured around each client request; query
+# counts come from myrg_core.metrics, so METRICS must be enabled for them.
+#
+# Delete routes are given rows created for the purpose before timing starts.
+# Routes which would send email, end the benchmark's session or need a file
+# upload are listed under "skipped" in the report.
+
+SKIPPED = {
+    "/api/1.0/utils/pwdreset/initiate": "sends email",
+    "/api/1.0/utils/pwdreset/complete": "needs a password reset token",
+    "/api/1.0/self/killsessions": "ends the benchmark session",
+    "/api/1.0/repofiles/create": "needs a file upload",
+    "/api/1.0/messages/send": "sends email",
+}
+
+
+class BenchContext(object):
+    """Fixture ids that request bodies are drawn from, and rows set aside for
+    the delete routes.
+    """
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.user_ids = list(RobogalsUser.objects.filter(is_active=True, username__startswith="fixture0").values_list("pk", flat=True)[:10000])
+        self.group_ids = list(Group.objects.filter(status__gt=0).values_list("pk", flat=True)[:10000])
+        self.role_class_ids = list(RoleClass.objects.values_list("pk", flat=True))
+        self.role_ids = list(Role.objects.values_list("pk", flat=True)[:10000])
+        self.container_ids = list(RepoContainer.objects.values_list("pk", flat=True)[:10000])
+        self.permission_ids = list(PermissionList.objects.values_list("pk", flat=True))
+
+        if not (self.user_ids and self.group_ids and self.role_class_ids and self.role_ids and self.container_ids):
+            raise CommandError("The database holds no fixture; run generate_fixture first.")
+
+        self.scratch = {}
+
+    def choice(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+    def randint(self, low, high):
+        with self.lock:
+            return self.rng.randint(low, high)
+
+    def nonce(self):
+        # Not drawn from `rng`, which would repeat the fixture's own ids
+        return uuid4().hex
+
+    def pop_scratch(self, path):
+        with self.lock:
+            return self.scratch[path].pop()
+
+
+
+################################################################################
+# Request bodies
+################################################################################
+def list_body(query, ctx, length=50):
+    return {"query": query, "pagination": {"page": ctx.randint(0, 20), "length": length}}
+
+def users_list_body(ctx):
+    return list_body([
+        {"field": "family_name", "search": ctx.choice(("ace", "op", "ll", "son", ""))},
+        {"field": "username", "order": ctx.choice(("a", "d"))},
+        {"field": "given_name"},
+        {"field": "primary_email"},
+    ], ctx)
+
+def batch_body(ctx):
+    return {"requests": [
+        {"url": "/api/1.0/self/whoami", "body": {}},
+        {"url": "/api/1.0/self/roles", "method": "GET"},
+        {"url": "/api/1.0/groups/list", "body": dict(list_body([{"field": "name", "order": "a"}], ctx), group={"type": "chapters"})},
+        {"url": "/api/1.0/roleclasses/list", "body": list_body([{"field": "name", "order": "a"}], ctx)},
+    ], "concurrent": True}
+
+BODIES = (
+    # (path, method, body factory)
+    ("/api/1.0/utils/time", "GET", None),
+    ("/api/1.0/utils/metrics", "GET", None),
+    ("/api/1.0/batch", "POST", batch_body),
+
+    ("/api/1.0/users/list", "POST", users_list_body),
+    ("/api/1.0/users/edit", "POST", lambda ctx: {"user": [{"id": ctx.choice(ctx.user_ids), "data": {"mobile": "614{:08d}".format(ctx.randint(0, 99999999))}}]}),
+    ("/api/1.0/users/create", "POST", lambda ctx: {"user": [{"nonce": "n", "data": {"username": "bench" + ctx.nonce(), "primary_email": ctx.nonce() + "@example.com", "given_name": "Bench"}}]}),
+    ("/api/1.0/users/delete", "POST", lambda ctx: {"id": [ctx.pop_scratch("/api/1.0/users/delete")]}),
+
+    ("/api/1.0/self/whoami", "POST", lambda ctx: {}),
+    ("/api/1.0/self/roles", "GET", None),
+
+    ("/api/1.0/groups/list", "POST", lambda ctx: dict(list_body([{"field": "name", "order": "a"}, {"field": "city"}, {"field": "university"}], ctx), group={"type": "chapters"})),
+    ("/api/1.0/groups/edit", "POST", lambda ctx: {"group": [{"id": ctx.choice(ctx.group_ids), "data": {"description": "Edited {}".format(ctx.randint(0, 9999))}}]}),
+    ("/api/1.0/groups/create", "POST", lambda ctx: {"group": [{"nonce": "n", "type": "general", "data": {"name": "Bench group", "status": 9}}]}),
+    ("/api/1.0/groups/delete", "POST", lambda ctx: {"id": [ctx.pop_scratch("/api/1.0/groups/delete")]}),
+
+    ("/api/1.0/roles/list", "POST", lambda ctx: list_body([{"field": "user"}, {"field": "group"}, {"field": "date_start", "order": "d"}], ctx)),
+    ("/api/1.0/roles/edit", "POST", lambda ctx: {"role": [{"id": ctx.choice(ctx.role_ids), "data": {"date_end": None}}]}),
+    ("/api/1.0/roles/create", "POST", lambda ctx: {"role": [{"nonce": "n", "data": {"user": ctx.choice(ctx.user_ids), "role_class": ctx.choice(ctx.role_class_ids), "group": ctx.choice(ctx.group_ids)}}]}),
+
+    ("/api/1.0/roleclasses/list", "POST", lambda ctx: list_body([{"field": "name", "order": "a"}, {"field": "description"}], ctx)),
+    ("/api/1.0/roleclasses/edit", "POST", lambda ctx: {"role_class": [{"id": ctx.choice(ctx.role_class_ids), "data": {"description": "Edited {}".format(ctx.randint(0, 9999))}}]}),
+    ("/api/1.0/roleclasses/create", "POST", lambda ctx: {"role_class": [{"nonce": "n", "data": {"name": "Bench " + ctx.nonce()}}]}),
+    ("/api/1.0/roleclasses/delete", "POST", lambda ctx: {"id": [ctx.pop_scratch("/api/1.0/roleclasses/delete")]}),
+
+    ("/api/1.0/repofiles/list", "POST", lambda ctx: list_body([{"field": "name", "order": "a"}, {"field": "container"}], ctx)),
+    ("/api/1.0/repofiles/delete", "POST", lambda ctx: {"id": [ctx.pop_scratch("/api/1.0/repofiles/delete")]}),
+
+    ("/api/1.0/repocontainers/list", "POST", lambda ctx: list_body([{"field": "title", "order": "a"}, {"field": "tags", "search": ctx.choice(("robot", "lego", "team"))}], ctx)),
+    ("/api/1.0/repocontainers/edit", "POST", lambda ctx: {"rc": [{"id": ctx.choice(ctx.container_ids), "data": {"title": "Edited {}".format(ctx.randint(0, 9999))}}]}),
+    ("/api/1.0/repocontainers/create", "POST", lambda ctx: {"rc": [{"nonce": "n", "data": {"user": ctx.choice(ctx.user_ids), "role": ctx.choice(ctx.role_ids), "title": "Bench", "body": "Bench", "tags": "bench"}}]}),
+    ("/api/1.0/repocontainers/delete", "POST", lambda ctx: {"id": [ctx.pop_scratch("/api/1.0/repocontainers/delete")]}),
+
+    ("/api/1.0/permissions/list", "POST", lambda ctx: list_body([{"field": "permission", "order": "a"}, {"field": "role_classes"}], ctx)),
+    ("/api/1.0/permissions/edit", "POST", lambda ctx: {"permission": [{"id": ctx.choice(ctx.permission_ids), "data": {"role_classes": "1"}}]}),
+    ("/api/1.0/permissions/create", "POST", lambda ctx: {"permission": [{"nonce": "n", "data": {"permission": "BENCH_" + ctx.nonce(), "role_classes": "1"}}]}),
+    ("/api/1.0/permissions/delete", "POST", lambda ctx: {"id": [ctx.pop_scratch("/api/1.0/permissions/delete")]}),
+)
+
+
+def create_scratch_rows(ctx, count):
+    """Creates `count` rows for each delete route to delete."""
+    now = timezone.now()
+
+    user_ids = [ctx.nonce() for idx in range(count)]
+    RobogalsUser.objects.bulk_create([RobogalsUser(id=user_id, username="scratch" + user_id, primary_email="scratch{}@example.com".format(user_id),
+                                                   given_name="Scratch", password="!", date_joined=now)
+                                      for user_id in user_ids])
+
+    container_ids = [ctx.nonce() for idx in range(count)]
+    RepoContainer.objects.bulk_create([RepoContainer(id=container_id, user_id=ctx.user_ids[0], role_id=ctx.role_ids[0],
+                                                     title="Scratch", body="Scratch", tags="scratch")
+                                       for container_id in container_ids])
+
+    ctx.scratch = {
+        "/api/1.0/users/delete": user_ids,
+        "/api/1.0/groups/delete": [Group.objects.create(name="Scratch", creator_id=ctx.user_ids[0], status=9).pk for idx in range(count)],
+        "/api/1.0/roleclasses/delete": [RoleClass.objects.create(name="Scratch " + ctx.nonce()).pk for idx in range(count)],
+        "/api/1.0/repofiles/delete": [RepoFile.objects.create(name="scratch", file="repo-files/scratch", container_id=container_ids[0]).pk for idx in range(count)],
+        "/api/1.0/repocontainers/delete": container_ids,
+        "/api/1.0/permissions/delete": [PermissionList.objects.create(permission="SCRATCH", role_classes="1").pk for idx in range(count)],
+    }
+
+
+
+################################################################################
+# Measurement
+################################################################################
+def get_routes():
+    """Returns the paths of the API routes, without format suffixed variants."""
+    return ["/" + pattern.regex.pattern.lstrip("^").rstrip("$")
+            for pattern in api_urlpatterns
+            if "format" not in pattern.regex.groupindex]
+
+def make_client(password):
+    client = Client()
+
+    if not client.login(username=ADMIN_EMAIL, password=password):
+        raise CommandError("Cannot log in as {}; was the fixture generated with another password?".format(ADMIN_EMAIL))
+
+    session = client.session
+    session["role_id"] = ADMIN_ROLE_ID
+    session.save()
+
+    return client
+
+def disable_throttling():
+    """Every request comes from one client, so most would be throttled."""
+    settings.THROTTLING = dict(getattr(settings, "THROTTLING", {}), ENABLED=False)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return None
+
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))]
+
+def run_route(ctx, clients, path, method, body_factory, requests, warmup):
+    """Sends `warmup` then `requests` requests to `path`, spread over one
+    thread per client. Returns (latencies, status counts, errors, seconds).
+    """
+    latencies = []
+    statuses = {}
+    errors = [0]
+    results_lock = threading.Lock()
+    remaining = [warmup + requests]
+
+    def worker(client):
+        try:
+            while True:
+                with results_lock:
+                    if remaining[0] <= 0:
+                        return
+
+                    measured = remaining[0] <= requests
+                    remaining[0] -= 1
+
+                started = time.time()
+
+                try:
+                    if method == "GET":
+                        response = client.get(path)
+                    else:
+                        response = client.post(path, json.dumps(body_factory(ctx)), content_type="application/json")
+
+                    status_code = str(response.status_code)
+                except Exception:
+                    status_code = None
+
+                duration = time.time() - started
+
+                if measured:
+                    with results_lock:
+                        latencies.append(duration)
+
+                        if status_code is None:
+                            errors[0] += 1
+                        else:
+                            statuses[status_code] = statuses.get(status_code, 0) + 1
+        finally:
+            close_old_connections()
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+
+    started = time.time()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return sorted(latencies), statuses, errors[0], time.time() - started
+
+def get_queries_per_request(route, method):
+    histogram = metrics.registry.histograms.get(("myrg_request_db_queries", route, method))
+
+    if not histogram or not histogram[-1]:
+        return None
+
+    return histogram[-2] / histogram[-1]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks every API route end to end against a generate_fixture database and writes a JSON report."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--requests", type="int", dest="requests", default=200,
+                    help="Measured requests per route (default: 200)."),
+        make_option("--warmup", type="int", dest="warmup", default=10,
+                    help="Unmeasured requests per route sent first (default: 10)."),
+        make_option("--concurrency", type="int", dest="concurrency", default=4,
+                    help="Client threads (default: 4)."),
+        make_option("--routes", dest="routes", default=None,
+                    help="Comma separated paths to benchmark (default: all)."),
+        make_option("--seed", type="int", dest="seed", default=0,
+                    help="Random seed for request bodies (default: 0)."),
+        make_option("--password", dest="password", default="fixture",
+                    help="Password given to generate_fixture (default: fixture)."),
+        make_option("--output", dest="output", default="bench_routes.json",
+                    help="Report path (default: bench_routes.json)."),
+    )
+
+    def handle(self, *args, **options):
+        if not metrics.get_metrics_settings()["ENABLED"]:
+            self.stderr.write("METRICS is disabled; queries per request will not be reported.")
+
+        disable_throttling()
+
+        ctx = BenchContext(options["seed"])
+        create_scratch_rows(ctx, options["warmup"] + options["requests"])
+
+        clients = [make_client(options["password"]) for idx in range(options["concurrency"])]
+
+        selected_paths = None
+
+        if options["routes"]:
+            selected_paths = set(path.strip() for path in options["routes"].split(","))
+
+        bodies = dict((path, (method, body_factory)) for path, method, body_factory in BODIES)
+
+        report = {
+            "settings": {
+                "requests": options["requests"],
+                "warmup": options["warmup"],
+                "concurrency": options["concurrency"],
+                "seed": options["seed"],
+                "users": RobogalsUser.objects.count(),
+                "groups": Group.objects.count(),
+            },
+            "routes": {},
+            "skipped": {},
+        }
+
+        for path in get_routes():
+            if selected_paths is not None and path not in selected_paths:
+                continue
+
+            if path in SKIPPED or path not in bodies:
+                report["skipped"][path] = SKIPPED.get(path, "no benchmark request defined")
+                continue
+
+            method, body_factory = bodies[path]
+            route = metrics.get_view_route(resolve(path).func)
+
+            metrics.registry.reset()
+
+            latencies, statuses, errors, duration = run_route(ctx, clients, path, method, body_factory,
+                                                              options["requests"], options["warmup"])
+
+            queries_per_request = get_queries_per_request(route, method)
+
+            result = report["routes"][path] = {
+                "method": method,
+                "requests": len(latencies),
+                "status": statuses,
+                "errors": errors,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+                "queries_per_request": round(queries_per_request, 2) if queries_per_request is not None else None,
+                "throughput_rps": round(len(latencies) / duration, 2),
+            }
+
+            self.stdout.write("{:<36} p50 {:>8.2f} ms  p95 {:>8.2f} ms  p99 {:>8.2f} ms  {:>6} q/req  {:>8.1f} req/s  {}".format(
+                path, result["p50_ms"], result["p95_ms"], result["p99_ms"],
+                result["queries_per_request"] if result["queries_per_request"] is not None else "-",
+                result["throughput_rps"],
+                " ".join("{}x{}".format(count, code) for code, count in sorted(statuses.items())) + (" {} errors".format(errors) if errors else "")))
+
+        with io.open(options["output"], "w", encoding="utf-8") as report_file:
+            report_file.write(str(json.dumps(report, indent=2, sort_keys=True)))
+            report_file.write("\n")
+
+        self.stdout.write("Report written to {}".format(options["output"]))
@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import datetime
+import random
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from myrg_users.models import RobogalsUser, UserSession
+from myrg_users.sessions import delete_unexpired_sessions, scan_session_keys
+
+# Session revocation benchmark.
+#
+# Inserts `--sessions` synthetic unexpired sessions spread over `--users`
+# existing users (run generate_fixture first), each recorded in UserSession as
+# a login would, then times revoking the sessions of random users:
+#
+#   * through UserSession (myrg_users.sessions.delete_unexpired_sessions),
+#     with USER_SESSIONS['LEGACY_SCAN'] off and on;
+#   * with --scan, by decoding every session as was done before UserSession.
+#
+# Everything is rolled back afterwards, unless --keep is given.
+
+SESSION_AGE = datetime.timedelta(weeks=2)
+
+
+class Rollback(Exception):
+    pass
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def insert_sessions(user_ids, count, batch_size):
+    """Inserts `count` sessions and their UserSession rows, spread evenly over
+    `user_ids`.
+    """
+    expire_date = timezone.now() + SESSION_AGE
+    session_data = dict((user_id, SessionStore().encode({SESSION_KEY: user_id, BACKEND_SESSION_KEY: settings.AUTHENTICATION_BACKENDS[0]}))
+                        for user_id in user_ids)
+
+    for start in range(0, count, batch_size):
+        keys = [(uuid4().hex, user_ids[idx % len(user_ids)]) for idx in range(start, min(start + batch_size, count))]
+
+        Session.objects.bulk_create([Session(session_key=session_key, session_data=session_data[user_id], expire_date=expire_date)
+                                     for session_key, user_id in keys])
+        UserSession.objects.bulk_create([UserSession(session_key=session_key, user_id=user_id)
+                                         for session_key, user_id in keys])
+
+def time_revocations(users, legacy_scan):
+    """Returns ([seconds], [sessions deleted]) revoking each of `users`'
+    sessions.
+    """
+    options = dict(getattr(settings, "USER_SESSIONS", {}), LEGACY_SCAN=legacy_scan)
+    timings = []
+    counts = []
+
+    original = getattr(settings, "USER_SESSIONS", None)
+    settings.USER_SESSIONS = options
+
+    try:
+        for user in users:
+            started = time.time()
+            counts.append(delete_unexpired_sessions(user))
+            timings.append(time.time() - started)
+    finally:
+        if original is None:
+            del settings.USER_SESSIONS
+        else:
+            settings.USER_SESSIONS = original
+
+    return timings, counts
+
+
+class Command(BaseCommand):
+    help = "Times revoking a user's sessions among a large number of synthetic sessions."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--sessions", type="int", dest="sessions", default=1000000,
+                    help="Synthetic sessions to insert (default: 1000000)."),
+        make_option("--users", type="int", dest="users", default=10000,
+                    help="Users the sessions are spread over (default: 10000)."),
+        make_option("--revocations", type="int", dest="revocations", default=20,
+                    help="Users whose sessions are revoked per mode (default: 20)."),
+        make_option("--scan", action="store_true", dest="scan", default=False,
+                    help="Also time finding one user's sessions by decoding every session."),
+        make_option("--seed", type="int", dest="seed", default=0,
+                    help="Random seed (default: 0)."),
+        make_option("--batch-size", type="int", dest="batch_size", default=5000,
+                    help="Rows per bulk insert (default: 5000)."),
+        make_option("--keep", action="store_true", dest="keep", default=False,
+                    help="Keep the synthetic sessions instead of rolling back."),
+    )
+
+    def handle(self, *args, **options):
+        user_ids = list(RobogalsUser.objects.order_by("pk").values_list("pk", flat=True)[:options["users"]])
+
+        if len(user_ids) < 2 * options["revocations"] + 1:
+            raise CommandError("The database holds too few users; run generate_fixture first.")
+
+        rng = random.Random(options["seed"])
+
+        try:
+            with transaction.atomic():
+                started = time.time()
+                insert_sessions(user_ids, options["sessions"], options["batch_size"])
+                self.stdout.write("Inserted {} sessions for {} users in {:.1f} s".format(options["sessions"], len(user_ids), time.time() - started))
+
+                # Each user's sessions can only be revoked once
+                sampled = [RobogalsUser.objects.get(pk=user_id) for user_id in rng.sample(user_ids, 2 * options["revocations"] + 1)]
+
+                for label, users, legacy_scan in (("indexed", sampled[:options["revocations"]], False),
+                                                  ("indexed + legacy scan", sampled[options["revocations"]:-1], True)):
+                    timings, counts = time_revocations(users, legacy_scan)
+                    self.stdout.write("{:<24} median {:>10.3f} ms   max {:>10.3f} ms   {:.1f} sessions per user".format(
+                                          label, median(timings) * 1000, max(timings) * 1000, sum(counts) / float(len(counts))))
+
+                if options["scan"]:
+                    started = time.time()
+                    found = scan_session_keys(sampled[-1], Session.objects.filter(expire_date__gte=timezone.now()))
+                    self.stdout.write("{:<24} {:>17.3f} ms   {} sessions found".format("decoding every session", (time.time() - started) * 1000, len(found)))
+
+                if not options["keep"]:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write("Rolled back.")
@@ -0,0 +1,159 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import json
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+from myrg_core.querybudget import QueryRecorder, get_budget
+from myrg_core.search import search_indexes
+
+from .bench_routes import BODIES, SKIPPED, BenchContext, create_scratch_rows, disable_throttling, get_routes, make_client
+
+# Checks every API route and admin changelist against its query budget in
+# myrg_core/querybudget.py, on a database filled by `generate_fixture`.
+#
+# List routes are requested at each of `--page-sizes`, so that a budget which
+# holds for one page size but not another (a query per row) is caught.
+# Routes which fail with an error are reported, but only budget overruns and
+# missing budgets fail the check; such routes have not been measured, and
+# their budgets are estimates.
+
+
+def count_rows(response):
+    """Rows in an API response: the longest list in its top-level object."""
+    try:
+        data = json.loads(response.content.decode("utf-8"))
+    except ValueError:
+        return 0
+
+    if not isinstance(data, dict):
+        return 0
+
+    return max([len(value) for value in data.values() if isinstance(value, list)] or [0])
+
+def iter_api_checks(ctx, page_sizes):
+    """Yields (key, label, request function, rows function) for the API routes."""
+    bodies = dict((path, (method, body_factory)) for path, method, body_factory in BODIES)
+
+    for path in get_routes():
+        if path in SKIPPED or path not in bodies:
+            continue
+
+        method, body_factory = bodies[path]
+
+        if method == "GET":
+            yield path, path, lambda client, path=path: client.get(path), count_rows
+            continue
+
+        body = body_factory(ctx)
+
+        if "pagination" in body:
+            for page_size in page_sizes:
+                paged_body = dict(body, pagination={"page": 0, "length": page_size})
+
+                yield (path, "{} (length {})".format(path, page_size),
+                       lambda client, path=path, paged_body=paged_body: client.post(path, json.dumps(paged_body), content_type="application/json"),
+                       count_rows)
+        else:
+            yield (path, path,
+                   lambda client, path=path, body=body: client.post(path, json.dumps(body), content_type="application/json"),
+                   lambda response, body=body: max([len(value) for value in body.values() if isinstance(value, list)] or [1]))
+
+def iter_admin_checks():
+    """Yields (key, label, request function, rows function) for the admin
+    changelists of the project's own apps.
+    """
+    for model, model_admin in sorted(admin.site._registry.items(), key=lambda item: (item[0]._meta.app_label, item[0]._meta.object_name)):
+        opts = model._meta
+
+        if not opts.app_label.startswith("myrg_"):
+            continue
+
+        key = "admin:{}.{}".format(opts.app_label, opts.object_name.lower())
+        url = reverse("admin:{}_{}_changelist".format(opts.app_label, opts.object_name.lower()))
+
+        yield (key, key,
+               lambda client, url=url: client.get(url),
+               lambda response, model=model, model_admin=model_admin: min(model._default_manager.count(), model_admin.list_per_page))
+
+
+class Command(BaseCommand):
+    help = "Fails if any API route or admin changelist runs more queries than its budget in myrg_core/querybudget.py."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--page-sizes", dest="page_sizes", default="5,50",
+                    help="Comma separated page lengths list routes are checked at (default: 5,50)."),
+        make_option("--seed", type="int", dest="seed", default=0,
+                    help="Random seed for request bodies (default: 0)."),
+        make_option("--password", dest="password", default="fixture",
+                    help="Password given to generate_fixture (default: fixture)."),
+    )
+
+    def handle(self, *args, **options):
+        page_sizes = [int(page_size) for page_size in options["page_sizes"].split(",")]
+
+        disable_throttling()
+
+        ctx = BenchContext(options["seed"])
+        create_scratch_rows(ctx, 1)
+
+        # Looked up on first use otherwise, and charged to whichever route that is
+        for index in search_indexes.get_indexes():
+            index.has_table(connection)
+
+        client = make_client(options["password"])
+
+        # The first request after logging in also saves the session, which
+        # no other request does
+        client.get("/api/1.0/utils/time")
+
+        failures = 0
+        errors = 0
+
+        checks = list(iter_api_checks(ctx, page_sizes)) + list(iter_admin_checks())
+
+        for key, label, send, get_rows in checks:
+            try:
+                with QueryRecorder() as recorder:
+                    response = send(client)
+            except Exception as e:
+                errors += 1
+                self.stdout.write("ERROR   {}: {}: {}".format(label, type(e).__name__, e))
+                continue
+
+            if response.status_code >= 500:
+                errors += 1
+                self.stdout.write("ERROR   {}: status {}".format(label, response.status_code))
+                continue
+
+            rows = get_rows(response)
+            budget = get_budget(key, rows)
+            query_count = len(recorder.queries)
+
+            if budget is not None and query_count <= budget:
+                self.stdout.write("ok      {}: {} queries for {} rows (budget {})".format(label, query_count, rows, budget))
+                continue
+
+            failures += 1
+
+            if budget is None:
+                self.stdout.write("FAIL    {}: {} queries for {} rows, no budget declared".format(label, query_count, rows))
+            else:
+                self.stdout.write("FAIL    {}: {} queries for {} rows (budget {})".format(label, query_count, rows, budget))
+
+            for call_site, statements in recorder.group_by_call_site():
+                self.stdout.write("        {} query(s) from {}".format(len(statements), call_site))
+
+                for sql in statements:
+                    self.stdout.write("            {}".format(sql))
+
+        self.stdout.write("{} checks, {} over budget, {} errors".format(len(checks), failures, errors))
+
+        if failures:
+            raise CommandError("{} route(s) exceeded their query budget.".format(failures))
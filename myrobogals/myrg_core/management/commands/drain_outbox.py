@@ -0,0 +1,43 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from myrg_messages.outbox import drain, retry_dead_emails
+
+# Sends the emails queued by myrg_messages.functions.send_email (see
+# myrg_messages.outbox). Runs until interrupted (SIGINT or SIGTERM), letting
+# each sender finish the emails it has claimed, or with --once until no more
+# emails are due.
+
+
+class Command(BaseCommand):
+    help = "Sends queued emails, retrying failed ones with exponential backoff."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--workers", type="int", dest="workers", default=None,
+                    help="Concurrent senders (default: EMAIL_OUTBOX WORKERS)."),
+        make_option("--batch-size", type="int", dest="batch_size", default=None,
+                    help="Emails claimed by a sender at a time (default: EMAIL_OUTBOX BATCH_SIZE)."),
+        make_option("--once", action="store_true", dest="once", default=False,
+                    help="Exit once no more emails are due."),
+        make_option("--retry-dead", action="store_true", dest="retry_dead", default=False,
+                    help="First queue the emails which ran out of attempts again."),
+    )
+
+    def handle(self, *args, **options):
+        if options["retry_dead"]:
+            self.stdout.write("Queued {} dead email(s) again.".format(retry_dead_emails()))
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        counts = drain(workers=options["workers"], batch_size=options["batch_size"], once=options["once"], stop=stop)
+
+        if int(options["verbosity"]) > 0:
+            self.stdout.write("{sent} sent, {retried} to be retried, {dead} dead.".format(**counts))
@@ -0,0 +1,180 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import datetime
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from myrg_core.models import APILog
+from myrg_groups.models import Role
+from myrg_groups.rolecache import active_role_q
+from myrg_groups.views import group_lists, role_list
+from myrg_messages.models import EmailMessage
+from myrg_permissions.models import PermissionList
+from myrg_permissions.views import permission_list
+from myrg_repo.views import repocontainer_list
+from myrg_users.models import RobogalsUser
+from myrg_users.views import user_list
+
+# EXPLAIN report for the hot list and permission queries.
+#
+# Prints, for each query, whether the database plans a full table scan, its
+# plan and its median latency. With --output the report is also written as
+# JSON; giving an earlier report as --baseline shows how each query's plan and
+# latency changed, e.g. before and after `sync_indexes` on a generate_fixture
+# database.
+
+EXPLAIN_PREFIXES = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+    "mysql": "EXPLAIN ",
+}
+
+
+def list_query(spec, body):
+    """The page query `spec` runs for a list request with `body`."""
+    plan, query, pagination, requested_fields = spec.prepare(body)
+    return query[pagination.start:pagination.end]
+
+def get_queries():
+    """Returns [(label, queryset)] of the queries to explain."""
+    now = timezone.now()
+    user_id = RobogalsUser.objects.filter(is_active=True).values_list("pk", flat=True)[:1]
+
+    if not user_id:
+        raise CommandError("The database holds no users; run generate_fixture first.")
+
+    return [
+        ("users list by username", list_query(user_list, {
+            "query": [{"field": "username", "order": "a"}, {"field": "given_name"}, {"field": "family_name"}],
+            "pagination": {"page": 10, "length": 50},
+        })),
+        ("chapters list by name", list_query(group_lists["chapters"], {
+            "query": [{"field": "name", "order": "a"}, {"field": "status"}],
+            "pagination": {"page": 0, "length": 50},
+        })),
+        ("general groups list by name", list_query(group_lists["general"], {
+            "query": [{"field": "name", "order": "a"}, {"field": "status"}],
+            "pagination": {"page": 0, "length": 50},
+        })),
+        ("roles list by start date", list_query(role_list, {
+            "query": [{"field": "user"}, {"field": "group"}, {"field": "date_start", "order": "d"}],
+            "pagination": {"page": 0, "length": 50},
+        })),
+        ("repo containers list", list_query(repocontainer_list, {
+            "query": [{"field": "title"}, {"field": "date_created", "order": "d"}],
+            "pagination": {"page": 0, "length": 50},
+        })),
+        ("permissions list", list_query(permission_list, {
+            "query": [{"field": "permission", "order": "a"}, {"field": "role_classes"}],
+            "pagination": {"page": 0, "length": 50},
+        })),
+        ("permission lookup", PermissionList.objects.filter(permission="USER_SELF_VIEW").values_list("role_classes", flat=True)),
+        ("active roles of a user", Role.objects.filter(active_role_q(now), user_id=user_id[0])),
+        ("api logs to archive", APILog.objects.filter(date__lt=now - datetime.timedelta(days=90))
+                                              .order_by("date", "id")
+                                              .values_list("id", flat=True)[:1000]),
+        ("email message by service id", EmailMessage.objects.filter(service_id="0123456789abcdef")),
+    ]
+
+def explain(queryset):
+    """Returns (uses indexes, plan lines) for `queryset`; a query uses indexes
+    when its plan has no full table scan.
+    """
+    sql, params = queryset.query.sql_with_params()
+
+    cursor = connection.cursor()
+    cursor.execute(EXPLAIN_PREFIXES[connection.vendor] + sql, params)
+    rows = cursor.fetchall()
+
+    if connection.vendor == "sqlite":
+        # (id, parent, notused, detail)
+        lines = [row[-1] for row in rows]
+        uses_index = not any(line.startswith("SCAN") and " USING " not in line for line in lines)
+    elif connection.vendor == "postgresql":
+        lines = [row[0] for row in rows]
+        uses_index = not any("Seq Scan" in line for line in lines)
+    else:
+        # (id, select_type, table, [partitions,] type, possible_keys, key, ...)
+        columns = [column[0].lower() for column in cursor.description]
+        lines = [" ".join("{}={}".format(column, value) for column, value in zip(columns, row)) for row in rows]
+        uses_index = not any(row[columns.index("type")] == "ALL" for row in rows)
+
+    return uses_index, lines
+
+def time_query(queryset, iterations):
+    """Returns the median time, in seconds, to run `queryset`."""
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    timings = []
+
+    for idx in range(iterations):
+        started = time.time()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.time() - started)
+
+    timings.sort()
+
+    return timings[len(timings) // 2]
+
+
+class Command(BaseCommand):
+    help = "Reports which hot list and permission queries scan whole tables, and their latency."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--iterations", type="int", dest="iterations", default=20,
+                    help="Executions per query, of which the median is reported (default: 20)."),
+        make_option("--output", dest="output", default=None,
+                    help="Also write the report as JSON to this path."),
+        make_option("--baseline", dest="baseline", default=None,
+                    help="A report written earlier with --output to compare against."),
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN_PREFIXES:
+            raise CommandError("EXPLAIN is not supported on {}.".format(connection.vendor))
+
+        baseline = {}
+
+        if options["baseline"]:
+            with io.open(options["baseline"], encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)["queries"]
+
+        report = {"vendor": connection.vendor, "queries": {}}
+
+        for label, queryset in get_queries():
+            uses_index, plan = explain(queryset)
+            median_ms = round(time_query(queryset, options["iterations"]) * 1000, 3)
+
+            report["queries"][label] = {
+                "index": uses_index,
+                "plan": plan,
+                "median_ms": median_ms,
+            }
+
+            line = "{:<30} {:<9} {:>9.3f} ms".format(label, "index" if uses_index else "full scan", median_ms)
+
+            if label in baseline:
+                before = baseline[label]
+                line += "   was {:<9} {:>9.3f} ms ({:+.0f}%)".format("index" if before["index"] else "full scan",
+                                                                    before["median_ms"],
+                                                                    (median_ms / before["median_ms"] - 1) * 100 if before["median_ms"] else 0)
+
+            self.stdout.write(line)
+
+            if int(options["verbosity"]) > 1:
+                for plan_line in plan:
+                    self.stdout.write("    {}".format(plan_line))
+
+        if options["output"]:
+            with io.open(options["output"], "w", encoding="utf-8") as report_file:
+                report_file.write(str(json.dumps(report, indent=2, sort_keys=True)))
+                report_file.write("\n")
@@ -0,0 +1,382 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import datetime
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from myrg_activities.models import Activity, Participant
+from myrg_core.models import APILog
+from myrg_core.search import search_indexes
+from myrg_groups.models import Group, Chapter, School, Company, RoleClass, Role
+from myrg_permissions.models import PermissionList
+from myrg_repo.models import RepoContainer, RepoFile
+from myrg_users.models import RobogalsUser
+
+# Synthetic dataset for load testing.
+#
+# Row counts are given for `--scale 1` and scale linearly. All values are drawn
+# from a random.Random seeded with `--seed`, so the same scale and seed always
+# give the same rows; dates are offsets from the time of generation.
+#
+# Every fixture user has the password given by `--password`. The user
+# "fixture-admin" (fixture-admin@example.com) also holds a role of the first
+# role class on the root group, for use by `bench_routes`.
+
+ADMIN_USERNAME = "fixture-admin"
+ADMIN_EMAIL = "fixture-admin@example.com"
+ADMIN_ROLE_ID = "fixtureadmin"
+
+COUNTS = {
+    "users": 100000,
+    "regions": 20,
+    "chapters": 1000,
+    "schools": 2000,
+    "companies": 500,
+    "repo_containers": 10000,
+    "activities": 5000,
+    "api_logs": 200000,
+}
+
+ROLE_CLASSES = (
+    "Superadmin",
+    "Global Executive",
+    "Regional Manager",
+    "Chapter President",
+    "Chapter Executive",
+    "Workshop Coordinator",
+    "Volunteer",
+    "Member",
+)
+
+PERMISSIONS = (
+    "USER_SELF_VIEW", "USER_SELF_EDIT", "USER_ALL_VIEW", "USER_ALL_EDIT", "USER_ALL_CREATE", "USER_ALL_DELETE",
+    "GROUP_ALL_VIEW", "GROUP_ALL_EDIT", "GROUP_ALL_CREATE", "GROUP_ALL_DELETE",
+    "ROLE_ALL_VIEW", "ROLE_ALL_EDIT", "ROLE_ALL_CREATE",
+    "ROLECLASS_ALL_VIEW", "ROLECLASS_ALL_EDIT", "ROLECLASS_ALL_CREATE", "ROLECLASS_ALL_DELETE",
+    "REPO_ALL_VIEW", "REPO_ALL_EDIT", "REPO_ALL_CREATE", "REPO_ALL_DELETE",
+    "PERMISSION_ALL_VIEW", "PERMISSION_ALL_EDIT", "PERMISSION_ALL_CREATE", "PERMISSION_ALL_DELETE",
+    "MESSAGE_ALL_SEND",
+)
+
+GIVEN_NAMES = ("Ada", "Grace", "Marie", "Rosalind", "Hedy", "Katherine", "Mae", "Radia", "Barbara", "Frances",
+               "Shafi", "Lise", "Emmy", "Chien-Shiung", "Dorothy", "Jocelyn", "Mary", "Annie", "Edith", "Valentina")
+FAMILY_NAMES = ("Lovelace", "Hopper", "Curie", "Franklin", "Lamarr", "Johnson", "Jemison", "Perlman", "Liskov", "Allen",
+                "Goldwasser", "Meitner", "Noether", "Wu", "Hodgkin", "Bell", "Jackson", "Easley", "Clarke", "Tereshkova")
+CITIES = (
+    # (city, state, country, timezone, latitude, longitude)
+    ("Melbourne", "VIC", "Australia", "Australia/Melbourne", -37.81, 144.96),
+    ("Sydney", "NSW", "Australia", "Australia/Sydney", -33.87, 151.21),
+    ("Brisbane", "QLD", "Australia", "Australia/Brisbane", -27.47, 153.03),
+    ("London", "", "United Kingdom", "Europe/London", 51.51, -0.13),
+    ("Edinburgh", "", "United Kingdom", "Europe/London", 55.95, -3.19),
+    ("Tokyo", "", "Japan", "Asia/Tokyo", 35.68, 139.69),
+    ("Boston", "MA", "United States", "America/New_York", 42.36, -71.06),
+    ("San Francisco", "CA", "United States", "America/Los_Angeles", 37.77, -122.42),
+    ("Cape Town", "", "South Africa", "Africa/Johannesburg", -33.92, 18.42),
+    ("Auckland", "", "New Zealand", "Pacific/Auckland", -36.85, 174.76),
+)
+WORDS = ("robot", "workshop", "outreach", "school", "engineering", "science", "girls", "program", "volunteer",
+         "training", "lego", "arduino", "career", "mentor", "coding", "sensor", "motor", "design", "team", "event")
+API_URLS = ("/api/1.0/users/list", "/api/1.0/groups/list", "/api/1.0/self/whoami", "/api/1.0/self/roles",
+            "/api/1.0/roles/list", "/api/1.0/roleclasses/list", "/api/1.0/repocontainers/list", "/api/1.0/users/edit")
+
+
+def scaled(name, scale):
+    return max(1, int(COUNTS[name] * scale))
+
+def random_id(rng):
+    return "{:032x}".format(rng.getrandbits(128))
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for idx in range(words))
+
+def random_past(rng, now, max_days):
+    return now - datetime.timedelta(seconds=rng.randint(0, max_days * 86400))
+
+def bulk_insert(model, objects, batch_size):
+    """bulk_creates the (possibly generated) `objects`, `batch_size` at a
+    time. Returns the number of rows inserted.
+    """
+    batch = []
+    inserted = 0
+
+    for obj in objects:
+        batch.append(obj)
+
+        if len(batch) >= batch_size:
+            model._default_manager.bulk_create(batch)
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        model._default_manager.bulk_create(batch)
+        inserted += len(batch)
+
+    return inserted
+
+
+
+################################################################################
+# Generators
+################################################################################
+def iter_users(rng, user_ids, password, now):
+    languages = [code for code, name in settings.LANGUAGES]
+
+    for idx, user_id in enumerate(user_ids):
+        given_name = rng.choice(GIVEN_NAMES)
+        family_name = rng.choice(FAMILY_NAMES)
+
+        yield RobogalsUser(id=user_id,
+                           username="fixture{:07d}".format(idx),
+                           primary_email="fixture{:07d}@example.com".format(idx),
+                           given_name=given_name,
+                           family_name=family_name,
+                           preferred_name=given_name if rng.random() < 0.8 else "",
+                           dob=(now - datetime.timedelta(days=rng.randint(16 * 365, 60 * 365))).date() if rng.random() < 0.7 else None,
+                           gender=rng.choice(("X", "F", "F", "F", "M")),
+                           preferred_language=rng.choice(languages),
+                           mobile="614{:08d}".format(rng.randint(0, 99999999)) if rng.random() < 0.6 else "",
+                           postcode="{:04d}".format(rng.randint(200, 9999)),
+                           is_active=rng.random() < 0.97,
+                           date_joined=random_past(rng, now, 5 * 365),
+                           password=password)
+
+def create_groups(rng, counts, creator_id, now, stdout=None):
+    """Creates the group hierarchy: one root group, regions under it, chapters
+    under the regions, and schools and companies under the chapters.
+
+    Inherited models cannot be bulk created, so groups are saved one by one.
+    Returns {type: [group ids]}.
+    """
+    def locatable(model, name, parent, **extra):
+        city, state, country, tz, latitude, longitude = rng.choice(CITIES)
+
+        group = model(name=name,
+                      creator_id=creator_id,
+                      parent=parent,
+                      description=random_text(rng, rng.randint(20, 200)),
+                      status=rng.choice((2, 3, 4, 7, 8, 9, 9, 9)),
+                      date_created=random_past(rng, now, 5 * 365),
+                      address="{} {} Street".format(rng.randint(1, 999), rng.choice(FAMILY_NAMES)),
+                      city=city,
+                      state=state,
+                      postcode="{:04d}".format(rng.randint(200, 9999)),
+                      country=country,
+                      latitude=latitude + rng.uniform(-0.5, 0.5),
+                      longitude=longitude + rng.uniform(-0.5, 0.5),
+                      timezone=tz,
+                      **extra)
+        group.save()
+        return group
+
+    root = Group.objects.create(name="Robogals Global", creator_id=creator_id, status=9, date_created=now)
+
+    regions = []
+
+    for idx in range(counts["regions"]):
+        regions.append(Group.objects.create(name="Region {}".format(idx),
+                                            creator_id=creator_id,
+                                            parent=root,
+                                            description=random_text(rng, 50),
+                                            status=9,
+                                            date_created=random_past(rng, now, 5 * 365)))
+
+    if stdout is not None:
+        stdout.write("  {} chapters, {} schools, {} companies".format(counts["chapters"], counts["schools"], counts["companies"]))
+
+    chapters = [locatable(Chapter, "Robogals Chapter {}".format(idx), rng.choice(regions), university="University {}".format(idx))
+                for idx in range(counts["chapters"])]
+    schools = [locatable(School, "School {}".format(idx), rng.choice(chapters))
+               for idx in range(counts["schools"])]
+    companies = [locatable(Company, "Company {}".format(idx), rng.choice(chapters), legal_name="Company {} Pty Ltd".format(idx))
+                 for idx in range(counts["companies"])]
+
+    return {
+        "root": [root.pk],
+        "regions": [group.pk for group in regions],
+        "chapters": [group.pk for group in chapters],
+        "schools": [group.pk for group in schools],
+        "companies": [group.pk for group in companies],
+    }
+
+def iter_roles(rng, user_ids, role_class_ids, group_ids, now, role_ids):
+    """Every user is a member of a chapter, and one in ten also holds another
+    role. Some roles have ended and some have not started yet.
+    """
+    member_class_id = role_class_ids[-1]
+
+    for user_id in user_ids:
+        role_count = 2 if rng.random() < 0.1 else 1
+
+        for idx in range(role_count):
+            date_start = random_past(rng, now, 3 * 365)
+            date_end = None
+            dice = rng.random()
+
+            if dice < 0.15:
+                date_end = date_start + datetime.timedelta(days=rng.randint(1, 365))
+
+                if date_end > now:
+                    date_end = now - datetime.timedelta(days=1)
+            elif dice < 0.2:
+                date_start = now + datetime.timedelta(days=rng.randint(1, 90))
+
+            role_id = random_id(rng)
+            role_ids.append(role_id)
+
+            yield Role(id=role_id,
+                       user_id=user_id,
+                       role_class_id=member_class_id if idx == 0 else rng.choice(role_class_ids[1:-1]),
+                       group_id=rng.choice(group_ids["chapters"]),
+                       date_start=date_start,
+                       date_end=date_end)
+
+def iter_permission_lists(rng, role_class_ids):
+    for permission in PERMISSIONS:
+        yield PermissionList(permission=permission,
+                             role_classes=",".join(str(pk) for pk in sorted(rng.sample(role_class_ids, rng.randint(1, len(role_class_ids))))))
+
+def iter_repo_containers(rng, count, user_ids, role_ids, container_ids, now):
+    for idx in range(count):
+        container_id = random_id(rng)
+        container_ids.append(container_id)
+        date_created = random_past(rng, now, 3 * 365)
+
+        yield RepoContainer(id=container_id,
+                            user_id=rng.choice(user_ids),
+                            role_id=rng.choice(role_ids),
+                            title=random_text(rng, 4)[:63],
+                            body=random_text(rng, rng.randint(50, 1000)),
+                            tags=",".join(rng.sample(WORDS, 3)),
+                            service=rng.choice((10, 20, 50, 99, 99)),
+                            date_created=date_created,
+                            date_updated=date_created)
+
+def iter_repo_files(rng, container_ids):
+    for container_id in container_ids:
+        for idx in range(rng.randint(0, 4)):
+            name = "{}-{}.pdf".format(rng.choice(WORDS), idx)
+            yield RepoFile(name=name,
+                           file="repo-files/{}/{}".format(container_id, name),
+                           container_id=container_id)
+
+def iter_activities(rng, count, role_ids, activity_ids, now):
+    for idx in range(count):
+        activity_id = random_id(rng)
+        activity_ids.append(activity_id)
+
+        date_activity_start = now + datetime.timedelta(days=rng.randint(-720, 120), hours=rng.randint(8, 16))
+
+        yield Activity(id=activity_id,
+                       name="{} workshop {}".format(rng.choice(WORDS).capitalize(), idx),
+                       description=random_text(rng, rng.randint(20, 300)),
+                       location="{} {} Street".format(rng.randint(1, 999), rng.choice(FAMILY_NAMES)),
+                       status=rng.choice((1, 2, 4, 7, 9, 9)),
+                       creator_role_id=rng.choice(role_ids),
+                       date_created=date_activity_start - datetime.timedelta(days=60),
+                       date_rsvp_open=date_activity_start - datetime.timedelta(days=30),
+                       date_rsvp_close=date_activity_start - datetime.timedelta(days=2),
+                       date_activity_start=date_activity_start,
+                       date_activity_end=date_activity_start + datetime.timedelta(hours=rng.randint(1, 6)),
+                       currency=rng.choice(("AUD", "GBP", "JPY", "USD", "XXX")),
+                       tax_rate=rng.choice((0.0, 0.1, 0.2)))
+
+def iter_participants(rng, activity_ids, role_ids):
+    for activity_id in activity_ids:
+        for role_id in rng.sample(role_ids, min(len(role_ids), rng.randint(2, 20))):
+            yield Participant(id=random_id(rng),
+                              activity_id=activity_id,
+                              user_role_id=role_id,
+                              status=rng.choice((0, 1, 9, 9)),
+                              response=random_text(rng, rng.randint(0, 20)))
+
+def iter_api_logs(rng, count, role_ids, now):
+    for idx in range(count):
+        api_url = rng.choice(API_URLS)
+
+        yield APILog(user_role_id=rng.choice(role_ids) if rng.random() < 0.9 else None,
+                     ip="10.{}.{}.{}".format(rng.randint(0, 255), rng.randint(0, 255), rng.randint(1, 254)),
+                     api_url=api_url,
+                     api_body="{{\"query\": [{{\"field\": \"{}\"}}], \"pagination\": {{\"page\": {}, \"length\": 50}}}}".format(rng.choice(WORDS), rng.randint(0, 20)),
+                     date=random_past(rng, now, 180))
+
+
+class Command(BaseCommand):
+    help = "Generates a deterministic synthetic dataset for load testing. Use an empty database."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--scale", type="float", dest="scale", default=1.0,
+                    help="Multiplier for the row counts; 1 gives 100000 users (default: 1)."),
+        make_option("--seed", type="int", dest="seed", default=0,
+                    help="Random seed (default: 0)."),
+        make_option("--password", dest="password", default="fixture",
+                    help="Password of every fixture user (default: fixture)."),
+        make_option("--batch-size", type="int", dest="batch_size", default=1000,
+                    help="Rows per bulk insert (default: 1000)."),
+    )
+
+    def handle(self, *args, **options):
+        if RobogalsUser.objects.filter(username=ADMIN_USERNAME).exists():
+            raise CommandError("A fixture already exists in this database.")
+
+        rng = random.Random(options["seed"])
+        now = timezone.now()
+        batch_size = options["batch_size"]
+        counts = dict((name, scaled(name, options["scale"])) for name in COUNTS)
+        verbose = int(options["verbosity"]) > 0
+        stdout = self.stdout if verbose else None
+
+        def progress(message):
+            if verbose:
+                self.stdout.write(message)
+
+        # One hash for every user, as hashing 100k passwords would take hours
+        password = make_password(options["password"])
+
+        with transaction.atomic():
+            progress("Users...")
+            admin = RobogalsUser.objects.create_superuser(ADMIN_USERNAME, ADMIN_EMAIL, "Fixture", options["password"])
+            user_ids = [random_id(rng) for idx in range(counts["users"])]
+            bulk_insert(RobogalsUser, iter_users(rng, user_ids, password, now), batch_size)
+
+            progress("Groups...")
+            group_ids = create_groups(rng, counts, admin.pk, now, stdout)
+
+            progress("Role classes and roles...")
+            role_class_ids = [RoleClass.objects.create(name=name, description="{} role".format(name)).pk for name in ROLE_CLASSES]
+            Role.objects.create(id=ADMIN_ROLE_ID, user=admin, role_class_id=role_class_ids[0], group_id=group_ids["root"][0],
+                                date_start=now - datetime.timedelta(days=1))
+            role_ids = []
+            bulk_insert(Role, iter_roles(rng, user_ids, role_class_ids, group_ids, now, role_ids), batch_size)
+
+            progress("Permission lists...")
+            bulk_insert(PermissionList, iter_permission_lists(rng, role_class_ids), batch_size)
+
+            progress("Repository containers and files...")
+            container_ids = []
+            bulk_insert(RepoContainer, iter_repo_containers(rng, counts["repo_containers"], user_ids, role_ids, container_ids, now), batch_size)
+            bulk_insert(RepoFile, iter_repo_files(rng, container_ids), batch_size)
+
+            progress("Activities and participants...")
+            activity_ids = []
+            bulk_insert(Activity, iter_activities(rng, counts["activities"], role_ids, activity_ids, now), batch_size)
+            bulk_insert(Participant, iter_participants(rng, activity_ids, role_ids), batch_size)
+
+            progress("API logs...")
+            bulk_insert(APILog, iter_api_logs(rng, counts["api_logs"], role_ids, now), batch_size)
+
+            # bulk_create does not send the signals which keep the indexes up
+            # to date
+            progress("Search indexes...")
+            for index in search_indexes.get_indexes():
+                index.rebuild(batch_size)
+
+        progress("Done.")
@@ -0,0 +1,49 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+from future.utils import native_str
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from myrg_messages.standin import StandInServer
+
+# Serves the Mandrill stand-in (see myrg_messages.standin) until interrupted.
+# Point the outbox at it with
+#
+#   EMAIL_TRANSPORT = {'BACKEND': 'http', 'URL': 'http://<host>:<port>/api/1.0/'}
+
+
+class Command(BaseCommand):
+    help = "Serves a local stand-in for Mandrill's messages/send call, for load testing."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--host", dest="host", default="127.0.0.1",
+                    help="Address to listen on (default: 127.0.0.1)."),
+        make_option("--port", type="int", dest="port", default=8025,
+                    help="Port to listen on (default: 8025)."),
+        make_option("--latency", type="float", dest="latency", default=50,
+                    help="Milliseconds each call takes (default: 50)."),
+        make_option("--failure-rate", type="float", dest="failure_rate", default=0.0,
+                    help="Fraction of calls failing with a GeneralError (default: 0)."),
+        make_option("--seed", type="int", dest="seed", default=None,
+                    help="Random seed for failures."),
+    )
+
+    def handle(self, *args, **options):
+        server = StandInServer((native_str(options["host"]), options["port"]),
+                               latency=options["latency"] / 1000.0,
+                               failure_rate=options["failure_rate"],
+                               seed=options["seed"],
+                               verbose=int(options["verbosity"]) > 1)
+
+        self.stdout.write("Mandrill stand-in at http://{}:{}/api/1.0/".format(options["host"], server.server_port))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write("{received} call(s), {failed} failed.".format(**server.counts))
@@ -0,0 +1,43 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myrg_core.search import search_indexes
+
+# Rebuilds the full-text search shadow tables (see myrg_core.search) from the
+# models, e.g. after deploying search on an existing database or after rows
+# were inserted without signals. Names the indexes to rebuild, or rebuilds all
+# of them.
+
+
+class Command(BaseCommand):
+    args = "[index name ...]"
+    help = "Rebuilds the full-text search indexes from the models."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--batch-size", type="int", dest="batch_size", default=None,
+                    help="Objects read per query (default: SEARCH['REBUILD_BATCH_SIZE'])."),
+    )
+
+    def handle(self, *names, **options):
+        indexes = search_indexes.get_indexes()
+
+        if names:
+            unknown_names = set(names) - set(index.name for index in indexes)
+
+            if unknown_names:
+                raise CommandError("Unknown search index(es): {}".format(", ".join(sorted(unknown_names))))
+
+            indexes = [index for index in indexes if index.name in names]
+
+        for index in indexes:
+            with transaction.atomic():
+                count = index.rebuild(options["batch_size"])
+
+            if int(options["verbosity"]) > 0:
+                self.stdout.write("{}: {} objects indexed".format(index.name, count))
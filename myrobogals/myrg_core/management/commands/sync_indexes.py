@@ -0,0 +1,169 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from optparse import make_option
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import get_model, get_models
+
+from myrg_core.search import search_indexes
+
+# Brings an existing database's indexes in line with the models.
+#
+# syncdb only creates indexes along with their tables, so the `db_index`
+# fields and `index_together` declared on the models since a database was
+# created are missing from it. This creates every index Django would have
+# created for the project's models which the database does not have yet, and
+# is safe to run repeatedly. Tables which gain indexes are analyzed
+# afterwards, so that the planner has statistics to choose them by.
+#
+# Columns listed in COLUMN_CHANGES are also altered to their model's type
+# first, where the backend can (SQLite does not enforce column lengths, so it
+# is left alone there).
+#
+# Missing full-text search shadow tables (see myrg_core.search) are created
+# as well, empty; `rebuild_search_index` fills them.
+
+# (app_label, model name, field name)
+COLUMN_CHANGES = (
+    # TextField -> indexed CharField(255)
+    ("myrg_permissions", "PermissionList", "permission"),
+)
+
+EXISTING_INDEXES_SQL = {
+    "sqlite": "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+    "postgresql": "SELECT indexname FROM pg_indexes WHERE tablename = %s",
+    "mysql": "SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s",
+}
+
+ALTER_COLUMN_SQL = {
+    "postgresql": "ALTER TABLE {table} ALTER COLUMN {column} TYPE {type}",
+    "mysql": "ALTER TABLE {table} MODIFY {column} {type} NOT NULL",
+}
+
+ANALYZE_SQL = {
+    "sqlite": "ANALYZE {table}",
+    "postgresql": "ANALYZE {table}",
+    "mysql": "ANALYZE TABLE {table}",
+}
+
+INDEX_NAME_RE = re.compile(r'^CREATE (?:UNIQUE )?INDEX [`"]?([^`"\s]+)[`"]?', re.IGNORECASE)
+
+
+def get_existing_indexes(connection, table):
+    if connection.vendor not in EXISTING_INDEXES_SQL:
+        raise CommandError("Listing indexes is not supported on {}.".format(connection.vendor))
+
+    cursor = connection.cursor()
+    cursor.execute(EXISTING_INDEXES_SQL[connection.vendor], [table])
+
+    return set(row[0] for row in cursor.fetchall())
+
+def get_missing_index_statements(connection, models):
+    """Returns (table, CREATE INDEX statement) for the indexes of `models`
+    that the database lacks.
+    """
+    statements = []
+
+    for model in models:
+        existing_indexes = None
+
+        for statement in connection.creation.sql_indexes_for_model(model, no_style()):
+            if existing_indexes is None:
+                existing_indexes = get_existing_indexes(connection, model._meta.db_table)
+
+            match = INDEX_NAME_RE.match(statement)
+
+            if match is None or match.group(1) not in existing_indexes:
+                statements.append((model._meta.db_table, statement))
+
+    return statements
+
+def get_column_change_statements(connection):
+    """Returns the ALTER TABLE statements for COLUMN_CHANGES columns whose type
+    in the database is not yet their model's.
+    """
+    if connection.vendor not in ALTER_COLUMN_SQL:
+        return []
+
+    statements = []
+    cursor = connection.cursor()
+    qn = connection.ops.quote_name
+
+    for app_label, model_name, field_name in COLUMN_CHANGES:
+        model = get_model(app_label, model_name)
+        field = model._meta.get_field(field_name)
+
+        for column in connection.introspection.get_table_description(cursor, model._meta.db_table):
+            if column.name != field.column:
+                continue
+
+            if connection.introspection.get_field_type(column.type_code, column) != field.get_internal_type():
+                statements.append(ALTER_COLUMN_SQL[connection.vendor].format(table=qn(model._meta.db_table),
+                                                                             column=qn(field.column),
+                                                                             type=field.db_type(connection)))
+
+    return statements
+
+def get_missing_search_table_statements(connection):
+    """Returns (index name, CREATE statements) for the search indexes whose
+    shadow table the database lacks.
+    """
+    table_names = connection.introspection.table_names()
+
+    return [(index.name, index.get_create_statements(connection))
+            for index in search_indexes.get_indexes()
+            if index.table not in table_names and index.get_create_statements(connection)]
+
+
+class Command(BaseCommand):
+    help = "Creates the model indexes an existing database is missing."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--database", dest="database", default=DEFAULT_DB_ALIAS,
+                    help="Database to update (default: default)."),
+        make_option("--sql", action="store_true", dest="sql", default=False,
+                    help="Print the statements instead of running them."),
+    )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+
+        models = [model for model in get_models(include_auto_created=True)
+                  if model._meta.app_label.startswith("myrg_")]
+
+        index_statements = get_missing_index_statements(connection, models)
+        search_table_statements = get_missing_search_table_statements(connection)
+        statements = (get_column_change_statements(connection) +
+                      [statement for table, statement in index_statements] +
+                      [statement for name, create_statements in search_table_statements for statement in create_statements])
+
+        if connection.vendor in ANALYZE_SQL:
+            for table in sorted(set(table for table, statement in index_statements)):
+                statements.append(ANALYZE_SQL[connection.vendor].format(table=connection.ops.quote_name(table)))
+
+        if options["sql"]:
+            for statement in statements:
+                self.stdout.write("{};".format(statement.rstrip(";")))
+            return
+
+        if not statements:
+            self.stdout.write("All indexes are present.")
+            return
+
+        with transaction.atomic(using=options["database"]):
+            cursor = connection.cursor()
+
+            for statement in statements:
+                self.stdout.write(statement)
+                cursor.execute(statement)
+
+        self.stdout.write("Ran {} statement(s).".format(len(statements)))
+
+        if search_table_statements:
+            self.stdout.write("Created the search table(s) of {}; run rebuild_search_index to fill them.".format(
+                                  ", ".join(name for name, create_statements in search_table_statements)))
@@ -0,0 +1,413 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import errno
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+# Per-route request metrics.
+#
+# Every request records its wall time, database query count and time, request
+# and response sizes and status code against the URL pattern that served it.
+# Values are aggregated into fixed-bucket histograms held in memory by each
+# worker process:
+#
+#   * RobogalsAPIView measures its own requests (see myrg_core.classes).
+#   * MetricsMiddleware measures every other view.
+#
+# `api/1.0/utils/metrics` renders the histograms in the Prometheus text format.
+# For multi-process WSGI deployments, set `SNAPSHOT_DIR` to a directory shared
+# by the workers (on one host); each worker periodically writes its totals
+# there as `metrics-<pid>.json` and the endpoint merges all snapshots. The
+# snapshots of workers which have exited are deleted as they are found, so a
+# restarted worker's counts start again from zero.
+#
+# The endpoint answers only clients in `ALLOWED_IPS`, as resolved by
+# myrg_core.functions.get_remote_ip (see TRUSTED_PROXIES).
+#
+# Refer to METRICS in myrg_core/settings.py
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SNAPSHOT_DIR": None,
+    "SNAPSHOT_INTERVAL": 10,
+    "ALLOWED_IPS": ("127.0.0.1",),
+}
+
+# Bucket upper bounds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = (
+    # (name, buckets, help)
+    ("myrg_request_duration_seconds", DURATION_BUCKETS, "Wall time spent handling the request."),
+    ("myrg_request_db_queries", QUERY_COUNT_BUCKETS, "Database queries issued by the request."),
+    ("myrg_request_db_duration_seconds", DURATION_BUCKETS, "Time spent in database queries by the request."),
+    ("myrg_request_size_bytes", SIZE_BUCKETS, "Size of the request body."),
+    ("myrg_response_size_bytes", SIZE_BUCKETS, "Size of the response body."),
+)
+
+REQUEST_COUNTER = "myrg_requests_total"
+
+
+def get_metrics_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "METRICS", {}))
+    return options
+
+
+
+################################################################################
+# Query counting
+################################################################################
+class QueryCounter(object):
+    """Counts the queries run on the current thread's connections to every
+    database (the default one, replicas...) within the block.
+
+    Uses Django's debug cursor, so queries are counted regardless of DEBUG.
+    Queries recorded while counting are discarded afterwards unless DEBUG is
+    on, so that `connection.queries` does not grow without bound, or something
+    else (e.g. CaptureQueriesContext) was already recording them.
+    """
+    _local = threading.local()
+
+    def __enter__(self):
+        depth = getattr(self._local, "depth", 0)
+
+        self.connections = connections.all()
+
+        if depth == 0:
+            # [(use_debug_cursor, start index)] of each connection
+            self._local.saved = [(conn.use_debug_cursor, len(conn.queries)) for conn in self.connections]
+
+            for conn in self.connections:
+                conn.use_debug_cursor = True
+
+        self._local.depth = depth + 1
+        self.start_indexes = [len(conn.queries) for conn in self.connections]
+        self.count = 0
+        self.time = 0.0
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        queries = []
+
+        for conn, start_index in zip(self.connections, self.start_indexes):
+            queries.extend(conn.queries[start_index:])
+
+        self.count = len(queries)
+        self.time = sum(float(query.get("time") or 0) for query in queries)
+
+        self._local.depth -= 1
+
+        if self._local.depth == 0:
+            for conn, (use_debug_cursor, start_index) in zip(self.connections, self._local.saved):
+                conn.use_debug_cursor = use_debug_cursor
+
+                if not settings.DEBUG and not use_debug_cursor:
+                    del conn.queries[start_index:]
+
+        return False
+
+
+
+################################################################################
+# Aggregation
+################################################################################
+class MetricsRegistry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # {(name, route, method): [bucket counts..., sum, count]}
+            self.histograms = {}
+            # {(route, method, status): count}
+            self.requests = {}
+            self.last_snapshot = time.time()
+
+    def observe(self, name, buckets, labels, value):
+        key = (name,) + labels
+
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(buckets) + 2)
+
+        for idx, upper_bound in enumerate(buckets):
+            if value <= upper_bound:
+                histogram[idx] += 1
+                break
+
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def record(self, route, method, status, duration, query_count, db_time, request_size, response_size):
+        labels = (route, method)
+
+        with self.lock:
+            for (name, buckets, help_text), value in zip(HISTOGRAMS, (duration, query_count, db_time, request_size, response_size)):
+                self.observe(name, buckets, labels, value)
+
+            request_key = (route, method, str(status))
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+
+        self.maybe_write_snapshot()
+
+    def export(self):
+        with self.lock:
+            return {
+                "histograms": [list(key) + [list(value)] for key, value in six.iteritems(self.histograms)],
+                "requests": [list(key) + [value] for key, value in six.iteritems(self.requests)],
+            }
+
+
+
+    ############################################################################
+    # Multi-process snapshots
+    ############################################################################
+    def maybe_write_snapshot(self):
+        options = get_metrics_settings()
+
+        if not options["SNAPSHOT_DIR"]:
+            return
+
+        if time.time() - self.last_snapshot < options["SNAPSHOT_INTERVAL"]:
+            return
+
+        self.last_snapshot = time.time()
+        self.write_snapshot(options["SNAPSHOT_DIR"])
+
+    def write_snapshot(self, snapshot_dir):
+        path = os.path.join(snapshot_dir, "metrics-{}.json".format(os.getpid()))
+        temp_path = path + ".tmp"
+
+        with open(temp_path, "wb") as snapshot_file:
+            snapshot_file.write(json.dumps(self.export()).encode("utf-8"))
+
+        os.rename(temp_path, path)
+
+def merge_exports(exports):
+    histograms = {}
+    requests = {}
+
+    for export in exports:
+        for entry in export["histograms"]:
+            key, values = tuple(entry[:-1]), entry[-1]
+
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+
+        for entry in export["requests"]:
+            key = tuple(entry[:-1])
+            requests[key] = requests.get(key, 0) + entry[-1]
+
+    return histograms, requests
+
+_SNAPSHOT_NAME_RE = re.compile(r"^metrics-(\d+)\.json$")
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM: alive, but another user's
+        return e.errno != errno.ESRCH
+
+    return True
+
+def collect_exports():
+    """Returns this process' live metrics plus snapshots of other live
+    processes. Deletes the snapshots of processes which have exited.
+    """
+    exports = [registry.export()]
+
+    snapshot_dir = get_metrics_settings()["SNAPSHOT_DIR"]
+
+    if snapshot_dir:
+        for path in glob.glob(os.path.join(snapshot_dir, "metrics-*.json")):
+            match = _SNAPSHOT_NAME_RE.match(os.path.basename(path))
+
+            if match is None or int(match.group(1)) == os.getpid():
+                continue
+
+            if not is_process_alive(int(match.group(1))):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+                continue
+
+            try:
+                with open(path) as snapshot_file:
+                    exports.append(json.loads(snapshot_file.read()))
+            except (IOError, OSError, ValueError):
+                continue
+
+    return exports
+
+
+
+################################################################################
+# Prometheus text format
+################################################################################
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+def _format_labels(labels):
+    return "{" + ",".join("{}=\"{}\"".format(name, _escape_label(value)) for name, value in labels) + "}"
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def render_prometheus(histograms, requests):
+    lines = []
+
+    for name, buckets, help_text in HISTOGRAMS:
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} histogram".format(name))
+
+        for key in sorted(key for key in histograms if key[0] == name):
+            values = histograms[key]
+            labels = [("route", key[1]), ("method", key[2])]
+            cumulative = 0
+
+            for upper_bound, bucket_count in zip(buckets, values):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(name, _format_labels(labels + [("le", _format_value(upper_bound))]), cumulative))
+
+            lines.append("{}_bucket{} {}".format(name, _format_labels(labels + [("le", "+Inf")]), values[-1]))
+            lines.append("{}_sum{} {}".format(name, _format_labels(labels), _format_value(values[-2])))
+            lines.append("{}_count{} {}".format(name, _format_labels(labels), values[-1]))
+
+    lines.append("# HELP {} Requests handled, by status code.".format(REQUEST_COUNTER))
+    lines.append("# TYPE {} counter".format(REQUEST_COUNTER))
+
+    for key in sorted(requests):
+        labels = [("route", key[0]), ("method", key[1]), ("status", key[2])]
+        lines.append("{}{} {}".format(REQUEST_COUNTER, _format_labels(labels), requests[key]))
+
+    return "\n".join(lines) + "\n"
+
+
+
+################################################################################
+# Route labels
+################################################################################
+_route_patterns = None
+
+def _collect_route_patterns(resolver, prefix, route_patterns):
+    for pattern in resolver.url_patterns:
+        if hasattr(pattern, "url_patterns"):
+            _collect_route_patterns(pattern, prefix + pattern.regex.pattern.lstrip("^"), route_patterns)
+        else:
+            # The first (i.e. non format suffixed) pattern for a view wins
+            route_patterns.setdefault(pattern.callback, prefix + pattern.regex.pattern.lstrip("^"))
+
+def get_view_route(view_func):
+    """Returns the URL pattern of `view_func`, for use as a label."""
+    global _route_patterns
+
+    if _route_patterns is None:
+        from django.core.urlresolvers import get_resolver
+        route_patterns = {}
+        _collect_route_patterns(get_resolver(None), "^", route_patterns)
+        _route_patterns = route_patterns
+
+    route = _route_patterns.get(view_func)
+
+    if route is None:
+        route = "{}.{}".format(view_func.__module__, view_func.__name__)
+
+    return route
+
+def get_route(request):
+    """Returns the URL pattern that served `request`, for use as a label."""
+    resolver_match = getattr(request, "resolver_match", None)
+
+    if resolver_match is None:
+        return "<unresolved>"
+
+    return get_view_route(resolver_match.func)
+
+def get_request_size(request):
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
+
+def get_response_size(response):
+    if getattr(response, "streaming", False):
+        try:
+            return int(response.get("Content-Length", 0))
+        except ValueError:
+            return 0
+    return len(response.content)
+
+def record_request(request, response, duration, query_counter):
+    registry.record(get_route(request),
+                    request.method,
+                    response.status_code,
+                    duration,
+                    query_counter.count,
+                    query_counter.time,
+                    get_request_size(request),
+                    get_response_size(response))
+
+
+registry = MetricsRegistry()
+
+
+
+################################################################################
+# Middleware
+################################################################################
+class MetricsMiddleware(object):
+    """Measures requests to views other than RobogalsAPIView subclasses, which
+    measure themselves.
+
+    Should be placed first in MIDDLEWARE_CLASSES.
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from .classes import RobogalsAPIView
+
+        if not get_metrics_settings()["ENABLED"]:
+            return None
+
+        view_class = getattr(view_func, "cls", None)
+
+        if view_class is not None and issubclass(view_class, RobogalsAPIView):
+            return None
+
+        request._myrg_metrics = (time.time(), QueryCounter().__enter__())
+        return None
+
+    def process_response(self, request, response):
+        measurement = getattr(request, "_myrg_metrics", None)
+
+        if measurement is None:
+            return response
+
+        del request._myrg_metrics
+
+        started, query_counter = measurement
+        query_counter.__exit__(None, None, None)
+
+        record_request(request, response, time.time() - started, query_counter)
+
+        return response
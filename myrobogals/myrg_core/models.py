@@ -5,6 +5,7 @@ from django.utils.encoding import python_2_unicode_compatible
 
 
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from myrg_groups.models import Role
@@ -25,6 +26,13 @@ class APILog(models.Model):
     note = models.TextField(_('note'),
                             blank=True,
                             null=True)
+    # Set when the entry is created rather than when it is written, as
+    # entries are written in batches by myrg_core.logbuffer
     date = models.DateTimeField(_('date'),
                                 blank=False,
-                                auto_now_add=True)
\ No newline at end of file
+                                editable=False,
+                                default=timezone.now)
+
+    class Meta:
+        # Archiving walks old entries in (date, id) order
+        index_together = (("date", "id"),)
@@ -0,0 +1,179 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import os
+import traceback
+
+from django.db import connection
+from django.db.backends.util import CursorDebugWrapper
+
+# Query budgets.
+#
+# Each API route and admin changelist declares the most database queries it
+# may run for one request, as
+#
+#   base + per_row * rows
+#
+# where `rows` is the number of rows in the response (the page of a list, the
+# objects edited...). Anything that runs a query per row has to say so here,
+# so that an N+1 introduced by a change shows up as a budget overrun rather
+# than in production. `per_row` is 0 wherever the rows are fetched in bulk.
+#
+# The budgets are checked by the `check_query_budgets` management command,
+# which reports the SQL of an overrun grouped by the call site issuing it.
+#
+# Budgets include the queries run by the session and authentication
+# middleware and RobogalsAPIView.initial (session, user, role and API log),
+# and, for routes writing searchable models, the two queries reindexing each
+# object in myrg_core/search.py (plus one re-reading it after an update()).
+
+# {path or "admin:<app_label>.<model_name>": (base, per_row)}
+QUERY_BUDGETS = {
+    "/api/1.0/utils/time": (3, 0),
+    "/api/1.0/utils/metrics": (3, 0),
+    "/api/1.0/batch": (8, 0),
+
+    "/api/1.0/users/list": (5, 0),
+    "/api/1.0/users/edit": (10, 0),
+    "/api/1.0/users/create": (6, 0),
+    "/api/1.0/users/delete": (9, 0),
+
+    "/api/1.0/self/whoami": (5, 0),
+    "/api/1.0/self/roles": (4, 0),
+
+    "/api/1.0/groups/list": (5, 0),
+    "/api/1.0/groups/edit": (11, 0),
+    "/api/1.0/groups/create": (8, 0),
+    "/api/1.0/groups/delete": (9, 0),
+
+    "/api/1.0/roles/list": (5, 0),
+    "/api/1.0/roles/edit": (8, 0),
+    "/api/1.0/roles/create": (12, 0),
+
+    "/api/1.0/roleclasses/list": (5, 0),
+    "/api/1.0/roleclasses/edit": (8, 0),
+    "/api/1.0/roleclasses/create": (8, 0),
+    "/api/1.0/roleclasses/delete": (6, 0),
+
+    "/api/1.0/repofiles/list": (5, 0),
+    "/api/1.0/repofiles/delete": (7, 0),
+
+    "/api/1.0/repocontainers/list": (8, 0),
+    "/api/1.0/repocontainers/edit": (12, 0),
+    "/api/1.0/repocontainers/create": (10, 0),
+    "/api/1.0/repocontainers/delete": (9, 0),
+
+    "/api/1.0/permissions/list": (5, 0),
+    "/api/1.0/permissions/edit": (8, 0),
+    "/api/1.0/permissions/create": (8, 0),
+    "/api/1.0/permissions/delete": (7, 0),
+
+    "admin:myrg_core.apilog": (8, 0),
+    "admin:myrg_users.robogalsuser": (8, 0),
+    "admin:myrg_groups.group": (8, 0),
+    "admin:myrg_groups.chapter": (8, 0),
+    "admin:myrg_groups.school": (8, 0),
+    "admin:myrg_groups.company": (8, 0),
+    "admin:myrg_groups.roleclass": (8, 0),
+    "admin:myrg_groups.role": (8, 0),
+    "admin:myrg_permissions.permissiondefinition": (8, 0),
+    "admin:myrg_permissions.permissionlist": (8, 0),
+    "admin:myrg_repo.repocontainer": (8, 0),
+    "admin:myrg_repo.repofile": (8, 0),
+    "admin:myrg_activities.activity": (8, 0),
+    "admin:myrg_activities.subactivity": (8, 0),
+    "admin:myrg_activities.participant": (8, 0),
+    "admin:myrg_activities.pecuniarytransaction": (8, 0),
+    "admin:myrg_activities.activityitem": (8, 0),
+    "admin:myrg_activities.subactivityitem": (8, 0),
+    "admin:myrg_messages.emaildefinition": (8, 0),
+    "admin:myrg_messages.emailmessage": (8, 0),
+    "admin:myrg_messages.emailoutbox": (8, 0),
+}
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_budget(key, rows):
+    """Returns the most queries `key` may run for `rows` rows, or None if it
+    has no budget.
+    """
+    if key not in QUERY_BUDGETS:
+        return None
+
+    base, per_row = QUERY_BUDGETS[key]
+
+    return base + per_row * rows
+
+
+
+################################################################################
+# Recording
+################################################################################
+def get_call_site():
+    """Returns "path:line in function" for the innermost project frame on the
+    stack (outside this module, manage.py and management commands), or failing
+    that the innermost frame outside the database layer.
+    """
+    this_module = os.path.splitext(os.path.abspath(__file__))[0]
+    fallback = None
+
+    for filename, line_number, function_name, text in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(filename)
+
+        if filename.startswith(this_module):
+            continue
+
+        if fallback is None and os.sep + os.path.join("django", "db") + os.sep not in filename:
+            fallback = "{}:{} in {}".format(filename, line_number, function_name)
+
+        if (not filename.startswith(PROJECT_DIR + os.sep)
+                or filename == os.path.join(PROJECT_DIR, "manage.py")
+                or os.sep + "management" + os.sep in filename):
+            continue
+
+        return "{}:{} in {}".format(os.path.relpath(filename, PROJECT_DIR), line_number, function_name)
+
+    return fallback or "<unknown>"
+
+class RecordingCursorWrapper(CursorDebugWrapper):
+    def __init__(self, cursor, db, recorder):
+        super(RecordingCursorWrapper, self).__init__(cursor, db)
+        self.recorder = recorder
+
+    def execute(self, sql, params=None):
+        self.recorder.queries.append((sql, get_call_site()))
+        return super(RecordingCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.recorder.queries.append((sql, get_call_site()))
+        return super(RecordingCursorWrapper, self).executemany(sql, param_list)
+
+class QueryRecorder(object):
+    """Records the SQL, and the call site, of each query run on the default
+    connection within the block, in `queries`.
+    """
+    def __enter__(self):
+        self.queries = []
+        self._use_debug_cursor = connection.use_debug_cursor
+
+        connection.use_debug_cursor = True
+        connection.make_debug_cursor = lambda cursor: RecordingCursorWrapper(cursor, connection, self)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        del connection.make_debug_cursor
+        connection.use_debug_cursor = self._use_debug_cursor
+
+        return False
+
+    def group_by_call_site(self):
+        """Returns [(call site, [sql, ...])], the busiest call site first."""
+        call_sites = {}
+
+        for sql, call_site in self.queries:
+            call_sites.setdefault(call_site, []).append(sql)
+
+        return sorted(call_sites.items(), key=lambda item: (-len(item[1]), item[0]))
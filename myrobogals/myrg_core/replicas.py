@@ -0,0 +1,122 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Read replicas.
+#
+# With ReplicaRouter in DATABASE_ROUTERS, RobogalsAPIView subclasses marked
+# `read_only` (the List* calls, WhoAmI, ListMyRoles...) read from one of the
+# database aliases in `DATABASES`, picked at random for each request. Every
+# other read, and every write, goes to the default database.
+#
+# A response to a POST to any other view sets a cookie which, for the next
+# `STICKY_SECONDS`, sends that client's reads to the default database as well,
+# so that a user does not see their own changes disappear while the replicas
+# catch up. A batch request (see myrg_core.batch) picks one database for all of
+# its sub-requests: a replica only if all of them are read-only.
+#
+# Objects read from a replica are still saved to the default database.
+# Responses read from a replica carry no ETag (see RobogalsAPIView), as the
+# model versions it would be built from are the default database's.
+#
+# Refer to REPLICAS in myrg_core/settings.py
+
+DEFAULTS = {
+    "DATABASES": (),
+    "STICKY_SECONDS": 5,
+    "COOKIE_NAME": "myrg_primary",
+}
+
+_local = threading.local()
+
+
+def get_replica_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "REPLICAS", {}))
+    return options
+
+def choose_replica():
+    """Returns a replica alias to read from, or None if there are none."""
+    databases = get_replica_settings()["DATABASES"]
+
+    if not databases:
+        return None
+
+    return random.choice(databases)
+
+def get_read_database():
+    """Returns the alias reads are being sent to, or None for the default."""
+    return getattr(_local, "database", None)
+
+class read_from(object):
+    """Sends reads within the block to `database` (None for the default
+    database), on the current thread.
+    """
+    def __init__(self, database):
+        self.database = database
+
+    def __enter__(self):
+        self.previous = get_read_database()
+        _local.database = self.database
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.database = self.previous
+        return False
+
+
+
+################################################################################
+# Read-your-writes
+################################################################################
+def is_pinned(request):
+    """Whether `request` comes from a client which wrote recently."""
+    try:
+        pinned_until = float(request.COOKIES.get(get_replica_settings()["COOKIE_NAME"], 0))
+    except ValueError:
+        return False
+
+    return pinned_until > time.time()
+
+def pin(response):
+    """Sends the client's reads to the default database for `STICKY_SECONDS`."""
+    options = get_replica_settings()
+
+    if not options["DATABASES"]:
+        return
+
+    response.set_cookie(options["COOKIE_NAME"],
+                        "{:.0f}".format(time.time() + options["STICKY_SECONDS"]),
+                        max_age=options["STICKY_SECONDS"],
+                        httponly=True)
+
+
+
+################################################################################
+# Router
+################################################################################
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        return get_read_database()
+
+    def db_for_write(self, model, **hints):
+        # Otherwise objects read from a replica would be saved back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS,) + tuple(get_replica_settings()["DATABASES"])
+
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        if db in get_replica_settings()["DATABASES"]:
+            return False
+        return None
@@ -0,0 +1,350 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from functools import reduce
+import logging
+import operator
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import smart_text
+
+from .signals import queryset_updated
+
+logger = logging.getLogger(__name__)
+
+# Full-text search.
+#
+# A model registered with `search_indexes.register` gets a shadow table,
+# "myrg_search_<name>", holding the text of its indexed fields for each
+# object, which the database's full-text engine indexes:
+#
+#   sqlite      An FTS5 virtual table, ranked by bm25.
+#   postgresql  A tsvector column with a GIN index, ranked by ts_rank.
+#   mysql       A FULLTEXT index, ranked by MATCH ... AGAINST relevance.
+#
+# Other backends fall back to `icontains` on the indexed fields, unranked.
+#
+# The shadow tables are created by the `sync_indexes` and
+# `rebuild_search_index` management commands, never while serving requests:
+# their DDL would commit the request's transaction on MySQL, and fail every
+# save on SQLite builds without FTS5. Until a model's table exists, its
+# objects are not indexed (which is logged) and searches fall back to
+# `icontains`; a missing table is looked for again every
+# `TABLE_RECHECK_SECONDS`.
+#
+# The shadow tables are kept in step with the models by the post_save,
+# post_delete and queryset_updated signals (see myrg_core.signals), for the
+# registered model and its multi-table subclasses. Rows written without
+# signals (bulk_create, raw SQL), or while the table was missing, are only
+# indexed by `rebuild_search_index`.
+#
+# Searches are split into at most `MAX_TERMS` words, each of which must
+# prefix-match a word of the object's text.
+#
+# Refer to SEARCH in myrg_core/settings.py
+
+DEFAULTS = {
+    "MAX_TERMS": 8,
+    "REBUILD_BATCH_SIZE": 1000,
+}
+
+TABLE_PREFIX = "myrg_search_"
+
+TABLE_RECHECK_SECONDS = 60
+
+# Ranks are selected as this, lower ranking higher
+RANK_ALIAS = "search_rank"
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def get_search_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "SEARCH", {}))
+    return options
+
+def get_terms(text):
+    """Splits a search into its words."""
+    return TERM_RE.findall(smart_text(text))[:get_search_settings()["MAX_TERMS"]]
+
+
+
+################################################################################
+# Backends
+################################################################################
+class SQLiteSearchBackend(object):
+    def get_create_statements(self, index):
+        return ["CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5(object_id UNINDEXED, {}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')".format(
+                    index.qn(index.table), ", ".join(index.qn(field) for field in index.fields))]
+
+    def insert(self, cursor, index, rows):
+        cursor.executemany("INSERT INTO {} (object_id, {}) VALUES (%s, {})".format(
+                               index.qn(index.table),
+                               ", ".join(index.qn(field) for field in index.fields),
+                               ", ".join("%s" for field in index.fields)),
+                           [[object_id] + values for object_id, values in rows])
+
+    def get_key_sql(self, column_sql):
+        return column_sql
+
+    def get_match(self, index, terms):
+        """Returns (rank SQL, rank params, where SQL, where params)."""
+        expression = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+        return ("{}.rank".format(index.qn(index.table)), [],
+                "{} MATCH %s".format(index.qn(index.table)), [expression])
+
+class PostgreSQLSearchBackend(object):
+    def get_create_statements(self, index):
+        return ["CREATE TABLE IF NOT EXISTS {} (object_id varchar(64) PRIMARY KEY, document tsvector NOT NULL)".format(index.qn(index.table)),
+                "CREATE INDEX IF NOT EXISTS {} ON {} USING gin (document)".format(index.qn(index.table + "_document"), index.qn(index.table))]
+
+    def insert(self, cursor, index, rows):
+        cursor.executemany("INSERT INTO {} (object_id, document) VALUES (%s, to_tsvector('simple', %s))".format(index.qn(index.table)),
+                           [[object_id, " ".join(values)] for object_id, values in rows])
+
+    def get_key_sql(self, column_sql):
+        return "CAST({} AS varchar)".format(column_sql)
+
+    def get_match(self, index, terms):
+        expression = " & ".join("{}:*".format(term) for term in terms)
+        document = "{}.document".format(index.qn(index.table))
+
+        return ("-ts_rank({}, to_tsquery('simple', %s))".format(document), [expression],
+                "{} @@ to_tsquery('simple', %s)".format(document), [expression])
+
+class MySQLSearchBackend(object):
+    def get_create_statements(self, index):
+        return ["CREATE TABLE IF NOT EXISTS {} (object_id varchar(64) PRIMARY KEY, document longtext NOT NULL, FULLTEXT (document)) ENGINE=InnoDB".format(index.qn(index.table))]
+
+    def insert(self, cursor, index, rows):
+        cursor.executemany("INSERT INTO {} (object_id, document) VALUES (%s, %s)".format(index.qn(index.table)),
+                           [[object_id, " ".join(values)] for object_id, values in rows])
+
+    def get_key_sql(self, column_sql):
+        return column_sql
+
+    def get_match(self, index, terms):
+        expression = " ".join("+{}*".format(term) for term in terms)
+        match = "MATCH ({}.document) AGAINST (%s IN BOOLEAN MODE)".format(index.qn(index.table))
+
+        return "-" + match, [expression], match, [expression]
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend(),
+    "postgresql": PostgreSQLSearchBackend(),
+    "mysql": MySQLSearchBackend(),
+}
+
+
+
+################################################################################
+# Indexes
+################################################################################
+class SearchIndex(object):
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model = model
+        self.fields = tuple(fields)
+        self.table = TABLE_PREFIX + name
+
+        # Database aliases the shadow table is known to exist in, and
+        # {alias: time it was last found missing}
+        self._tables_found = set()
+        self._tables_missing = {}
+        self._tables_lock = threading.Lock()
+
+    def get_connection(self, write=False):
+        if write:
+            return connections[router.db_for_write(self.model)]
+        return connections[router.db_for_read(self.model)]
+
+    def qn(self, name):
+        return self.get_connection().ops.quote_name(name)
+
+    def get_backend(self, connection):
+        return BACKENDS.get(connection.vendor)
+
+    def has_table(self, connection):
+        """Whether the shadow table exists in `connection`'s database. Never
+        creates it; see create_table.
+        """
+        if connection.alias in self._tables_found:
+            return True
+
+        with self._tables_lock:
+            if time.time() - self._tables_missing.get(connection.alias, 0) < TABLE_RECHECK_SECONDS:
+                return False
+
+            if self.table in connection.introspection.table_names():
+                self._tables_missing.pop(connection.alias, None)
+                self._tables_found.add(connection.alias)
+                return True
+
+            self._tables_missing[connection.alias] = time.time()
+
+        logger.warning("Search table %s is missing from database %s; run manage.py rebuild_search_index", self.table, connection.alias)
+        return False
+
+    def get_create_statements(self, connection):
+        backend = self.get_backend(connection)
+        return backend.get_create_statements(self) if backend is not None else []
+
+    def create_table(self, connection):
+        cursor = connection.cursor()
+
+        for statement in self.get_create_statements(connection):
+            cursor.execute(statement)
+
+        with self._tables_lock:
+            self._tables_missing.pop(connection.alias, None)
+            self._tables_found.add(connection.alias)
+
+    def get_rows(self, objects):
+        """Returns (object id, [field text, ...]) for `objects`."""
+        return [(smart_text(obj.pk), [smart_text(getattr(obj, field) or "") for field in self.fields])
+                for obj in objects]
+
+    def delete(self, pks):
+        connection = self.get_connection(write=True)
+
+        if self.get_backend(connection) is None or not pks or not self.has_table(connection):
+            return
+
+        pks = [smart_text(pk) for pk in pks]
+
+        connection.cursor().execute("DELETE FROM {} WHERE object_id IN ({})".format(self.qn(self.table), ", ".join("%s" for pk in pks)), pks)
+
+    def update(self, objects):
+        """Indexes (or reindexes) `objects`."""
+        connection = self.get_connection(write=True)
+        backend = self.get_backend(connection)
+
+        if backend is None or not objects or not self.has_table(connection):
+            return
+
+        self.delete([obj.pk for obj in objects])
+        backend.insert(connection.cursor(), self, self.get_rows(objects))
+
+    def update_pks(self, pks):
+        self.update(list(self.model._default_manager.filter(pk__in=list(pks)).only(*self.fields)))
+
+    def rebuild(self, batch_size=None):
+        """Recreates the shadow table from every object. Returns the number of
+        objects indexed.
+        """
+        connection = self.get_connection(write=True)
+
+        if self.get_backend(connection) is None:
+            return 0
+
+        batch_size = batch_size or get_search_settings()["REBUILD_BATCH_SIZE"]
+
+        connection.cursor().execute("DROP TABLE IF EXISTS {}".format(self.qn(self.table)))
+
+        with self._tables_lock:
+            self._tables_found.discard(connection.alias)
+
+        self.create_table(connection)
+
+        # Walked in primary key order rather than with OFFSET
+        query = self.model._default_manager.order_by("pk").only(*self.fields)
+        count = 0
+        last_pk = None
+
+        while True:
+            batch = list((query if last_pk is None else query.filter(pk__gt=last_pk))[:batch_size])
+
+            if not batch:
+                return count
+
+            self.get_backend(connection).insert(connection.cursor(), self, self.get_rows(batch))
+            count += len(batch)
+            last_pk = batch[-1].pk
+
+    def filter(self, query, text, sort_fields=()):
+        """Restricts `query` to the objects matching `text`, ordered by
+        `sort_fields` then rank.
+        """
+        terms = get_terms(text)
+
+        if not terms:
+            return query.none()
+
+        connection = connections[query.db]
+        backend = self.get_backend(connection)
+
+        # Replicas (see myrg_core.replicas) receive the table from the primary
+        if backend is None or not self.has_table(self.get_connection(write=True)):
+            return query.filter(reduce(operator.and_, [reduce(operator.or_, [Q(**{field + "__icontains": term}) for field in self.fields])
+                                                       for term in terms]))
+
+        rank_sql, rank_params, match_sql, match_params = backend.get_match(self, terms)
+        opts = query.model._meta
+
+        # Multi-table subclasses share their parent's primary key values
+        key_sql = backend.get_key_sql("{}.{}".format(self.qn(opts.db_table), self.qn(opts.pk.column)))
+
+        return query.extra(select={RANK_ALIAS: rank_sql},
+                           select_params=rank_params,
+                           tables=[self.table],
+                           where=["{}.object_id = {}".format(self.qn(self.table), key_sql), match_sql],
+                           params=match_params,
+                           order_by=list(sort_fields) + [RANK_ALIAS])
+
+class SearchRegistry(object):
+    def __init__(self):
+        self.indexes = {}
+
+    def register(self, name, model, fields):
+        """Indexes `fields` of `model` (and its subclasses) for full-text
+        search.
+        """
+        index = self.indexes[model] = SearchIndex(name, model, fields)
+        return index
+
+    def get_index(self, model):
+        """Returns the index of `model` or its nearest indexed parent, if any."""
+        for klass in model.__mro__:
+            if klass in self.indexes:
+                return self.indexes[klass]
+        return None
+
+    def get_indexes(self):
+        return sorted(self.indexes.values(), key=lambda index: index.name)
+
+search_indexes = SearchRegistry()
+
+
+
+################################################################################
+# Signal receivers
+################################################################################
+def _object_saved(sender, instance, raw=False, **kwargs):
+    index = search_indexes.get_index(sender)
+
+    if index is not None and not raw:
+        index.update([instance])
+
+def _object_deleted(sender, instance, **kwargs):
+    index = search_indexes.get_index(sender)
+
+    if index is not None:
+        index.delete([instance.pk])
+
+def _queryset_updated(sender, pks, **kwargs):
+    index = search_indexes.get_index(sender)
+
+    if index is not None:
+        index.update_pks(pks)
+
+post_save.connect(_object_saved, weak=False, dispatch_uid="myrg_core.search")
+post_delete.connect(_object_deleted, weak=False, dispatch_uid="myrg_core.search")
+queryset_updated.connect(_queryset_updated, weak=False, dispatch_uid="myrg_core.search")
@@ -0,0 +1,163 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+from future.utils import native_str
+
+import copy
+import itertools
+import threading
+
+from django.core.exceptions import ValidationError
+from django.utils.datastructures import SortedDict
+
+# Serializer subclasses restricted to a set of fields.
+#
+# Views used to assign `Meta.fields` (and sometimes `Meta.model`) on the shared
+# serializer class before every use, which let concurrent requests serialize
+# with each other's fields. `serializer_for` instead returns a dedicated
+# subclass per (serializer, model, fields), created once and reused.
+#
+# The subclasses also build their fields from the model once, rather than for
+# every serializer instance, and copy them for each instance.
+#
+# Up to `SERIALIZER_CACHE_SIZE` subclasses are kept, least recently used first
+# out. Lookups do not take a lock; only creating a subclass does.
+
+SERIALIZER_CACHE_SIZE = 256
+
+# {(serializer_class, model, fields): [subclass, last used]}
+_serializer_classes = {}
+_serializer_classes_lock = threading.Lock()
+
+# next() on a count is atomic under the GIL
+_clock = itertools.count()
+
+
+class CachedFieldsMixin(object):
+    """Builds the serializer's (uninitialized) fields once per class."""
+    def get_field_template(self):
+        """Same fields as BaseSerializer.get_fields, before initialization."""
+        fields = SortedDict(self.base_fields)
+
+        for key, field in six.iteritems(self.get_default_fields()):
+            if key not in fields:
+                fields[key] = field
+
+        if self.opts.fields:
+            fields = SortedDict((key, fields[key]) for key in self.opts.fields)
+
+        for key in self.opts.exclude or ():
+            fields.pop(key, None)
+
+        return fields
+
+    def get_fields(self):
+        cls = type(self)
+
+        # Looked up in the class' own __dict__ so subclasses build their own
+        field_template = cls.__dict__.get("_field_template")
+
+        if field_template is None:
+            field_template = cls._field_template = self.get_field_template()
+
+        fields = copy.deepcopy(field_template)
+
+        for key, field in fields.items():
+            field.initialize(parent=self, field_name=key)
+
+        return fields
+
+
+def make_serializer_class(serializer_class, fields=None, model=None):
+    meta_attrs = {}
+
+    if fields is not None:
+        meta_attrs["fields"] = fields
+
+    if model is not None:
+        meta_attrs["model"] = model
+
+    # `object` is listed since Meta is an old-style class under Python 2
+    meta = type(native_str("Meta"), (serializer_class.Meta, object), meta_attrs)
+
+    return type(native_str(serializer_class.__name__), (CachedFieldsMixin, serializer_class), {"Meta": meta})
+
+def serializer_for(serializer_class, fields=None, model=None):
+    """Returns a subclass of `serializer_class` limited to `fields`, optionally
+    for a different (compatible) `model`.
+    """
+    if fields is not None:
+        fields = tuple(fields)
+
+    key = (serializer_class, model, fields)
+
+    entry = _serializer_classes.get(key)
+
+    if entry is None:
+        entry = [make_serializer_class(serializer_class, fields, model), next(_clock)]
+
+        with _serializer_classes_lock:
+            entry = _serializer_classes.setdefault(key, entry)
+
+            if len(_serializer_classes) > SERIALIZER_CACHE_SIZE:
+                least_recent_key = min(_serializer_classes, key=lambda cache_key: _serializer_classes[cache_key][1])
+                del _serializer_classes[least_recent_key]
+    else:
+        entry[1] = next(_clock)
+
+    return entry[0]
+
+def clear_serializer_classes():
+    with _serializer_classes_lock:
+        _serializer_classes.clear()
+
+
+
+class BulkSerializerMixin(object):
+    """Validates many objects with one ModelSerializer instance.
+
+    Validation skips the uniqueness check, which costs a query per unique
+    field per object; callers check uniqueness for all objects at once (see
+    myrg_core.bulkedit). Serializers created with `partial=True` edit existing
+    objects, and only validate the fields given.
+    """
+    def restore_objects(self, items, instances=None):
+        """Validates each of `items`, onto the corresponding one of
+        `instances` if given, building the serializer's fields once. Returns
+        [(unsaved object or None, errors)].
+        """
+        results = []
+
+        for idx, item in enumerate(items):
+            self.object = instances[idx] if instances is not None else None
+            self._item_fields = set(item) if isinstance(item, dict) else set()
+
+            instance = self.from_native(item, None)
+            results.append((None if self._errors else instance, self._errors))
+
+        self.object = None
+
+        return results
+
+    def prepare_objects(self, instances):
+        """Called with the validated objects before they are saved."""
+        pass
+
+    def full_clean(self, instance):
+        if self.partial:
+            # Fields not given were valid already, and related objects given
+            # were looked up by their serializer fields. (Not
+            # get_validation_exclusions, which loads every related object.)
+            exclude = [field.name for field in instance._meta.fields + instance._meta.many_to_many
+                       if field.name not in self._item_fields or field.rel is not None]
+        else:
+            exclude = self.get_validation_exclusions(instance)
+
+        try:
+            instance.clean_fields(exclude=exclude)
+            instance.clean()
+        except ValidationError as err:
+            self._errors = err.update_error_dict({})
+            return None
+
+        return instance
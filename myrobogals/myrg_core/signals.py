@@ -0,0 +1,25 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import logging
+
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Sent by views after writing rows with QuerySet.update() or bulk_create(),
+# which bypass the model save signals. `sender` is the model class and `pks`
+# the primary keys of the rows written.
+#
+# Send it with send_queryset_updated once the rows are committed: the rows
+# stay written whatever its receivers (e.g. search indexing, cache
+# invalidation) do, so their errors are logged rather than raised into the
+# view reporting the write.
+queryset_updated = Signal(providing_args=["pks"])
+
+
+def send_queryset_updated(sender, pks):
+    for receiver, response in queryset_updated.send_robust(sender=sender, pks=pks):
+        if isinstance(response, Exception):
+            logger.error("queryset_updated receiver %r failed for %s: %r", receiver, sender.__name__, response)
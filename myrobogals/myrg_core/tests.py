@@ -0,0 +1,499 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from contextlib import contextmanager
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from myrg_users.models import RobogalsUser
+
+from .listing import list_engine
+from .logbuffer import APILogBuffer
+from .management.commands.bench_routes import make_client
+from .management.commands.generate_fixture import ADMIN_USERNAME
+from .models import APILog
+from .search import search_indexes
+
+
+@contextmanager
+def failing_bulk_create(model, failures):
+    """Makes the first `failures` calls to `model.objects.bulk_create` raise."""
+    manager = model.objects
+    bulk_create = manager.bulk_create
+    calls = []
+
+    def flaky_bulk_create(*args, **kwargs):
+        calls.append(None)
+
+        if len(calls) <= failures:
+            raise Exception("Database unavailable")
+
+        return bulk_create(*args, **kwargs)
+
+    manager.bulk_create = flaky_bulk_create
+
+    try:
+        yield
+    finally:
+        del manager.bulk_create
+
+
+@override_settings(THROTTLING={"ENABLED": False},
+                   API_LOG_BUFFER={"ENABLED": False},
+                   ROLE_CACHE={"BACKEND": None})
+class FixtureTestCase(TestCase):
+    """Runs API requests as the admin of a small `generate_fixture` fixture."""
+    @classmethod
+    def setUpClass(cls):
+        super(FixtureTestCase, cls).setUpClass()
+
+        # Outside the transaction each test is rolled back in, as in a
+        # deployment, where the tables are created ahead of time
+        for index in search_indexes.get_indexes():
+            index.create_table(connection)
+
+    def setUp(self):
+        call_command("generate_fixture", scale=0.0005, password="fixture", verbosity=0)
+        self.client = make_client("fixture")
+
+    def post(self, path, body, **extra):
+        response = self.client.post(path, json.dumps(body), content_type="application/json", **extra)
+        return response, json.loads(response.content.decode("utf-8")) if response.content else None
+
+
+
+################################################################################
+# API log buffer (myrg_core.logbuffer)
+################################################################################
+class SynchronousLogBuffer(APILogBuffer):
+    # Flushed by the tests rather than by a thread, which would have its own
+    # connection to the test database
+    def _ensure_started(self):
+        pass
+
+class APILogBufferTestCase(TestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+        self.spill_path = os.path.join(self.spill_dir, "apilog.spill")
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir)
+
+    def make_entries(self, count):
+        return [APILog(ip="127.0.0.1", api_url="/api/1.0/utils/time", api_body="{}", note="entry {}".format(idx))
+                for idx in range(count)]
+
+    def make_buffer(self, **kwargs):
+        options = dict(max_size=100, batch_size=2, flush_interval_ms=1000, backpressure="block", block_timeout_ms=0)
+        options.update(kwargs)
+        return SynchronousLogBuffer(**options)
+
+    def test_flush_writes_every_queued_entry(self):
+        log_buffer = self.make_buffer()
+
+        for entry in self.make_entries(5):
+            self.assertTrue(log_buffer.put(entry))
+
+        self.assertEqual(APILog.objects.count(), 0)
+
+        log_buffer.flush()
+
+        self.assertEqual(APILog.objects.count(), 5)
+        self.assertEqual(log_buffer.stats()["written"], 5)
+        self.assertEqual(log_buffer.stats()["queued"], 0)
+
+    def test_block_drops_entries_when_full(self):
+        log_buffer = self.make_buffer(max_size=2)
+
+        self.assertEqual([log_buffer.put(entry) for entry in self.make_entries(3)], [True, True, False])
+        self.assertEqual(log_buffer.stats()["dropped"], 1)
+
+    def test_spill_when_full_then_replay(self):
+        log_buffer = self.make_buffer(max_size=2, backpressure="spill", spill_path=self.spill_path)
+
+        for entry in self.make_entries(5):
+            self.assertTrue(log_buffer.put(entry))
+
+        self.assertEqual(log_buffer.stats()["spilled"], 3)
+
+        with open(self.spill_path) as spill_file:
+            self.assertEqual(len(spill_file.readlines()), 3)
+
+        log_buffer.flush()
+
+        self.assertEqual(sorted(APILog.objects.values_list("note", flat=True)),
+                         ["entry {}".format(idx) for idx in range(5)])
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_failed_batch_spilled_and_replayed(self):
+        log_buffer = self.make_buffer(spill_path=self.spill_path)
+
+        for entry in self.make_entries(2):
+            log_buffer.put(entry)
+
+        with failing_bulk_create(APILog, 1):
+            log_buffer.flush()
+
+        stats = log_buffer.stats()
+        self.assertEqual((stats["failed"], stats["spilled"], stats["written"]), (2, 2, 2))
+        self.assertEqual(APILog.objects.count(), 2)
+
+    def test_failed_batch_retried_without_spill_path(self):
+        log_buffer = self.make_buffer(retry_attempts=2)
+
+        for entry in self.make_entries(3):
+            log_buffer.put(entry)
+
+        with failing_bulk_create(APILog, 2):
+            log_buffer.flush()
+            self.assertEqual(log_buffer.stats()["retrying"], 2)
+            self.assertEqual(log_buffer.stats()["queued"], 1)
+
+            log_buffer.flush()
+            self.assertEqual(APILog.objects.count(), 0)
+
+            log_buffer.flush()
+
+        self.assertEqual(APILog.objects.count(), 3)
+        self.assertEqual(log_buffer.stats()["retrying"], 0)
+
+    def test_failed_batch_dropped_after_retries(self):
+        log_buffer = self.make_buffer(retry_attempts=1)
+
+        for entry in self.make_entries(2):
+            log_buffer.put(entry)
+
+        with failing_bulk_create(APILog, 2):
+            log_buffer.flush()
+            log_buffer.flush()
+
+        self.assertEqual(log_buffer.stats()["dropped"], 2)
+        self.assertEqual(log_buffer.stats()["retrying"], 0)
+        self.assertEqual(APILog.objects.count(), 0)
+
+    def test_orphaned_replay_file_replayed(self):
+        # The PID of a process which has exited
+        process = subprocess.Popen(["true"])
+        process.wait()
+
+        with open("{}.{}.replay".format(self.spill_path, process.pid), "w") as replay_file:
+            for entry in self.make_entries(2):
+                replay_file.write(json.dumps({
+                    "user_role_id": None,
+                    "ip": entry.ip,
+                    "api_url": entry.api_url,
+                    "api_body": entry.api_body,
+                    "note": entry.note,
+                    "date": entry.date.isoformat(),
+                }) + "\n")
+
+        log_buffer = self.make_buffer(backpressure="spill", spill_path=self.spill_path)
+        log_buffer.flush()
+
+        self.assertEqual(APILog.objects.count(), 2)
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+
+
+################################################################################
+# List query engine (myrg_core.listing)
+################################################################################
+class ListEngineTestCase(FixtureTestCase):
+    def list_users(self, family_name_search, page=0, length=10):
+        return self.post("/api/1.0/users/list", {
+            "query": [
+                {"field": "family_name", "search": family_name_search},
+                {"field": "username", "order": "a"},
+            ],
+            "pagination": {"page": page, "length": length},
+        })
+
+    def test_plan_compiled_once_per_shape(self):
+        list_engine.clear_plans()
+
+        for family_name_search in ("a", "e", "son"):
+            response, data = self.list_users(family_name_search)
+            self.assertEqual(response.status_code, 200)
+
+            expected = RobogalsUser.objects.filter(is_active=True, family_name__icontains=family_name_search)
+            self.assertEqual(data["meta"]["size"], expected.count())
+            self.assertEqual([row["data"]["username"] for row in data["user"]],
+                             list(expected.order_by("username").values_list("username", flat=True)[:10]))
+
+        self.assertEqual([name for name, shape in list_engine.plans], ["users"])
+
+    def test_pages(self):
+        usernames = list(RobogalsUser.objects.filter(is_active=True).order_by("username").values_list("username", flat=True))
+
+        response, data = self.list_users("", page=1, length=7)
+
+        self.assertEqual([row["data"]["username"] for row in data["user"]], usernames[7:14])
+        self.assertEqual(data["meta"]["size"], len(usernames))
+
+    def test_unusable_fields_rejected(self):
+        list_engine.clear_plans()
+
+        for field, error in (("password", "`password` is a protected field."),
+                             ("no_such_field", "`no_such_field` is not a valid field name.")):
+            response, data = self.post("/api/1.0/users/list", {
+                "query": [{"field": field}],
+                "pagination": {"page": 0, "length": 10},
+            })
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(data["detail"], error)
+
+        self.assertEqual(list_engine.plans, {})
+
+
+################################################################################
+# Keyset pagination (myrg_core.listing)
+################################################################################
+class KeysetPaginationTestCase(FixtureTestCase):
+    def get_page(self, query, cursor, length=7):
+        response, data = self.post("/api/1.0/users/list", {
+            "query": query,
+            "pagination": {"cursor": cursor, "length": length},
+        })
+
+        self.assertEqual(response.status_code, 200, data)
+
+        return [row["id"] for row in data["user"]], data["meta"]["next_cursor"]
+
+    def walk(self, query, between_pages=None):
+        ids = []
+        cursor = None
+
+        while True:
+            page_ids, cursor = self.get_page(query, cursor)
+            ids.extend(page_ids)
+
+            if cursor is None:
+                return ids
+
+            if between_pages is not None:
+                between_pages(ids)
+
+    def expected_ids(self, *ordering):
+        users = RobogalsUser.objects.filter(is_active=True).order_by(*(ordering + ("pk",)))
+        return list(users.values_list("pk", flat=True))
+
+    def test_ties_neither_repeated_nor_skipped(self):
+        family_names = list(RobogalsUser.objects.filter(is_active=True).values_list("family_name", flat=True))
+        self.assertLess(len(set(family_names)), len(family_names))
+
+        for query, ordering in (([{"field": "family_name", "order": "a"}], ("family_name",)),
+                                ([{"field": "family_name", "order": "d"}], ("-family_name",)),
+                                ([{"field": "family_name", "order": "a"}, {"field": "given_name", "order": "d"}], ("family_name", "-given_name"))):
+            self.assertEqual(self.walk(query), self.expected_ids(*ordering))
+
+    def test_rows_removed_behind_the_cursor(self):
+        expected = self.expected_ids("family_name")
+
+        # OFFSET pagination would skip a row after each of these
+        def deactivate_returned_row(ids):
+            RobogalsUser.objects.filter(pk=ids[-1]).update(is_active=False)
+
+        self.assertEqual(self.walk([{"field": "family_name", "order": "a"}], deactivate_returned_row), expected)
+
+    def test_cursor_of_another_order_rejected(self):
+        page_ids, cursor = self.get_page([{"field": "family_name", "order": "a"}], None)
+
+        response, data = self.post("/api/1.0/users/list", {
+            "query": [{"field": "family_name", "order": "d"}],
+            "pagination": {"cursor": cursor, "length": 7},
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data["detail"], "PAGINATION_CURSOR_INVALID")
+
+
+################################################################################
+# Conditional requests (myrg_core.versions)
+################################################################################
+@override_settings(MODEL_VERSIONS={"SHARED": True})
+class ETagTestCase(FixtureTestCase):
+    list_body = {
+        "query": [{"field": "username", "order": "a"}, {"field": "mobile"}],
+        "pagination": {"page": 0, "length": 10},
+    }
+
+    def get_etag(self):
+        response, data = self.post("/api/1.0/users/list", self.list_body)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def assertNotModified(self, etag):
+        response, data = self.post("/api/1.0/users/list", self.list_body, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_not_modified_until_written(self):
+        etag = self.get_etag()
+        self.assertNotModified(etag)
+
+        user = RobogalsUser.objects.filter(is_active=True).order_by("username")[0]
+        response, data = self.post("/api/1.0/users/edit", {"user": [{"id": user.pk, "data": {"mobile": "61400000000"}}]})
+        self.assertEqual(data["fail"]["id"], {})
+
+        response, data = self.post("/api/1.0/users/list", self.list_body, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(data["user"][0]["data"]["mobile"], "61400000000")
+
+        self.assertNotModified(response["ETag"])
+
+    def test_queryset_updates_change_etag(self):
+        etag = self.get_etag()
+
+        # Deletes deactivate users with QuerySet.update()
+        user = RobogalsUser.objects.filter(is_active=True).exclude(username=ADMIN_USERNAME).order_by("username")[0]
+        response, data = self.post("/api/1.0/users/delete", {"id": [user.pk]})
+        self.assertEqual(data["success"]["id"], [user.pk])
+
+        self.assertNotEqual(self.get_etag(), etag)
+
+    @override_settings(MODEL_VERSIONS={})
+    def test_no_etag_with_per_process_versions(self):
+        response, data = self.post("/api/1.0/users/list", self.list_body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+
+################################################################################
+# Batched API calls (myrg_core.batch)
+################################################################################
+class BatchTestCase(FixtureTestCase):
+    def setUp(self):
+        super(BatchTestCase, self).setUp()
+        self.user = RobogalsUser.objects.filter(is_active=True).exclude(username=ADMIN_USERNAME).order_by("username")[0]
+
+    def edit_request(self, mobile):
+        return {"url": "/api/1.0/users/edit", "body": {"user": [{"id": self.user.pk, "data": {"mobile": mobile}}]}}
+
+    def get_mobile(self):
+        return RobogalsUser.objects.get(pk=self.user.pk).mobile
+
+    def test_responses_in_order(self):
+        response, data = self.post("/api/1.0/batch", {"concurrent": True, "requests": [
+            {"url": "/api/1.0/self/roles", "method": "GET"},
+            self.edit_request("61400000001"),
+            {"url": "/api/1.0/users/list", "body": {"query": [{"field": "mobile", "search": "61400000001"}],
+                                                    "pagination": {"page": 0, "length": 10}}},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in data["responses"]], [200, 200, 200])
+        self.assertEqual([row["id"] for row in data["responses"][2]["body"]["user"]], [self.user.pk])
+
+    def test_failures_kept_without_atomic(self):
+        response, data = self.post("/api/1.0/batch", {"requests": [
+            self.edit_request("61400000002"),
+            {"url": "/api/1.0/users/list", "body": {"query": [{"field": "password"}], "pagination": {"page": 0, "length": 10}}},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in data["responses"]], [200, 400])
+        self.assertEqual(self.get_mobile(), "61400000002")
+
+    def test_atomic_rolled_back_on_error_status(self):
+        mobile = self.get_mobile()
+
+        response, data = self.post("/api/1.0/batch", {"atomic": True, "requests": [
+            self.edit_request("61400000003"),
+            {"url": "/api/1.0/users/list", "body": {"query": [{"field": "password"}], "pagination": {"page": 0, "length": 10}}},
+            {"url": "/api/1.0/self/roles", "method": "GET"},
+        ]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data["detail"], "BATCH_ROLLED_BACK")
+        self.assertEqual([result["status"] for result in data["responses"]], [200, 400])
+        self.assertEqual(self.get_mobile(), mobile)
+
+    def test_atomic_rolled_back_on_failed_items(self):
+        mobile = self.get_mobile()
+
+        response, data = self.post("/api/1.0/batch", {"atomic": True, "requests": [
+            self.edit_request("61400000004"),
+            {"url": "/api/1.0/users/delete", "body": {"id": ["0" * 32]}},
+        ]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data["detail"], "BATCH_ROLLED_BACK")
+        self.assertEqual(data["responses"][1]["body"]["fail"]["id"], {"0" * 32: "OBJECT_NOT_MODIFIED"})
+        self.assertEqual(self.get_mobile(), mobile)
+
+
+################################################################################
+# Bulk editing (myrg_core.bulkedit)
+################################################################################
+class BulkEditTestCase(FixtureTestCase):
+    def setUp(self):
+        super(BulkEditTestCase, self).setUp()
+        self.users = list(RobogalsUser.objects.filter(is_active=True).exclude(username=ADMIN_USERNAME).order_by("username")[:4])
+
+    def edit(self, edits):
+        with CaptureQueriesContext(connection) as queries:
+            response, data = self.post("/api/1.0/users/edit", {"user": [{"id": object_id, "data": update} for object_id, update in edits]})
+
+        self.assertEqual(response.status_code, 200)
+
+        updates = [query["sql"] for query in queries.captured_queries if "UPDATE \"myrg_users_robogalsuser\"" in query["sql"]]
+
+        return data, updates
+
+    def test_one_update_per_column_set(self):
+        data, updates = self.edit([(user.pk, {"mobile": "6140000000{}".format(idx)}) for idx, user in enumerate(self.users)])
+
+        self.assertEqual(data["fail"]["id"], {})
+        self.assertEqual(sorted(data["success"]["id"]), sorted(user.pk for user in self.users))
+        self.assertEqual(len(updates), 1)
+        self.assertIn("CASE", updates[0])
+
+        for idx, user in enumerate(self.users):
+            self.assertEqual(RobogalsUser.objects.get(pk=user.pk).mobile, "6140000000{}".format(idx))
+
+    def test_later_edits_of_an_object_apply_on_top(self):
+        user = self.users[0]
+
+        data, updates = self.edit([(user.pk, {"mobile": "61400000009"}), (user.pk, {"given_name": "Edited"})])
+
+        self.assertEqual(data["success"]["id"], [user.pk, user.pk])
+
+        user = RobogalsUser.objects.get(pk=user.pk)
+        self.assertEqual((user.mobile, user.given_name), ("61400000009", "Edited"))
+
+    def test_failures_reported_per_id(self):
+        missing_id = "0" * 32
+        originals = dict((user.pk, RobogalsUser.objects.get(pk=user.pk)) for user in self.users)
+
+        data, updates = self.edit([
+            (self.users[0].pk, {"mobile": "61400000008"}),
+            (missing_id, {"mobile": "61400000008"}),
+            (self.users[1].pk, {"primary_email": "not an address"}),
+            (self.users[2].pk, {"username": self.users[3].username}),
+        ])
+
+        self.assertEqual(data["success"]["id"], [self.users[0].pk])
+        self.assertEqual(data["fail"]["id"], {
+            missing_id: "OBJECT_NOT_FOUND",
+            self.users[1].pk: "DATA_VALIDATION_FAILED",
+            self.users[2].pk: "DATA_VALIDATION_FAILED",
+        })
+
+        self.assertEqual(RobogalsUser.objects.get(pk=self.users[0].pk).mobile, "61400000008")
+
+        for user in self.users[1:]:
+            edited = RobogalsUser.objects.get(pk=user.pk)
+            self.assertEqual((edited.primary_email, edited.username),
+                             (originals[user.pk].primary_email, originals[user.pk].username))
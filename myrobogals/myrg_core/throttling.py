@@ -0,0 +1,299 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from collections import OrderedDict
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .functions import get_remote_ip
+
+# API throttling.
+#
+# Each request takes tokens from several token buckets at once:
+#
+#   "ip"            One per client IP (see myrg_core.functions.get_remote_ip;
+#                   behind a reverse proxy, set TRUSTED_PROXIES).
+#   "user"          One per authenticated user. Users acting under a role
+#                   whose role class is named in `ROLE_CLASS_RATES` get that
+#                   rate instead of `RATES["user"]`. The role class is
+#                   selected and cached with the role (see
+#                   myrg_groups.rolecache), so a renamed role class takes
+#                   effect once the cached roles expire.
+#   "role_class"    One per role class, shared by everyone acting under it.
+#
+# A rate is (capacity, tokens refilled per second); a scope whose rate is None
+# is not throttled. The request is let through only if every bucket holds
+# enough tokens, and is otherwise answered 429 THROTTLED with an
+# X-Throttle-Wait-Seconds header (and, from DRF 2.4, Retry-After), before it
+# is logged or handled (see RobogalsAPIView.initial).
+#
+# A request costs `COSTS[path]` (1 by default) tokens per unit, where a list
+# call's units are its page length in `LIST_ROWS_PER_UNIT`s and the units of
+# the calls in UNITS are e.g. the number of recipients. A request costing
+# more than a bucket's capacity empties it instead. Batch sub-requests are
+# charged individually.
+#
+# Backends:
+#   "local"     Process-local buckets, so each worker process throttles
+#               separately. At most `MAX_ENTRIES` buckets are kept, the least
+#               recently used being dropped (refilled) first.
+#   "django"    Django's cache framework, using the `CACHE_ALIAS` cache, shared
+#               by every process. Updates are not atomic, so concurrent
+#               requests may occasionally both take the same tokens.
+#
+# Refer to THROTTLING in myrg_core/settings.py
+
+DEFAULTS = {
+    "ENABLED": True,
+    "BACKEND": "local",
+    "MAX_ENTRIES": 100000,
+    "CACHE_ALIAS": "default",
+    "RATES": {
+        "ip": (600, 10),
+        "user": (300, 5),
+        "role_class": None,
+    },
+    "ROLE_CLASS_RATES": {},
+    "COSTS": {
+        "/api/1.0/utils/pwdreset/initiate": 20,
+        "/api/1.0/messages/send": 2,
+    },
+    "LIST_ROWS_PER_UNIT": 100,
+}
+
+KEY_PREFIX = "myrg_throttle:"
+
+SCOPES = ("ip", "user", "role_class")
+
+
+def get_throttling_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "THROTTLING", {}))
+    return options
+
+
+
+################################################################################
+# Costs
+################################################################################
+def count_list(data, key):
+    try:
+        return len(list(data.get(key) or ()))
+    except (AttributeError, TypeError):
+        return 0
+
+def count_recipients(data):
+    """Recipients across the messages of a messages/send request."""
+    recipients = 0
+
+    try:
+        for message in data.get("message") or ():
+            for value in dict(message.get("data") or {}).values():
+                recipients += count_list(value, "recipients")
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    return recipients
+
+# {path: function of the request data returning its units}
+UNITS = {
+    "/api/1.0/utils/pwdreset/initiate": lambda data: count_list(data, "primary_email"),
+    "/api/1.0/messages/send": count_recipients,
+}
+
+def get_page_length(data):
+    try:
+        return max(int(data["pagination"]["length"]), 0)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def get_cost(path, data):
+    """Returns the tokens a request to `path` with `data` costs."""
+    options = get_throttling_settings()
+
+    if not isinstance(data, dict):
+        data = {}
+
+    page_length = get_page_length(data)
+
+    if path in UNITS:
+        units = UNITS[path](data)
+    elif page_length is not None:
+        units = int(math.ceil(page_length / float(options["LIST_ROWS_PER_UNIT"])))
+    else:
+        units = 1
+
+    return options["COSTS"].get(path, 1) * max(units, 1)
+
+
+
+################################################################################
+# Backends
+################################################################################
+# Buckets are stored as (tokens, time last updated).
+
+def refill(bucket, rate, now):
+    """Returns the tokens in `bucket` at `now`."""
+    capacity, refill_rate = rate
+
+    if bucket is None:
+        return capacity
+
+    tokens, updated = bucket
+
+    return min(capacity, tokens + max(now - updated, 0) * refill_rate)
+
+def take(buckets, limits, cost, now):
+    """Takes `cost` tokens from every bucket, if each has enough.
+
+    `buckets` holds the current (tokens, updated) or None of each of `limits`,
+    [(key, rate)]. Returns (new buckets, seconds to wait); the new buckets are
+    None if the request is refused.
+    """
+    levels = []
+    wait = 0
+
+    for bucket, (key, rate) in zip(buckets, limits):
+        capacity, refill_rate = rate
+        tokens = refill(bucket, rate, now)
+        needed = min(cost, capacity)
+
+        if tokens < needed:
+            wait = max(wait, (needed - tokens) / float(refill_rate))
+
+        levels.append(tokens - needed)
+
+    if wait:
+        return None, wait
+
+    return [(tokens, now) for tokens in levels], 0
+
+class LocalThrottleBackend(object):
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, limits, cost):
+        with self.lock:
+            now = time.time()
+            buckets, wait = take([self.buckets.get(key) for key, rate in limits], limits, cost, now)
+
+            if buckets is None:
+                return wait
+
+            # Most recently used buckets are kept at the end
+            for (key, rate), bucket in zip(limits, buckets):
+                self.buckets.pop(key, None)
+                self.buckets[key] = bucket
+
+            while len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+
+        return 0
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+class DjangoThrottleBackend(object):
+    def __init__(self, cache_alias):
+        from django.core.cache import get_cache
+        self.cache = get_cache(cache_alias)
+
+    def take(self, limits, cost):
+        now = time.time()
+        keys = [KEY_PREFIX + key for key, rate in limits]
+        stored = self.cache.get_many(keys)
+
+        buckets, wait = take([stored.get(key) for key in keys], limits, cost, now)
+
+        if buckets is None:
+            return wait
+
+        # A bucket left alone until it is full again needs no entry
+        timeout = int(math.ceil(max(capacity / float(refill_rate) for key, (capacity, refill_rate) in limits)))
+        self.cache.set_many(dict(zip(keys, buckets)), timeout)
+
+        return 0
+
+    def clear(self):
+        pass
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_throttle_backend():
+    global _backend
+
+    if _backend is None:
+        options = get_throttling_settings()
+
+        with _backend_lock:
+            if _backend is None:
+                if options["BACKEND"] == "local":
+                    _backend = LocalThrottleBackend(options["MAX_ENTRIES"])
+                elif options["BACKEND"] == "django":
+                    _backend = DjangoThrottleBackend(options["CACHE_ALIAS"])
+                else:
+                    raise ValueError("THROTTLING BACKEND must be one of \"local\" or \"django\"")
+
+    return _backend
+
+
+
+################################################################################
+# Throttle
+################################################################################
+def get_limits(ip, user_id, role):
+    """Returns [(bucket key, rate)] of the buckets a request takes tokens
+    from.
+    """
+    options = get_throttling_settings()
+    rates = dict(DEFAULTS["RATES"], **options["RATES"])
+
+    if role is not None and options["ROLE_CLASS_RATES"]:
+        rates["user"] = options["ROLE_CLASS_RATES"].get(role.role_class.name, rates["user"])
+
+    idents = {
+        "ip": ip,
+        "user": user_id,
+        "role_class": role.role_class_id if role is not None else None,
+    }
+
+    return [("{}:{}".format(scope, idents[scope]), rates[scope])
+            for scope in SCOPES
+            if idents[scope] is not None and rates[scope] is not None]
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttles API calls by IP, user and role class. Reads the user and role
+    set on RobogalsAPIView; other views are throttled by IP and user.
+    """
+    wait_time = None
+
+    def allow_request(self, request, view):
+        if not get_throttling_settings()["ENABLED"]:
+            return True
+
+        user_id = getattr(view, "user_id", None)
+
+        if user_id is None and request.user.is_authenticated():
+            user_id = request.user.pk
+
+        limits = get_limits(get_remote_ip(request), user_id, getattr(view, "role_obj", None))
+
+        if not limits:
+            return True
+
+        self.wait_time = get_throttle_backend().take(limits, get_cost(request.path, request.DATA))
+
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
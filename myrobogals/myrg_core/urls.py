@@ -12,7 +12,7 @@ from myrg_users.models import RobogalsUser
 from rest_framework.routers import DefaultRouter
 from rest_framework.urlpatterns import format_suffix_patterns
 
-from myrg_core.views import Time
+from myrg_core.views import Time, Metrics, Batch
 from myrg_users.views import ListUsers, DeleteUsers, EditUsers, CreateUsers, ResetUserPasswords, ResetUserPasswordsComplete, WhoAmI, ListMyRoles, KillSessions
 from myrg_groups.views import ListGroups, DeleteGroups, EditGroups, CreateGroups, ListRoles, EditRoles, CreateRoles, ListRoleClasses, DeleteRoleClasses, EditRoleClasses, CreateRoleClasses
 from myrg_repo.views import ListRepoFiles, DeleteRepoFiles, ListRepoContainers, DeleteRepoContainers, EditRepoContainers, CreateRepoContainers
@@ -36,9 +36,12 @@ urlpatterns = patterns('',
 # API 1.0
 api_urlpatterns = patterns('',
     url(r'^api/1.0/utils/time$', Time.as_view()),
+    url(r'^api/1.0/utils/metrics$', Metrics.as_view()),
     url(r'^api/1.0/utils/pwdreset/initiate$', ResetUserPasswords.as_view()),
     url(r'^api/1.0/utils/pwdreset/complete', ResetUserPasswordsComplete.as_view()),
 
+    url(r'^api/1.0/batch$', Batch.as_view()),
+
     url(r'^api/1.0/users/list$', ListUsers.as_view()),
     url(r'^api/1.0/users/delete$', DeleteUsers.as_view()),
     url(r'^api/1.0/users/edit$', EditUsers.as_view()),
@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from .signals import queryset_updated
+
+# Model versions.
+#
+# A counter per model, changed on every write to the model's table, which
+# lets derived data (e.g. cached list counts) be keyed on the version instead
+# of being deleted explicitly. Models with multi-table inheritance share the
+# version of their topmost concrete parent, since a write to any of them may
+# change rows seen through the others.
+#
+# Versions are stored in the `CACHE_ALIAS` cache. Versions start from the
+# current time in milliseconds, so that a version lost to cache eviction is
+# never reused. Writes through QuerySet.update() must be announced with the
+# queryset_updated signal (see myrg_core.signals), whose errors are logged
+# rather than raised.
+#
+# Versions kept in a per-process cache (locmem, or the dummy cache) would not
+# see writes made by other processes, so unless SHARED says otherwise the
+# data keyed on them (ETags, cached counts) is not used with such a cache.
+#
+# Refer to MODEL_VERSIONS in myrg_core/settings.py
+
+DEFAULTS = {
+    "CACHE_ALIAS": "default",
+    "SHARED": None,             # None: unless the cache is per-process
+}
+
+KEY_PREFIX = "myrg_version:"
+
+logger = logging.getLogger(__name__)
+
+
+def get_versions_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "MODEL_VERSIONS", {}))
+    return options
+
+_cache = None
+
+def get_versions_cache():
+    global _cache
+
+    if _cache is None:
+        from django.core.cache import get_cache
+        _cache = get_cache(get_versions_settings()["CACHE_ALIAS"])
+
+    return _cache
+
+_warned_unshared = False
+
+def versions_are_shared():
+    """Whether every process sees the same versions, so that data keyed on
+    them can be trusted.
+    """
+    global _warned_unshared
+
+    shared = get_versions_settings()["SHARED"]
+
+    if shared is None:
+        from django.core.cache.backends.dummy import DummyCache
+        from django.core.cache.backends.locmem import LocMemCache
+
+        shared = not isinstance(get_versions_cache(), (DummyCache, LocMemCache))
+
+        if not shared and not _warned_unshared:
+            _warned_unshared = True
+            logger.warning("MODEL_VERSIONS['CACHE_ALIAS'] names a per-process cache; ETags and cached counts are disabled.")
+
+    return shared
+
+def get_version_key(model):
+    parents = model._meta.get_parent_list()
+
+    if parents:
+        # The topmost parent is the one without parents of its own
+        model = [parent for parent in parents if not parent._meta.get_parent_list()][0]
+
+    return "{}{}.{}".format(KEY_PREFIX, model._meta.app_label, model._meta.object_name.lower())
+
+def _new_version():
+    return int(time.time() * 1000)
+
+def get_model_version(model):
+    cache = get_versions_cache()
+    key = get_version_key(model)
+
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+
+    return version
+
+def bump_model_version(model):
+    cache = get_versions_cache()
+    key = get_version_key(model)
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set (or evicted)
+        cache.set(key, _new_version(), None)
+
+
+
+################################################################################
+# Signal receivers
+################################################################################
+def _model_written(sender, **kwargs):
+    bump_model_version(sender)
+
+_tracked_models = set()
+_tracked_models_lock = threading.Lock()
+
+def track_model_versions(model):
+    """Bumps the version of `model` whenever it is written."""
+    with _tracked_models_lock:
+        if model in _tracked_models:
+            return
+        _tracked_models.add(model)
+
+    dispatch_uid = "myrg_core.versions.{}".format(get_version_key(model))
+
+    post_save.connect(_model_written, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(_model_written, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    queryset_updated.connect(_model_written, sender=model, weak=False, dispatch_uid=dispatch_uid)
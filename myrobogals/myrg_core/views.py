@@ -7,10 +7,20 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from django.http import HttpResponse
 from django.utils import timezone
 import calendar
 
+from .classes import RobogalsAPIView
+from . import replicas
+from .functions import get_remote_ip
+from .metrics import get_metrics_settings, collect_exports, merge_exports, render_prometheus
+from .batch import BatchError, BatchContext, parse_subrequests, run_subrequests, run_subrequests_atomically
+
 class Time(APIView):
+    # Clients poll the time to sync their clocks; never throttle it
+    throttle_classes = ()
+    
     def metadata(self, request):
         """
         Don't include the view description in OPTIONS responses.
@@ -28,3 +38,45 @@ class Time(APIView):
             }
         })
 
+class Metrics(APIView):
+    # Scrapers are limited by ALLOWED_IPS, and must not be throttled out of
+    # the metrics they collect
+    throttle_classes = ()
+    
+    def get(self, request, format=None):
+        if get_remote_ip(request) not in get_metrics_settings()["ALLOWED_IPS"]:
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        
+        histograms, requests = merge_exports(collect_exports())
+        
+        return HttpResponse(render_prometheus(histograms, requests),
+                            content_type="text/plain; version=0.0.4; charset=utf-8")
+
+class Batch(RobogalsAPIView):
+    subrequests_read_only = False
+    
+    def post(self, request, format=None):
+        try:
+            subrequests = parse_subrequests(request.DATA, type(self))
+        except BatchError as e:
+            return Response({"detail": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        
+        self.subrequests_read_only = all(subrequest.read_only for subrequest in subrequests)
+        
+        context = BatchContext(self)
+        
+        if self.subrequests_read_only and not replicas.is_pinned(request._request):
+            context.read_database = replicas.choose_replica()
+        
+        if request.DATA.get("atomic"):
+            responses, rolled_back = run_subrequests_atomically(request._request, subrequests, context)
+            
+            if rolled_back:
+                return Response({"detail": "BATCH_ROLLED_BACK", "responses": responses}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            responses = run_subrequests(request._request, subrequests, context, bool(request.DATA.get("concurrent")))
+        
+        return Response({"responses": responses})
+    
+    def writes(self, request):
+        return not self.subrequests_read_only
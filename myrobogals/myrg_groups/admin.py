@@ -56,6 +56,8 @@ class RoleAdmin(admin.ModelAdmin):
     search_fields = ('user__username','role_class__name',)
     ordering = ('user__username',)
 
+    list_select_related = ('user','role_class','group',)
+
     def get_fieldsets(self, request, obj=None):
         if not obj:
             return self.add_fieldsets
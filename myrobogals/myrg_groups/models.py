@@ -64,6 +64,10 @@ class Group(models.Model):
     
     # Fields that cannot be written to
     READONLY_FIELDS = ("id","date_created",)
+
+    class Meta:
+        # Lists sort by name, skipping deleted groups (status 0)
+        index_together = (("name", "status"),)
     
     def __str__(self):
         return self.name
@@ -187,8 +191,27 @@ class Role(models.Model):
     # Fields that cannot be written to
     READONLY_FIELDS = ("id",)
 
+    class Meta:
+        # Active roles are looked up by user and date range, and listed by
+        # date range
+        index_together = (("user", "date_start", "date_end"), ("date_start", "date_end"),)
     
     def __str__(self):
         return "{} ({} @ {})".format(self.user.get_sortable_name, self.role_class, self.group)
 
 
+# Keep cached active role lookups in step with the table
+from django.db.models.signals import post_save, post_delete
+from myrg_core.signals import queryset_updated
+from .rolecache import invalidate_cached_role, invalidate_cached_roles
+
+post_save.connect(invalidate_cached_role, sender=Role)
+post_delete.connect(invalidate_cached_role, sender=Role)
+queryset_updated.connect(invalidate_cached_roles, sender=Role)
+
+# Full-text search over groups of every type (see myrg_core.search)
+from myrg_core.search import search_indexes
+
+search_indexes.register("groups", Group, ("name", "description"))
+
+
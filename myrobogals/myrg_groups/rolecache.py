@@ -0,0 +1,228 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import smart_text
+
+# Active role resolution cache.
+#
+# Resolving the role a request acts under used to run the active role query
+# against the database on every API call. Resolved roles are now cached per
+# (user, role) pair together with their validity window, so that expiry is
+# checked locally, and entries are invalidated by the Role post_save,
+# post_delete and queryset_updated signals (see myrg_groups.models).
+#
+# Backends:
+#   "local"     Process-local LRU. Invalidation only reaches the process that
+#               saved the role, so entries expire after `TIMEOUT` seconds:
+#               a revoked role keeps authorizing requests in other processes
+#               for up to that long. Keep it to a few seconds.
+#   "django"    Django's cache framework, using the `CACHE_ALIAS` cache. With
+#               a cache shared by every process (e.g. memcached),
+#               invalidation reaches them all and `TIMEOUT` may be longer.
+#   None        No caching.
+#
+# Roles are always read from the default database, never from a replica
+# (see myrg_core.replicas), which could cache a role revoked moments ago.
+#
+# Refer to ROLE_CACHE in myrg_core/settings.py
+
+DEFAULTS = {
+    "BACKEND": "local",
+    "MAX_ENTRIES": 10000,
+    "TIMEOUT": 5,
+    "CACHE_ALIAS": "default",
+}
+
+KEY_PREFIX = "myrg_role:"
+
+
+def active_role_q(now=None):
+    """Q object selecting roles which are active at `now`."""
+    if now is None:
+        now = timezone.now()
+    return Q(date_start__lte=now) & (Q(date_end__isnull=True) | Q(date_end__gte=now))
+
+def get_role_cache_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "ROLE_CACHE", {}))
+    return options
+
+
+
+################################################################################
+# Backends
+################################################################################
+# Entries are stored under the role's primary key as
+# (user_id, date_start, date_end, role) tuples; a lookup only hits when the
+# stored user matches the requesting user.
+
+class LocalRoleCache(object):
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, role_id):
+        with self.lock:
+            entry = self.entries.pop(role_id, None)
+
+            if entry is None:
+                return None
+
+            expires, value = entry
+
+            if expires < time.time():
+                return None
+
+            # Most recently used entries are kept at the end
+            self.entries[role_id] = entry
+
+        return value
+
+    def set(self, role_id, value):
+        with self.lock:
+            self.entries.pop(role_id, None)
+            self.entries[role_id] = (time.time() + self.timeout, value)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, role_id):
+        with self.lock:
+            self.entries.pop(role_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class DjangoRoleCache(object):
+    def __init__(self, cache_alias, timeout):
+        from django.core.cache import get_cache
+        self.cache = get_cache(cache_alias)
+        self.timeout = timeout
+
+    def get(self, role_id):
+        return self.cache.get(KEY_PREFIX + role_id)
+
+    def set(self, role_id, value):
+        self.cache.set(KEY_PREFIX + role_id, value, self.timeout)
+
+    def delete(self, role_id):
+        self.cache.delete(KEY_PREFIX + role_id)
+
+    def clear(self):
+        pass
+
+
+_role_cache = None
+_role_cache_lock = threading.Lock()
+
+def get_role_cache():
+    """Returns the configured role cache backend, or None if disabled."""
+    global _role_cache
+
+    if _role_cache is None:
+        options = get_role_cache_settings()
+
+        if options["BACKEND"] is None:
+            return None
+
+        with _role_cache_lock:
+            if _role_cache is None:
+                if options["BACKEND"] == "local":
+                    _role_cache = LocalRoleCache(options["MAX_ENTRIES"], options["TIMEOUT"])
+                elif options["BACKEND"] == "django":
+                    _role_cache = DjangoRoleCache(options["CACHE_ALIAS"], options["TIMEOUT"])
+                else:
+                    raise ValueError("ROLE_CACHE BACKEND must be one of \"local\", \"django\" or None")
+
+    return _role_cache
+
+
+
+################################################################################
+# Lookup
+################################################################################
+# Related objects selected with the role, and kept in the cache with it; the
+# throttle reads the role class name on every call (see myrg_core.throttling)
+CACHED_RELATIONS = ("role_class",)
+
+def _detached(role):
+    # Callers get their own copy, so related objects they load (e.g.
+    # `role.group`) never end up on the cached instance.
+    role_copy = copy.copy(role)
+
+    for field in role._meta.fields:
+        if field.rel is not None:
+            related = role_copy.__dict__.pop(field.get_cache_name(), None)
+
+            if related is not None and field.name in CACHED_RELATIONS:
+                role_copy.__dict__[field.get_cache_name()] = copy.copy(related)
+
+    return role_copy
+
+def cache_active_role(role):
+    role_cache = get_role_cache()
+
+    if role_cache is not None:
+        role_cache.set(role.pk, (role.user_id, role.date_start, role.date_end, _detached(role)))
+
+def get_active_role(user, role_id):
+    """Returns the role `role_id` of `user` if it is currently active.
+
+    Raises Role.DoesNotExist otherwise.
+    """
+    from .models import Role
+
+    if (user is None) or (user.pk is None):
+        raise Role.DoesNotExist()
+
+    role_id = smart_text(role_id)
+    role_cache = get_role_cache()
+    now = timezone.now()
+
+    if role_cache is not None:
+        entry = role_cache.get(role_id)
+
+        if entry is not None:
+            user_id, date_start, date_end, role = entry
+
+            if user_id == user.pk:
+                if date_start <= now and (date_end is None or date_end >= now):
+                    return _detached(role)
+
+                # Outside of its validity window
+                role_cache.delete(role_id)
+                raise Role.DoesNotExist()
+
+    role = Role.objects.using(router.db_for_write(Role)).select_related(*CACHED_RELATIONS).filter(active_role_q(now)).get(user=user, pk=role_id)
+
+    cache_active_role(role)
+
+    return role
+
+def invalidate_cached_role(sender, instance, **kwargs):
+    """Role post_save/post_delete receiver."""
+    role_cache = get_role_cache()
+
+    if role_cache is not None:
+        role_cache.delete(instance.pk)
+
+def invalidate_cached_roles(sender, pks, **kwargs):
+    """Role queryset_updated receiver."""
+    role_cache = get_role_cache()
+
+    if role_cache is not None:
+        for pk in pks:
+            role_cache.delete(smart_text(pk))
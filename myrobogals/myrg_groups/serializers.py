@@ -6,6 +6,8 @@ from .models import Group, RoleClass, Role
 
 from rest_framework import serializers
 
+from myrg_core.serializers import BulkSerializerMixin
+
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
@@ -22,4 +24,10 @@ class RoleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Role
         read_only_fields = Role.READONLY_FIELDS
-        write_only_fields = Role.PROTECTED_FIELDS
\ No newline at end of file
+        write_only_fields = Role.PROTECTED_FIELDS
+
+class GroupBulkSerializer(BulkSerializerMixin, GroupSerializer):
+    pass
+
+class RoleBulkSerializer(BulkSerializerMixin, RoleSerializer):
+    pass
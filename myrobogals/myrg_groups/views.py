@@ -11,137 +11,55 @@ from django.db.models.fields import FieldDoesNotExist
 from django.db.models import Q
 from django.db import transaction
 from django.utils import timezone
+from django.utils.encoding import smart_text
 
 from .models import Group, Chapter, School, Company, RoleClass, Role
-from .serializers import GroupSerializer, RoleClassSerializer, RoleSerializer
+from .serializers import GroupSerializer, GroupBulkSerializer, RoleClassSerializer, RoleSerializer, RoleBulkSerializer
+from .rolecache import active_role_q
+
+from myrg_core.bulkedit import edit_objects
+from myrg_core.listing import list_engine
+from myrg_core.serializers import serializer_for
+from myrg_core.signals import send_queryset_updated
 
 
-PAGINATION_MAX_LENGTH = 1000
 
         
 # Group
 ################################################################################
+GROUP_MODELS = {
+    "chapters": Chapter,
+    "schools": School,
+    "companies": Company,
+    "general": Group,
+}
+
+group_lists = dict((group_type, list_engine.register("groups." + group_type, group_model, GroupSerializer, "group",
+                                                     queryset=group_model.objects.filter(status__gt=0)))
+                   for group_type, group_model in six.iteritems(GROUP_MODELS))
+
 class ListGroups(RobogalsAPIView):
+    read_only = True
+    etag_models = (Group,)
+    
     def post(self, request, format=None):
         # request.DATA
         try:
-            requested_fields = list(request.DATA.get("query"))
             requested_group = dict(request.DATA.get("group"))
-            requested_pagination = dict(request.DATA.get("pagination"))
         except:
             return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
             
-        if (not requested_fields) or (not requested_pagination) or (not requested_group):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
+        if not requested_group:
             return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
         
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
         
         # Group model
-        serializer = GroupSerializer
-        
-        if requested_group.get("type") == 'chapters':
-            group_model = Chapter
-        elif requested_group.get("type") == 'schools':
-            group_model = School
-        elif requested_group.get("type") == 'companies':
-            group_model = Company
-        elif requested_group.get("type") == 'general':
-            group_model = Group
-        else:
-            return Response({"detail":"DATA_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        serializer.Meta.model = group_model
-        
-        # Filter
-        filter_dict = {}
-        sort_fields = []
-        fields = ["id"]
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("search")
-            field_order = field_object.get("order")
-            field_visibility = field_object.get("visibility")
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = str(field_name)
-            
-            # Block protected fields like passwords
-            if field_name in group_model.PROTECTED_FIELDS:
-                return Response({"detail":"`{}` is a protected field.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Non-valid field names
-            # ! Uses _meta non-documented API
-            try:
-                group_model._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None):
-                filter_dict.update({field_name+"__icontains": str(field_query)})
-            
-            if (field_order is not None):
-                field_order = str(field_order)
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = group_model.objects.filter(status__gt=0)
-        query = query.filter(**filter_dict)
-        query = query.order_by(*sort_fields)
-        
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer.Meta.fields = fields
-        serialized_query = serializer(query, many=True)
-        
-        
-        # Output
-        output_list = []
-        
-        for group_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": group_object.pop("id")})
-            new_dict.update({"data": group_object})
-        
-            output_list.append(new_dict)
+        group_list = group_lists.get(requested_group.get("type"))
         
+        if group_list is None:
+            return Response({"detail":"DATA_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({
-                            "meta": {
-                                "size": query_size
-                            },
-                            "group": output_list
-                        })
+        return group_list.respond(request)
 
 class DeleteGroups(RobogalsAPIView):
     def post(self, request, format=None):
@@ -187,6 +105,8 @@ class DeleteGroups(RobogalsAPIView):
         except:
             for pk in requested_ids:
                 failed_ids.update({pk: "OBJECT_NOT_MODIFIED"})
+        else:
+            send_queryset_updated(Group, affected_ids)
 
         # Gather up non-deleted IDs
         non_deleted_ids = list(set(requested_ids)-set(affected_ids))
@@ -213,6 +133,7 @@ class EditGroups(RobogalsAPIView):
                 
         failed_group_updates = {}
         completed_group_updates = []
+        group_updates = []
         
         # Filter out bad data
         for group_object in supplied_groups:
@@ -262,27 +183,12 @@ class EditGroups(RobogalsAPIView):
             if skip_group:
                 continue
             
-            
-            # Fetch, serialise and save
-            try:
-                group_query = Group.objects.get(status__gt=0, pk=group_id)
-            except:
-                failed_group_updates.update({group_id: "OBJECT_NOT_FOUND"})
-                continue
-                
-            serializer = GroupSerializer
-            serialized_group = serializer(group_query, data=group_update_dict, partial=True)
+            group_updates.append((group_id, group_update_dict))
+        
+        
+        # Fetch, serialise and save
+        edit_objects(Group.objects.filter(status__gt=0), GroupBulkSerializer(partial=True), group_updates, failed_group_updates, completed_group_updates)
         
-            if serialized_group.is_valid():
-                try:
-                    with transaction.atomic():
-                        serialized_group.save()
-                        completed_group_updates.append(group_id)
-                except:
-                    failed_group_updates.update({group_id: "OBJECT_NOT_MODIFIED"})
-            else:
-                failed_group_updates.update({group_id: "DATA_VALIDATION_FAILED"})
-                
         return Response({
             "fail": {
                 "id": failed_group_updates
@@ -346,8 +252,6 @@ class CreateGroups(RobogalsAPIView):
             group_create_dict.update({"creator": request.user.pk})
         
             # Group model
-            serializer = GroupSerializer
-            
             if requested_group.get("type") == 'chapters':
                 group_model = Chapter
             elif requested_group.get("type") == 'schools':
@@ -359,7 +263,7 @@ class CreateGroups(RobogalsAPIView):
             else:
                 return Response({"detail":"DATA_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
             
-            serializer.Meta.model = group_model
+            serializer = serializer_for(GroupSerializer, model=group_model)
         
         
             # Serialise and save
@@ -388,112 +292,15 @@ class CreateGroups(RobogalsAPIView):
         
 # Role Class
 ################################################################################
+roleclass_list = list_engine.register("roleclasses", RoleClass, RoleClassSerializer, "role_class",
+                                     queryset=RoleClass.objects.filter(is_active=True))
+
 class ListRoleClasses(RobogalsAPIView):
+    read_only = True
+    etag_models = (RoleClass,)
+    
     def post(self, request, format=None):
-        # request.DATA
-        try:
-            requested_fields = list(request.DATA.get("query"))
-            requested_pagination = dict(request.DATA.get("pagination"))
-        except:
-            return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if (not requested_fields) or (not requested_pagination):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Filter
-        filter_dict = {}
-        sort_fields = []
-        fields = ["id"]
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("search")
-            field_order = field_object.get("order")
-            field_visibility = field_object.get("visibility")
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = str(field_name)
-            
-            # Block protected fields like passwords
-            if field_name in RoleClass.PROTECTED_FIELDS:
-                return Response({"detail":"`{}` is a protected field.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Non-valid field names
-            # ! Uses _meta non-documented API
-            try:
-                RoleClass._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None):
-                filter_dict.update({field_name+"__icontains": str(field_query)})
-            
-            if (field_order is not None):
-                field_order = str(field_order)
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = RoleClass.objects.filter(is_active=True)
-        query = query.filter(**filter_dict)
-        query = query.order_by(*sort_fields)
-        
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer = RoleClassSerializer
-        serializer.Meta.fields = fields
-        
-        serialized_query = serializer(query, many=True)
-        
-        
-        # Output
-        output_list = []
-        
-        for roleclass_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": roleclass_object.pop("id")})
-            new_dict.update({"data": roleclass_object})
-        
-            output_list.append(new_dict)
-        
-        
-        return Response({
-                            "meta": {
-                                "size": query_size
-                            },
-                            "role_class": output_list
-                        })
+        return roleclass_list.respond(request)
 
 class DeleteRoleClasses(RobogalsAPIView):
     def post(self, request, format=None):
@@ -538,6 +345,8 @@ class DeleteRoleClasses(RobogalsAPIView):
         except:
             for pk in requested_ids:
                 failed_ids.update({pk: "OBJECT_NOT_MODIFIED"})
+        else:
+            send_queryset_updated(RoleClass, affected_ids)
 
         # Gather up non-deleted IDs
         non_deleted_ids = list(set(requested_ids)-set(affected_ids))
@@ -721,112 +530,16 @@ class CreateRoleClasses(RobogalsAPIView):
         
 # Role
 ################################################################################
+role_list = list_engine.register("roles", Role, RoleSerializer, "role",
+                                queryset=lambda: Role.objects.filter(active_role_q()))
+
 class ListRoles(RobogalsAPIView):
+    read_only = True
+    etag_models = (Role,)
+    etag_period = 60
+    
     def post(self, request, format=None):
-        # request.DATA
-        try:
-            requested_fields = list(request.DATA.get("query"))
-            requested_pagination = dict(request.DATA.get("pagination"))
-        except:
-            return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if (not requested_fields) or (not requested_pagination):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Filter
-        filter_dict = {}
-        sort_fields = []
-        fields = ["id"]
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("search")
-            field_order = field_object.get("order")
-            field_visibility = field_object.get("visibility")
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = str(field_name)
-            
-            # Block protected fields like passwords
-            if field_name in Role.PROTECTED_FIELDS:
-                return Response({"detail":"`{}` is a protected field.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Non-valid field names
-            # ! Uses _meta non-documented API
-            try:
-                Role._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None):
-                filter_dict.update({field_name+"__icontains": str(field_query)})
-            
-            if (field_order is not None):
-                field_order = str(field_order)
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = Role.objects.filter(Q(date_start__lte=timezone.now()) & (Q(date_end__isnull=True) | Q(date_end__gte=timezone.now())))
-        query = query.filter(**filter_dict)
-        query = query.order_by(*sort_fields)
-        
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer = RoleSerializer
-        serializer.Meta.fields = fields
-        
-        serialized_query = serializer(query, many=True)
-        
-        
-        # Output
-        output_list = []
-        
-        for role_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": role_object.pop("id")})
-            new_dict.update({"data": role_object})
-        
-            output_list.append(new_dict)
-        
-        
-        return Response({
-                            "meta": {
-                                "size": query_size
-                            },
-                            "role": output_list
-                        })
+        return role_list.respond(request)
 
 class EditRoles(RobogalsAPIView):
     def post(self, request, format=None):
@@ -838,6 +551,7 @@ class EditRoles(RobogalsAPIView):
                 
         failed_role_updates = {}
         completed_role_updates = []
+        role_updates = []
         
         # Filter out bad data
         for role_object in supplied_roles:
@@ -846,7 +560,7 @@ class EditRoles(RobogalsAPIView):
             
             
             try:
-                role_id = int(role_object.get("id"))
+                role_id = smart_text(role_object.get("id"))
                 role_data = dict(role_object.get("data"))
             except:
                 return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
@@ -887,27 +601,12 @@ class EditRoles(RobogalsAPIView):
             if skip_role:
                 continue
             
-            
-            # Fetch, serialise and save
-            try:
-                role_query = Role.objects.get(pk=role_id)
-            except:
-                failed_role_updates.update({role_id: "OBJECT_NOT_FOUND"})
-                continue
-                
-            serializer = RoleSerializer
-            serialized_role = serializer(role_query, data=role_update_dict, partial=True)
+            role_updates.append((role_id, role_update_dict))
+        
+        
+        # Fetch, serialise and save
+        edit_objects(Role.objects.all(), RoleBulkSerializer(partial=True), role_updates, failed_role_updates, completed_role_updates)
         
-            if serialized_role.is_valid():
-                try:
-                    with transaction.atomic():
-                        serialized_role.save()
-                        completed_role_updates.append(role_id)
-                except:
-                    failed_role_updates.update({role_id: "OBJECT_NOT_MODIFIED"})
-            else:
-                failed_role_updates.update({role_id: "DATA_VALIDATION_FAILED"})
-                
         return Response({
             "fail": {
                 "id": failed_role_updates
@@ -4,7 +4,7 @@ import six
 
 from django.contrib import admin
 
-from .models import EmailDefinition, SMSDefinition, EmailMessage, SMSMessage
+from .models import EmailDefinition, SMSDefinition, EmailMessage, SMSMessage, EmailOutbox
 
 class EmailDefinitionAdmin(admin.ModelAdmin):
     list_display = (
@@ -29,5 +29,20 @@ class EmailMessageAdmin(admin.ModelAdmin):
     ordering = ('-date_created',)
     
 
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = (
+                    'definition',
+                    'status',
+                    'attempts',
+                    'date_due',
+                    'date_created',
+                    'date_sent',
+                   )
+
+    list_filter = ('status',)
+    ordering = ('-date_created',)
+    
+
 admin.site.register(EmailDefinition, EmailDefinitionAdmin)
-admin.site.register(EmailMessage, EmailMessageAdmin)
\ No newline at end of file
+admin.site.register(EmailMessage, EmailMessageAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
\ No newline at end of file
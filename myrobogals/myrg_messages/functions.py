@@ -6,7 +6,6 @@ import six
 
 from django.db.models.fields import FieldDoesNotExist
 from django.db import transaction
-from django.template.loader import render_to_string
 
 from myrg_users.models import RobogalsUser
 
@@ -14,11 +13,11 @@ from django.conf import settings
 
 from .models import EmailDefinition, EmailMessage
 from .serializers import EmailDefinitionSerializer
+from .outbox import enqueue_email
+from .rendering import get_email_language, render_email
 
 from collections import OrderedDict
 
-import mandrill
-
 def send_email(definition_dict,supplied_recipients,template_dict = None):
     def return_status(success,message):
         return { "success": success, "message": message }
@@ -45,37 +44,6 @@ def send_email(definition_dict,supplied_recipients,template_dict = None):
                     'track_opens': True,
                    }
         
-    if template_dict:
-        template = template_dict.get("template")
-        title = template_dict.get("title")
-        body = definition_dict_internal.get("body")
-        
-        try:
-            definition_dict_internal['body'] = render_to_string(template, {
-                                                                    'title': title,
-                                                                    'body': body,
-                                                                 })
-        except:
-                return return_status(False,"MESSAGE_GENERATION_FAILED")
-    
-    # Email Definition
-    # definition_dict = {
-                        # "sender_role": role_query.pk,
-                        # "sender_name": email_data.get("from_name"),
-                        # "sender_address": user_query.primary_email,
-                        # "subject": email_data.get("subject"),
-                        # "body": email_data.get("body"),
-                        # "html": email_data.get("html"),
-                      # }
-
-    serializer = EmailDefinitionSerializer
-    serialized_message_def = serializer(data=definition_dict_internal)
-    
-    if not serialized_message_def.is_valid():
-        return return_status(False,"DATA_VALIDATION_FAILED")
-
-
-
     # Email Messages
     # Currently supports users only
     #supplied_recipients = list(email_data.get("recipients"))
@@ -114,50 +82,79 @@ def send_email(definition_dict,supplied_recipients,template_dict = None):
     
     
     
+    # Recipients grouped by the language written to them: one message per
+    # language, with the template rendered in that language and its CSS
+    # already inlined (see myrg_messages.rendering)
+    language_recipients = OrderedDict()
+    language_bodies = OrderedDict()
+    
+    if template_dict:
+        for recipient in recipients_list:
+            language = get_email_language([email_user_dict[recipient["email"]]])
+            language_recipients.setdefault(language, []).append(recipient)
+    
+    if not language_recipients:
+        language_recipients[None] = recipients_list
+    
+    if template_dict:
+        template = template_dict.get("template")
+        title = template_dict.get("title")
+        body = definition_dict_internal.get("body")
+        
+        try:
+            for language in language_recipients:
+                language_bodies[language] = render_email(template, {
+                                                             'title': title,
+                                                             'body': body,
+                                                         }, language)
+        except:
+                return return_status(False,"MESSAGE_GENERATION_FAILED")
+        
+        # The definition keeps the message as sent in the first language
+        definition_dict_internal['body'] = list(language_bodies.values())[0]
+        
+        message_dict.update({"inline_css": False})
+    else:
+        language_bodies[None] = definition_dict_internal.get("body")
+    
+    # Email Definition
+    # definition_dict = {
+                        # "sender_role": role_query.pk,
+                        # "sender_name": email_data.get("from_name"),
+                        # "sender_address": user_query.primary_email,
+                        # "subject": email_data.get("subject"),
+                        # "body": email_data.get("body"),
+                        # "html": email_data.get("html"),
+                      # }
+
+    serializer = EmailDefinitionSerializer
+    serialized_message_def = serializer(data=definition_dict_internal)
+    
+    if not serialized_message_def.is_valid():
+        return return_status(False,"DATA_VALIDATION_FAILED")
+    
+    
     
     # Finish message
     message_dict.update({
-                            "to": recipients_list,
                             "subject": definition_dict_internal.get("subject"),
                             "from_name": definition_dict_internal.get("sender_name"),
                             "from_email": definition_dict_internal.get("sender_address"),
                         })
     
-    if definition_dict_internal.get("html"):
-        message_dict.update({"html": definition_dict_internal.get("body")})
-    else:
-        message_dict.update({"text": definition_dict_internal.get("body")})
-
+    body_field = "html" if definition_dict_internal.get("html") else "text"
     
-    # Send
+    # Queue; sent by `manage.py drain_outbox` (see myrg_messages.outbox)
     try:
         with transaction.atomic():
             message_def = serialized_message_def.save()
             
-            mandrill_client = mandrill.Mandrill(settings.MANDRILL_API_KEY)
-            mandrill_result = mandrill_client.messages.send(message=message_dict, async=False)
+            for language, recipients in six.iteritems(language_recipients):
+                language_message_dict = dict(message_dict, to=recipients)
+                language_message_dict.update({body_field: language_bodies[language]})
+                
+                enqueue_email(message_def, language_message_dict, dict((recipient["email"], email_user_dict[recipient["email"]].pk) for recipient in recipients))
     except:
         return return_status(False,"MESSAGE_DELIVERY_FAILED")
-        
-
-    message_marker_list = []
-    
-    for message in mandrill_result:
-        message_marker_dict = {
-                                "definition" : message_def,
-                                "recipient_user" : email_user_dict.get(message.get("email")),
-                                "recipient_name" : email_user_dict.get(message.get("email")).get_preferred_name(),
-                                "recipient_address" : message.get("email"),
-                                "service_id" : message.get("_id"),
-                                "service_status" : message.get("status"),
-                              }
-        message_marker_list.append(EmailMessage(**message_marker_dict))
-
-    
-    try:
-        with transaction.atomic():
-            EmailMessage.objects.bulk_create(message_marker_list)      
-    except:
-        return return_status(False,"MESSAGE_MARKER_SAVE_FAILED")
 
     return return_status(True,message_def.pk)
\ No newline at end of file
@@ -77,7 +77,8 @@ class Message(models.Model):
 
     service_id = models.CharField(_('service id'),
                                   max_length=63,
-                                  blank=True)
+                                  blank=True,
+                                  db_index=True)
                                   
     service_status = models.CharField(_('service status'),
                                       max_length=31,
@@ -110,4 +111,63 @@ class SMSMessage(Message):
     
     recipient_number = models.CharField(_('recipient number'),
                                          max_length=15,
-                                         blank=False)
\ No newline at end of file
+                                         blank=False)
+
+    
+    
+    
+    
+    
+    
+#@python_2_unicode_compatible
+class EmailOutbox(models.Model):
+    # Emails waiting to be sent by `manage.py drain_outbox`; see
+    # myrg_messages/outbox.py
+    definition = models.ForeignKey(EmailDefinition)
+    
+    # Mandrill message, as JSON
+    message = models.TextField(_('message'),
+                               blank=False)
+    
+    # {recipient address: recipient user id}, as JSON
+    recipients = models.TextField(_('recipients'),
+                                  blank=False)
+    
+    STATUS_CHOICES = (
+        (0, 'Pending'),
+        (1, 'Sending'),
+        (2, 'Sent'),
+        (3, 'Dead'),
+    )
+    status = models.PositiveSmallIntegerField(_('status'),
+                                              choices=STATUS_CHOICES,
+                                              default=0,
+                                              blank=False)
+    
+    attempts = models.PositiveSmallIntegerField(_('attempts'),
+                                                default=0)
+    
+    # When the email is next due to be sent (or its claim expires, while
+    # sending)
+    date_due = models.DateTimeField(_('date due'),
+                                    default=timezone.now)
+    
+    # Identifies the worker which claimed the email
+    claim = models.CharField(_('claim'),
+                             max_length=32,
+                             blank=True)
+    
+    last_error = models.TextField(_('last error'),
+                                  blank=True)
+    
+    date_created = models.DateTimeField(_('date created'),
+                                    blank=False,
+                                    auto_now_add=True)
+    
+    date_sent = models.DateTimeField(_('date sent'),
+                                     null=True,
+                                     blank=True)
+    
+    class Meta:
+        # Workers claim due emails by status and due date
+        index_together = (("status", "date_due"),)
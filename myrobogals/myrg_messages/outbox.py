@@ -0,0 +1,230 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import datetime
+import json
+import random
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .transports import get_transport
+
+# Outbound email queue.
+#
+# `send_email` used to call Mandrill from the request, inside a transaction,
+# so the API call and its database transaction lasted as long as the delivery.
+# It now only commits an EmailOutbox row (see myrg_messages.models), which
+# `manage.py drain_outbox` sends with `WORKERS` concurrent sender threads,
+# through the configured transport (see myrg_messages.transports).
+#
+# Each sender claims up to `BATCH_SIZE` due emails at a time, marking them
+# with a claim token, and holds them for `CLAIM_SECONDS`; emails whose sender
+# died are claimed again once that expires. Any number of drain_outbox
+# processes may run at once. Delivery is at least once: an email is sent
+# again should its sender lose its claim before recording the result.
+#
+# A failed send is retried after `RETRY_DELAY` seconds, doubling with every
+# attempt up to `MAX_RETRY_DELAY` (less up to half, so that emails which
+# failed together are not retried together). After `MAX_ATTEMPTS` attempts
+# the email is left Dead, for `manage.py drain_outbox --retry-dead`.
+#
+# Refer to EMAIL_OUTBOX in myrg_core/settings.py
+
+DEFAULTS = {
+    "WORKERS": 4,
+    "BATCH_SIZE": 10,
+    "CLAIM_SECONDS": 300,
+    "POLL_SECONDS": 2,
+    "MAX_ATTEMPTS": 8,
+    "RETRY_DELAY": 30,
+    "MAX_RETRY_DELAY": 3600,
+}
+
+PENDING = 0
+SENDING = 1
+SENT = 2
+DEAD = 3
+
+
+def get_outbox_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "EMAIL_OUTBOX", {}))
+    return options
+
+def get_retry_delay(attempts):
+    """Seconds to wait before the next attempt, after `attempts` attempts."""
+    options = get_outbox_settings()
+    delay = min(options["RETRY_DELAY"] * 2 ** max(attempts - 1, 0), options["MAX_RETRY_DELAY"])
+
+    return delay * random.uniform(0.5, 1)
+
+
+
+################################################################################
+# Queueing
+################################################################################
+def enqueue_email(definition, message, recipient_users):
+    """Queues the Mandrill `message` of `definition`. `recipient_users` is
+    {recipient address: recipient user id}.
+    """
+    from .models import EmailOutbox
+
+    return EmailOutbox.objects.create(definition=definition,
+                                      message=json.dumps(message),
+                                      recipients=json.dumps(recipient_users))
+
+def retry_dead_emails():
+    """Queues every Dead email again. Returns how many there were."""
+    from .models import EmailOutbox
+
+    return EmailOutbox.objects.filter(status=DEAD).update(status=PENDING, attempts=0, date_due=timezone.now(), claim="")
+
+
+
+################################################################################
+# Sending
+################################################################################
+def claim_emails(limit):
+    """Claims up to `limit` due emails. Returns them."""
+    from .models import EmailOutbox
+
+    now = timezone.now()
+    token = uuid4().hex
+
+    due = EmailOutbox.objects.filter(status__in=(PENDING, SENDING), date_due__lte=now)
+    pks = list(due.order_by("date_due").values_list("pk", flat=True)[:limit])
+
+    if not pks:
+        return []
+
+    # Whichever sender updates a row first claims it; the row is then no
+    # longer due for the others
+    due.filter(pk__in=pks).update(status=SENDING,
+                                  claim=token,
+                                  attempts=F("attempts") + 1,
+                                  date_due=now + datetime.timedelta(seconds=get_outbox_settings()["CLAIM_SECONDS"]))
+
+    return list(EmailOutbox.objects.filter(pk__in=pks, claim=token))
+
+def record_sent(email, results):
+    from .models import EmailOutbox, EmailMessage
+
+    message = json.loads(email.message)
+    recipient_users = json.loads(email.recipients)
+    recipient_names = dict((recipient.get("email"), recipient.get("name")) for recipient in message.get("to", ()))
+
+    with transaction.atomic():
+        EmailMessage.objects.bulk_create([EmailMessage(definition_id=email.definition_id,
+                                                       recipient_user_id=recipient_users.get(result.get("email")),
+                                                       recipient_name=recipient_names.get(result.get("email")) or "",
+                                                       recipient_address=result.get("email"),
+                                                       service_id=result.get("_id") or "",
+                                                       service_status=result.get("status") or "")
+                                          for result in results])
+
+        EmailOutbox.objects.filter(pk=email.pk, claim=email.claim).update(status=SENT, claim="", last_error="", date_sent=timezone.now())
+
+def record_failed(email, error):
+    """Returns True if the email is to be retried, False if it is now Dead."""
+    from .models import EmailOutbox
+
+    retry = email.attempts < get_outbox_settings()["MAX_ATTEMPTS"]
+    now = timezone.now()
+
+    EmailOutbox.objects.filter(pk=email.pk, claim=email.claim).update(status=PENDING if retry else DEAD,
+                                                                      claim="",
+                                                                      last_error=error,
+                                                                      date_due=now + datetime.timedelta(seconds=get_retry_delay(email.attempts)) if retry else now)
+
+    return retry
+
+def deliver(email):
+    """Sends a claimed email. Returns "sent", "retried" or "dead"."""
+    # Claimed again after its sender died while sending it
+    if email.attempts > get_outbox_settings()["MAX_ATTEMPTS"]:
+        record_failed(email, "Claim expired while sending")
+        return "dead"
+
+    try:
+        results = get_transport().send(json.loads(email.message))
+    except Exception as err:
+        return "retried" if record_failed(email, "{}: {}".format(type(err).__name__, err)) else "dead"
+
+    record_sent(email, results)
+
+    return "sent"
+
+
+
+################################################################################
+# Workers
+################################################################################
+class DrainStats(object):
+    def __init__(self):
+        self.counts = {"sent": 0, "retried": 0, "dead": 0}
+        self._lock = threading.Lock()
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+def run_sender(stop, once, batch_size, poll_seconds, stats):
+    while not stop.is_set():
+        # Don't keep a stale connection open while idle
+        close_old_connections()
+
+        try:
+            emails = claim_emails(batch_size)
+
+            if not emails:
+                if once:
+                    break
+
+                stop.wait(poll_seconds)
+                continue
+
+            for email in emails:
+                stats.count(deliver(email))
+        except DatabaseError:
+            # Emails left claimed are claimed again once their claim expires
+            stop.wait(poll_seconds)
+
+    close_old_connections()
+
+def drain(workers=None, batch_size=None, once=False, stop=None):
+    """Sends queued emails with `workers` sender threads until `stop` is set,
+    or, if `once`, until no more are due. Returns {outcome: count}.
+    """
+    options = get_outbox_settings()
+    workers = workers or options["WORKERS"]
+    batch_size = batch_size or options["BATCH_SIZE"]
+    stop = stop or threading.Event()
+    stats = DrainStats()
+
+    senders = [threading.Thread(target=run_sender,
+                                args=(stop, once, batch_size, options["POLL_SECONDS"], stats),
+                                name="myrg-outbox-sender-{}".format(idx))
+               for idx in range(workers)]
+
+    for sender in senders:
+        sender.daemon = True
+        sender.start()
+
+    try:
+        # Joined with a timeout, so that KeyboardInterrupt is still raised
+        while any(sender.is_alive() for sender in senders):
+            for sender in senders:
+                sender.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+
+        for sender in senders:
+            sender.join()
+
+    return stats.counts
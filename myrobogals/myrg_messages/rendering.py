@@ -0,0 +1,376 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from collections import OrderedDict
+import re
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+from django.template import Context
+from django.template.loader import get_template
+from django.utils import translation
+from django.utils.html import conditional_escape
+
+# Email template pipeline.
+#
+# `send_email` used to render its template with render_to_string for every
+# message, and have Mandrill inline the template's stylesheet (`inline_css`)
+# on every send. Each template is now loaded and compiled once per process,
+# and built once per language (under that language's translations) with
+# placeholders for its variables. The build inlines the template's <style>
+# rules into its markup and splits it around the placeholders, so rendering a
+# message only joins the pieces with the escaped values. Values inserted
+# unescaped (e.g. `{{ body|safe }}`) are markup themselves, and have the same
+# rules inlined into them as they are rendered, as if they had been part of
+# the template where they are inserted.
+#
+# The <style> block is kept as well, for rules which cannot be inlined
+# (pseudo-classes, @media, @import). Only type, class and id selectors and
+# descendant combinators are inlined.
+#
+# Built templates are not reloaded when their files change; restart, or call
+# clear_email_templates().
+
+
+def get_email_language(users):
+    """The language to write to `users` in: their common preferred_language,
+    or the first of LANGUAGES should they differ.
+    """
+    languages = set(user.preferred_language for user in users)
+    supported = [code for code, name in settings.LANGUAGES]
+
+    if len(languages) == 1 and list(languages)[0] in supported:
+        return list(languages)[0]
+
+    return supported[0]
+
+
+
+################################################################################
+# CSS inlining
+################################################################################
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_CSS_AT_RULE_RE = re.compile(r"@[^{};]*(?:;|\{(?:[^{}]*\{[^{}]*\})*[^{}]*\})")
+_CSS_RULE_RE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_CSS_COMPOUND_RE = re.compile(r"^([a-zA-Z][\w-]*|\*)?((?:[.#][\w-]+)*)$")
+
+# Comments, <style> and <script> elements, declarations, end tags and start
+# tags (name, attributes, self-closing slash)
+_MARKUP_RE = re.compile(r"<!--.*?-->|<(style|script)\b.*?</\1\s*>|<[!?][^>]*>|"
+                        r"</([a-zA-Z][\w-]*)\s*>|"
+                        r"<([a-zA-Z][\w-]*)((?:\s+[^\s\"'>/=]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?)*)\s*(/?)>",
+                        re.S | re.I)
+_ATTR_RE = re.compile(r"([^\s\"'>/=]+)(?:\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?")
+_STYLE_ATTR_RE = re.compile(r"\s+style\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'>]+)", re.I)
+_STYLE_RE = re.compile(r"<style\b[^>]*>(.*?)</style\s*>", re.S | re.I)
+
+VOID_ELEMENTS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input",
+                           "keygen", "link", "meta", "param", "source", "track", "wbr"])
+
+
+def parse_declarations(text):
+    """Returns [(property, value, important)] of the declarations `text`."""
+    declarations = []
+
+    for declaration in text.split(";"):
+        prop, colon, value = declaration.partition(":")
+        prop = prop.strip().lower()
+        value = value.strip()
+
+        if not colon or not prop or not value:
+            continue
+
+        important = value.lower().endswith("!important")
+
+        if important:
+            value = value[:-len("!important")].rstrip()
+
+        declarations.append((prop, value, important))
+
+    return declarations
+
+def parse_selector(text):
+    """Returns `text` as [(tag, ids, classes)] of its compound selectors from
+    the outermost, with the specificity of `text`, or (None, None) if it cannot
+    be inlined.
+    """
+    compounds = []
+
+    for part in text.split():
+        match = _CSS_COMPOUND_RE.match(part)
+
+        if not match or not (match.group(1) or match.group(2)):
+            return None, None
+
+        tag = match.group(1).lower() if match.group(1) not in (None, "*") else None
+        simple = re.findall(r"[.#][\w-]+", match.group(2))
+
+        compounds.append((tag,
+                          frozenset(name[1:] for name in simple if name[0] == "#"),
+                          frozenset(name[1:] for name in simple if name[0] == ".")))
+
+    if not compounds:
+        return None, None
+
+    specificity = (sum(len(ids) for tag, ids, classes in compounds),
+                   sum(len(classes) for tag, ids, classes in compounds),
+                   sum(1 for tag, ids, classes in compounds if tag))
+
+    return compounds, specificity
+
+def parse_stylesheet(text):
+    """Returns the rules of `text` which can be inlined, as [(specificity,
+    order, [(tag, ids, classes)], declarations)].
+    """
+    text = _CSS_AT_RULE_RE.sub("", _CSS_COMMENT_RE.sub("", text))
+    rules = []
+
+    for selectors, declarations in _CSS_RULE_RE.findall(text):
+        declarations = parse_declarations(declarations)
+
+        for selector in selectors.split(","):
+            compounds, specificity = parse_selector(selector)
+
+            if compounds is not None:
+                rules.append((specificity, len(rules), compounds, declarations))
+
+    return rules
+
+def compound_matches(compound, element):
+    tag, ids, classes = compound
+    element_tag, element_id, element_classes = element
+
+    return ((tag is None or tag == element_tag) and
+            ids <= set([element_id]) and
+            classes <= element_classes)
+
+def selector_matches(compounds, element, ancestors):
+    if not compound_matches(compounds[-1], element):
+        return False
+
+    idx = len(ancestors)
+
+    # Descendant combinators; matching each compound with the nearest
+    # ancestor it can is as good as any
+    for compound in reversed(compounds[:-1]):
+        idx -= 1
+
+        while idx >= 0 and not compound_matches(compound, ancestors[idx]):
+            idx -= 1
+
+        if idx < 0:
+            return False
+
+    return True
+
+def get_style(rules, element, ancestors, inline_style):
+    normal = OrderedDict()
+    important = OrderedDict()
+
+    for specificity, order, compounds, declarations in sorted(rules):
+        if selector_matches(compounds, element, ancestors):
+            for prop, value, is_important in declarations:
+                target = important if is_important else normal
+                target.pop(prop, None)
+                target[prop] = value
+
+    if not normal and not important:
+        return None
+
+    # The element's own style attribute wins over the stylesheet's
+    for prop, value, is_important in parse_declarations(inline_style):
+        target = important if is_important else normal
+        target.pop(prop, None)
+        target[prop] = value
+
+    for prop, value in six.iteritems(important):
+        normal.pop(prop, None)
+        normal[prop] = value + " !important"
+
+    return "; ".join("{}: {}".format(prop, value) for prop, value in six.iteritems(normal)) + ";"
+
+def get_stylesheet_rules(html):
+    """Returns the rules of the <style> blocks of `html` which can be
+    inlined.
+    """
+    return parse_stylesheet("\n".join(_STYLE_RE.findall(html)))
+
+def inline_rules(html, rules, ancestors):
+    """Returns `html` with `rules` copied into the style attributes of the
+    elements they match, as if it were inside `ancestors`, [(tag, id,
+    classes)] of the open elements. `ancestors` is left with the elements
+    still open at the end of `html`.
+    """
+    output = []
+    position = 0
+
+    for match in _MARKUP_RE.finditer(html):
+        end_tag, start_tag, attr_text, self_closing = match.group(2, 3, 4, 5)
+
+        if end_tag:
+            end_tag = end_tag.lower()
+
+            # Closes any elements left open inside it; stray end tags are
+            # ignored
+            for idx in range(len(ancestors) - 1, -1, -1):
+                if ancestors[idx][0] == end_tag:
+                    del ancestors[idx:]
+                    break
+
+            continue
+
+        if not start_tag:
+            continue
+
+        attrs = dict((name.lower(), value.strip("\"'")) for name, value in _ATTR_RE.findall(attr_text))
+        element = (start_tag.lower(), attrs.get("id"), frozenset(attrs.get("class", "").split()))
+
+        style = get_style(rules, element, ancestors, attrs.get("style", ""))
+
+        if style is not None:
+            style_attr = " style=\"{}\"".format(style.replace("\"", "&quot;"))
+
+            if "style" in attrs:
+                attr_text = _STYLE_ATTR_RE.sub(lambda style_match: style_attr, attr_text, count=1)
+            else:
+                attr_text += style_attr
+
+            output.append(html[position:match.start()])
+            output.append("<{}{}{}>".format(start_tag, attr_text, " /" if self_closing else ""))
+            position = match.end()
+
+        if not self_closing and element[0] not in VOID_ELEMENTS:
+            ancestors.append(element)
+
+    output.append(html[position:])
+
+    return "".join(output)
+
+def inline_css(html):
+    """Returns `html` with the rules of its <style> blocks copied into the
+    style attributes of the elements they match.
+    """
+    rules = get_stylesheet_rules(html)
+
+    if not rules:
+        return html
+
+    return inline_rules(html, rules, [])
+
+
+
+################################################################################
+# Templates
+################################################################################
+class EmailTemplate(object):
+    """A template built for one language: literal text, with the variables
+    between, each escaped as the template escapes it.
+    """
+    def __init__(self, parts, slots, rules=()):
+        # len(parts) == len(slots) + 1; slots are (name, escaped, ancestors),
+        # where `ancestors` are the elements open around an unescaped
+        # variable, whose markup `rules` are inlined into
+        self.parts = parts
+        self.slots = slots
+        self.rules = rules
+
+    @classmethod
+    def build(cls, template, language, names):
+        # A placeholder per variable, which autoescaping changes, so that
+        # whether each use of it is escaped shows in the output
+        token = uuid4().hex
+        placeholders = dict((name, "myrg&{}&{}".format(name, token)) for name in names)
+
+        with translation.override(language):
+            html = template.render(Context(placeholders))
+
+        rules = get_stylesheet_rules(html)
+
+        if rules:
+            html = inline_rules(html, rules, [])
+
+        slot_re = re.compile(r"myrg(?P<separator>&|&amp;)({})(?P=separator){}".format("|".join(re.escape(name) for name in names), token))
+        pieces = slot_re.split(html)
+
+        parts = pieces[0::3]
+        slots = []
+
+        for idx, (separator, name) in enumerate(zip(pieces[1::3], pieces[2::3])):
+            escaped = separator != "&"
+            ancestors = None
+
+            if rules and not escaped:
+                # Tracks the elements open before the variable; the
+                # preceding parts already have their styles
+                ancestors = []
+                inline_rules("".join(parts[:idx + 1]), rules, ancestors)
+                ancestors = tuple(ancestors)
+
+            slots.append((name, escaped, ancestors))
+
+        return cls(parts, slots, rules)
+
+    def render(self, context):
+        values = {}
+        output = [self.parts[0]]
+
+        for slot, part in zip(self.slots, self.parts[1:]):
+            if slot not in values:
+                name, escaped, ancestors = slot
+                value = context.get(name)
+                value = "" if value is None else value
+
+                if escaped:
+                    value = conditional_escape(value)
+                elif ancestors is not None:
+                    value = inline_rules("{}".format(value), self.rules, list(ancestors))
+                else:
+                    value = "{}".format(value)
+
+                values[slot] = value
+
+            output.append(values[slot])
+            output.append(part)
+
+        return "".join(output)
+
+
+# {template name: compiled template}, {(template name, language, variable
+# names): EmailTemplate}
+_compiled = {}
+_built = {}
+_templates_lock = threading.Lock()
+
+def get_email_template(template_name, language, names):
+    """Returns `template_name` built for `language` and the variables
+    `names`.
+    """
+    key = (template_name, language, tuple(sorted(names)))
+    email_template = _built.get(key)
+
+    if email_template is None:
+        with _templates_lock:
+            email_template = _built.get(key)
+
+            if email_template is None:
+                if template_name not in _compiled:
+                    _compiled[template_name] = get_template(template_name)
+
+                email_template = _built[key] = EmailTemplate.build(_compiled[template_name], language, key[2])
+
+    return email_template
+
+def render_email(template_name, context, language=None):
+    """Renders `template_name` with `context`, {variable name: value}, in
+    `language` (default: the first of LANGUAGES), with its CSS inlined.
+    """
+    language = language or settings.LANGUAGES[0][0]
+
+    return get_email_template(template_name, language, list(context)).render(context)
+
+def clear_email_templates():
+    with _templates_lock:
+        _compiled.clear()
+        _built.clear()
@@ -0,0 +1,105 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+from future.utils import native_str
+
+from six.moves import BaseHTTPServer, socketserver
+
+import json
+import random
+import threading
+import time
+
+from .transports import sent_results
+
+# Mandrill stand-in.
+#
+# A local HTTP server answering Mandrill's messages/send call, for load
+# testing the outbox through the "http" transport (see
+# myrg_messages.transports) without sending email. Each call waits `latency`
+# seconds, then fails with Mandrill's error shape with probability
+# `failure_rate`, and otherwise reports every recipient as sent.
+#
+# Run with `manage.py mandrill_standin`, or in process with start_standin().
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep-alive, as the transports reuse their connections
+    protocol_version = native_str("HTTP/1.1")
+
+    # Responses are written in one piece (and flushed by the server after
+    # each request) rather than a write per header, which under keep-alive
+    # stalls on delayed ACKs
+    wbufsize = -1
+
+    def respond(self, status, result):
+        body = json.dumps(result).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header(native_str("Content-Type"), native_str("application/json"))
+        self.send_header(native_str("Content-Length"), native_str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status, name, message):
+        self.respond(status, {"status": "error", "code": -1, "name": name, "message": message})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("content-length") or 0))
+
+        if not self.path.endswith("/messages/send.json"):
+            return self.error(500, "Unknown_Method", "Only messages/send is supported")
+
+        try:
+            message = json.loads(body.decode("utf-8"))["message"]
+        except (KeyError, TypeError, ValueError):
+            return self.error(500, "ValidationError", "No message given")
+
+        self.server.count("received")
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.fails():
+            self.server.count("failed")
+            return self.error(500, "GeneralError", "Stand-in failure")
+
+        self.respond(200, sent_results(message))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class StandInServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.05, failure_rate=0.0, seed=None, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StandInHandler)
+
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.verbose = verbose
+        self.counts = {"received": 0, "failed": 0}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, counter):
+        with self._lock:
+            self.counts[counter] += 1
+
+    def fails(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+def start_standin(host="127.0.0.1", port=0, **kwargs):
+    """Starts a stand-in serving on a background thread. Returns the server;
+    its URL for EMAIL_TRANSPORT is http://<host>:<server.server_port>/api/1.0/.
+    """
+    server = StandInServer((native_str(host), port), **kwargs)
+
+    thread = threading.Thread(target=server.serve_forever, name="myrg-mandrill-standin")
+    thread.daemon = True
+    thread.start()
+
+    return server
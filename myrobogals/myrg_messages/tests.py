@@ -1,3 +1,125 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import datetime
+
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from myrg_users.models import RobogalsUser
+
+from .models import EmailDefinition, EmailMessage, EmailOutbox
+from .outbox import DEAD, PENDING, SENDING, SENT, claim_emails, deliver, enqueue_email, retry_dead_emails
+from .transports import get_transport, reset_transport
+
+
+################################################################################
+# Outbound email queue (myrg_messages.outbox)
+################################################################################
+@override_settings(EMAIL_OUTBOX={"MAX_ATTEMPTS": 2, "CLAIM_SECONDS": 300, "RETRY_DELAY": 30})
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        reset_transport()
+
+        self.users = [RobogalsUser.objects.create_user("outbox{}".format(idx), "outbox{}@example.com".format(idx), "Outbox")
+                      for idx in range(2)]
+        self.definition = EmailDefinition.objects.create(body="Body", sender_name="Sender",
+                                                         sender_address="sender@example.com", subject="Subject")
+
+    def tearDown(self):
+        reset_transport()
+
+    def enqueue(self):
+        return enqueue_email(self.definition, {
+            "to": [{"email": user.primary_email, "name": user.given_name, "type": "to"} for user in self.users],
+            "subject": "Subject",
+            "text": "Body",
+        }, dict((user.primary_email, user.pk) for user in self.users))
+
+    def make_due(self, email):
+        EmailOutbox.objects.filter(pk=email.pk).update(date_due=timezone.now() - datetime.timedelta(seconds=1))
+
+    def test_claimed_once(self):
+        queued = [self.enqueue() for idx in range(3)]
+
+        claimed = claim_emails(2)
+
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(len(set(email.claim for email in claimed)), 1)
+        self.assertEqual([(email.status, email.attempts) for email in claimed], [(SENDING, 1), (SENDING, 1)])
+
+        # Only the email left unclaimed is still due
+        remaining = set(email.pk for email in queued) - set(email.pk for email in claimed)
+
+        self.assertEqual(set(email.pk for email in claim_emails(10)), remaining)
+        self.assertEqual(claim_emails(10), [])
+
+    def test_expired_claim_taken_over(self):
+        self.enqueue()
+        [stale] = claim_emails(1)
+
+        self.make_due(stale)
+        [current] = claim_emails(1)
+
+        self.assertEqual(current.attempts, 2)
+        self.assertNotEqual(current.claim, stale.claim)
+
+        # The first sender finishing late does not overwrite the second's claim
+        with override_settings(EMAIL_TRANSPORT={"BACKEND": "memory"}):
+            self.assertEqual(deliver(stale), "sent")
+
+        self.assertEqual(EmailOutbox.objects.get(pk=current.pk).claim, current.claim)
+
+    @override_settings(EMAIL_TRANSPORT={"BACKEND": "memory"})
+    def test_sent(self):
+        self.enqueue()
+        [email] = claim_emails(1)
+
+        self.assertEqual(deliver(email), "sent")
+
+        email = EmailOutbox.objects.get(pk=email.pk)
+        self.assertEqual((email.status, email.claim), (SENT, ""))
+        self.assertEqual(get_transport().sent, 1)
+        self.assertEqual(sorted(EmailMessage.objects.filter(definition=self.definition).values_list("recipient_user_id", "service_status")),
+                         sorted((user.pk, "sent") for user in self.users))
+
+    # Nothing listens on port 1, so every send fails
+    @override_settings(EMAIL_TRANSPORT={"BACKEND": "http", "URL": "http://127.0.0.1:1/api/1.0/", "TIMEOUT": 1})
+    def test_retried_then_dead(self):
+        self.enqueue()
+        [email] = claim_emails(1)
+
+        self.assertEqual(deliver(email), "retried")
+
+        email = EmailOutbox.objects.get(pk=email.pk)
+        self.assertEqual((email.status, email.claim), (PENDING, ""))
+        self.assertGreater(email.date_due, timezone.now() + datetime.timedelta(seconds=14))
+        self.assertIn("ConnectionError", email.last_error)
+
+        # Not due again until the retry delay has passed
+        self.assertEqual(claim_emails(1), [])
+
+        self.make_due(email)
+        [email] = claim_emails(1)
+
+        self.assertEqual(deliver(email), "dead")
+        self.assertEqual(EmailOutbox.objects.get(pk=email.pk).status, DEAD)
+        self.assertEqual(claim_emails(1), [])
+
+        self.assertEqual(retry_dead_emails(), 1)
+
+        email = EmailOutbox.objects.get(pk=email.pk)
+        self.assertEqual((email.status, email.attempts), (PENDING, 0))
+        self.assertEqual([claimed.pk for claimed in claim_emails(1)], [email.pk])
+
+    def test_dead_when_claim_expired_after_last_attempt(self):
+        self.enqueue()
+
+        for attempt in range(3):
+            [email] = claim_emails(1)
+            self.make_due(email)
 
-# Create your tests here.
+        self.assertEqual(deliver(email), "dead")
+        self.assertEqual(EmailOutbox.objects.get(pk=email.pk).status, DEAD)
@@ -0,0 +1,159 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from collections import deque
+from functools import partial
+import json
+import threading
+from uuid import uuid4
+
+from django.conf import settings
+
+# Mail transports.
+#
+# The outbox (see myrg_messages.outbox) sends each email through the
+# configured transport, whose send() takes a Mandrill message and returns
+# Mandrill's messages/send result, one {"email", "status", "_id",
+# "reject_reason"} per recipient, or raises.
+#
+# Backends:
+#   "mandrill"  Mandrill, through its client, using MANDRILL_API_KEY.
+#   "http"      Any server speaking Mandrill's messages/send protocol at
+#               `URL`, e.g. `manage.py mandrill_standin` for load testing.
+#
+# Requests to Mandrill or `URL` time out after `TIMEOUT` seconds.
+#   "memory"    Keeps the last `MAX_MESSAGES` messages in process, and
+#               reports every recipient as sent.
+#
+# Refer to EMAIL_TRANSPORT in myrg_core/settings.py
+
+DEFAULTS = {
+    "BACKEND": "mandrill",
+    "URL": "http://127.0.0.1:8025/api/1.0/",
+    "TIMEOUT": 30,
+    "MAX_MESSAGES": 10000,
+}
+
+
+def get_transport_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "EMAIL_TRANSPORT", {}))
+    return options
+
+class TransportError(Exception):
+    pass
+
+def sent_results(message):
+    """Mandrill's messages/send result for `message`, with every recipient
+    sent.
+    """
+    return [{"email": recipient.get("email"), "status": "sent", "_id": uuid4().hex, "reject_reason": None}
+            for recipient in message.get("to") or ()]
+
+
+
+################################################################################
+# Backends
+################################################################################
+class MandrillTransport(object):
+    def __init__(self, api_key, timeout):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def send(self, message):
+        import mandrill
+
+        # One client, and so one HTTP connection pool, per sender thread
+        mandrill_client = getattr(self._local, "mandrill_client", None)
+
+        if mandrill_client is None:
+            mandrill_client = self._local.mandrill_client = mandrill.Mandrill(self.api_key)
+
+            # The client posts through its requests session without a
+            # timeout of its own
+            mandrill_client.session.request = partial(mandrill_client.session.request, timeout=self.timeout)
+
+        return mandrill_client.messages.send(message=message)
+
+class HTTPTransport(object):
+    def __init__(self, url, api_key, timeout):
+        self.url = url.rstrip("/") + "/messages/send.json"
+        self.api_key = api_key
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def send(self, message):
+        import requests
+
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+            session = self._local.session = requests.Session()
+
+        response = session.post(self.url,
+                                data=json.dumps({"key": self.api_key, "message": message}),
+                                headers={"content-type": "application/json"},
+                                timeout=self.timeout)
+
+        try:
+            result = response.json()
+        except ValueError:
+            raise TransportError("HTTP {}".format(response.status_code))
+
+        if response.status_code != 200:
+            # Mandrill's error shape
+            raise TransportError("{}: {}".format(result.get("name"), result.get("message")))
+
+        return result
+
+class MemoryTransport(object):
+    def __init__(self, max_messages):
+        self.messages = deque(maxlen=max_messages)
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.messages.append(message)
+            self.sent += 1
+
+        return sent_results(message)
+
+    def clear(self):
+        with self.lock:
+            self.messages.clear()
+            self.sent = 0
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    global _transport
+
+    if _transport is None:
+        options = get_transport_settings()
+
+        with _transport_lock:
+            if _transport is None:
+                if options["BACKEND"] == "mandrill":
+                    _transport = MandrillTransport(settings.MANDRILL_API_KEY, options["TIMEOUT"])
+                elif options["BACKEND"] == "http":
+                    _transport = HTTPTransport(options["URL"], getattr(settings, "MANDRILL_API_KEY", ""), options["TIMEOUT"])
+                elif options["BACKEND"] == "memory":
+                    _transport = MemoryTransport(options["MAX_MESSAGES"])
+                else:
+                    raise ValueError("EMAIL_TRANSPORT BACKEND must be one of \"mandrill\", \"http\" or \"memory\"")
+
+    return _transport
+
+def reset_transport():
+    """Drops the transport, so that the next get_transport() follows the
+    current settings.
+    """
+    global _transport
+
+    with _transport_lock:
+        _transport = None
@@ -11,6 +11,8 @@ from rest_framework import status
 from django.db.models import Q
 from django.utils import timezone
 
+from myrg_groups.rolecache import get_active_role
+
 from .functions import send_email
 
 
@@ -32,7 +34,7 @@ class SendMessage(RobogalsAPIView):
             user_query = request.user
             
             if not (role_id is None):
-                role_query = user_query.role_set.filter(Q(date_start__lte=timezone.now()) & (Q(date_end__isnull=True) | Q(date_end__gte=timezone.now()))).get(pk = str(role_id))
+                role_query = get_active_role(user_query, role_id)
         except:
             return Response({"detail":"ROLE_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
     
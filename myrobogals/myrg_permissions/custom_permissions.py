@@ -4,6 +4,7 @@ from django.test.client import RequestFactory
 from rest_framework.permissions import BasePermission
 from rest_framework.views import APIView
 from myrg_core.classes import RobogalsAPIView
+from myrg_core.serializers import serializer_for
 from .models import PermissionList
 from .serializers import PermissionListSerializer
 from myrg_groups.models import Role
@@ -26,8 +27,7 @@ class PermissionManager(RobogalsAPIView):
         query = PermissionList.objects.filter(permission=data)
         #logger.error(query)
         # Serialize
-        serializer = PermissionListSerializer
-        serializer.Meta.fields = ["role_classes"]
+        serializer = serializer_for(PermissionListSerializer, ["role_classes"])
         serialized_query = serializer(query, many=True)
         #logger.error(serialized_query.data)
         
@@ -49,8 +49,7 @@ class PermissionManager(RobogalsAPIView):
         query = Role.objects.filter(user=user_id)
         #logger.error(query)
         # Serialize
-        serializer = RoleSerializer
-        serializer.Meta.fields = ["role_class"]
+        serializer = serializer_for(RoleSerializer, ["role_class"])
         serialized_query = serializer(query, many=True)
         #logger.error(serialized_query.data)
         
@@ -152,8 +151,7 @@ class IsAdminRobogals(BasePermission):
         logger.error(user_obj.id)
         #select all user_id based on roles e.g superadmin, robogals admin, software team
         role_query = Role.objects.filter(role_class="1")
-        role_serializer = RoleSerializer
-        role_serializer.Meta.fields = ("user",)
+        role_serializer = serializer_for(RoleSerializer, ("user",))
         role_serializer_query = role_serializer(role_query, many=True)
         logger.error(role_serializer_query.data)
         data = json.loads(role_serializer_query.data)
@@ -182,8 +180,7 @@ class IsTeamMember(BasePermission):
         
         role_query = user_obj.role_set.filter(user=user_obj.id)
         
-        role_serializer = RoleSerializer
-        role_serializer.Meta.fields = ("id","group","role_class",)        
+        role_serializer = serializer_for(RoleSerializer, ("id","group","role_class",))
         role_serializer_query = role_serializer(role_query, many=True)
         #Slogger.error(role_serializer_query.data)
         if role_id is None:
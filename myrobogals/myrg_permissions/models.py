@@ -17,8 +17,10 @@ class PermissionDefinition(models.Model):
 
 #@python_2_unicode_compatible
 class PermissionList(models.Model):
-    permission = models.TextField(_('permission'),
+    permission = models.CharField(_('permission'),
+                                  max_length=255,
                                   blank=False,
+                                  db_index=True,
                                   help_text=_('permission naming structure: [Core function/thing]_[Component/Visibility]_[Action]. e.g: USER_SELF_VIEW'))
     role_classes = models.CommaSeparatedIntegerField(max_length=200)
     
\ No newline at end of file
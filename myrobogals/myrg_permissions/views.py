@@ -17,6 +17,8 @@ from django.utils import timezone
 from .models import PermissionList
 from .serializers import PermissionListSerializer
 
+from myrg_core.listing import list_engine
+
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
@@ -33,114 +35,18 @@ import logging
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
-PAGINATION_MAX_LENGTH = 1000
-
 MAX_REPOS = 1
         
 # Permissions
 ################################################################################
+permission_list = list_engine.register("permissions", PermissionList, PermissionListSerializer, "permissions")
+
 class ListPermission(RobogalsAPIView):
+    read_only = True
+    etag_models = (PermissionList,)
+    
     def post(self, request, format=None):
-        # request.DATA
-        try:
-            requested_fields = list(request.DATA.get("query"))
-            requested_pagination = dict(request.DATA.get("pagination"))
-        except:
-            return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if (not requested_fields) or (not requested_pagination):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-         
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
-         
-        # Filter
-        filter_dict = {}
-        sort_fields = []
-        fields = ["id"]  
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("seapermissionh")
-            field_order = field_object.get("order")
-            field_visibility = field_object.get("visibility")
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = str(field_name)
-             
-            # Non-valid field names
-            # ! Uses _meta non-documented API 
-            try:
-                PermissionList._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None):
-                filter_dict.update({field_name+"__icontains": str(field_query)})
-            
-            if (field_order is not None):
-                field_order = str(field_order) 
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = PermissionList.objects.all()
-        query = query.filter(**filter_dict)
-        query = query.order_by(*sort_fields)
-        
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer = PermissionListSerializer
-        serializer.Meta.fields = fields
-        
-        serialized_query = serializer(query, many=True)
-        
-          
-        # Output
-        output_list = []
-        
-        for permissionlist_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": permissionlist_object.pop("id")})
-            new_dict.update({"data": permissionlist_object})
-        
-            output_list.append(new_dict)
-        
-        
-        return Response({
-                            "meta": {
-                                "size": query_size
-                            },
-                            "permissions": output_list
-                        })
+        return permission_list.respond(request)
 
 class DeletePermissionLists(RobogalsAPIView):
     def post(self, request, format=None):
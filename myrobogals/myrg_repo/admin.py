@@ -36,6 +36,8 @@ class RepoFileAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     ordering = ('name',)
 
+    list_select_related = ('container',)
+
 #    def get_fieldsets(self, request, obj=None):
 #        if not obj:
 #            return self.add_fieldsets
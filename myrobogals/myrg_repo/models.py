@@ -44,7 +44,8 @@ class RepoContainer(models.Model):
                                                )
     date_created = models.DateTimeField(_('date created'),
                                     blank=False,
-                                    default=timezone.now)
+                                    default=timezone.now,
+                                    db_index=True)
     date_updated = models.DateTimeField(_('date updated'),
                                     blank=False,
                                     default=timezone.now)
@@ -84,4 +85,10 @@ class RepoFile(models.Model):
     READONLY_FIELDS = ("id",)
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+# Full-text search over repo containers (see myrg_core.search)
+from myrg_core.search import search_indexes
+
+search_indexes.register("repocontainers", RepoContainer, ("title", "tags", "body"))
@@ -5,6 +5,8 @@ import six
 from .models import RepoContainer, RepoFile
 
 from rest_framework import serializers
+
+from myrg_core.serializers import BulkSerializerMixin
         
 class RepoContainerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,6 +14,9 @@ class RepoContainerSerializer(serializers.ModelSerializer):
         read_only_fields = RepoContainer.READONLY_FIELDS
         write_only_fields = RepoContainer.PROTECTED_FIELDS
         
+class RepoContainerBulkSerializer(BulkSerializerMixin, RepoContainerSerializer):
+    pass
+        
 class RepoFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = RepoFile
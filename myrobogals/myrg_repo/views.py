@@ -16,9 +16,13 @@ from django.db import transaction
 from django.utils import timezone
 
 from .models import RepoContainer, RepoFile
-from .serializers import RepoContainerSerializer, RepoFileSerializer
+from .serializers import RepoContainerSerializer, RepoContainerBulkSerializer, RepoFileSerializer
 from .forms import UploadFileForm
 
+from myrg_core.bulkedit import edit_objects
+from myrg_core.listing import list_engine
+from myrg_core.signals import send_queryset_updated
+
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
@@ -36,13 +40,37 @@ import logging
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
-PAGINATION_MAX_LENGTH = 1000
-
 MAX_REPOS = 1
         
 # Repo Container
 ################################################################################
+def expand_repocontainer_users(output_list):
+    """Replaces the `user` id of each container with [{"username": ...}]."""
+    from myrg_users.models import RobogalsUser
+    
+    # checked user property and retrieve information for user(from user model) 
+    # http://stackoverflow.com/questions/11748234/
+    user_ids = set(repocontainer_dict["data"].get("user") for repocontainer_dict in output_list)
+    user_ids.discard(None)
+    
+    if not user_ids:
+        return
+    
+    usernames = dict(RobogalsUser.objects.filter(id__in=user_ids).values_list("id", "username"))
+    
+    for repocontainer_dict in output_list:
+        if repocontainer_dict["data"].get("user"):
+            user_id = repocontainer_dict["data"].pop("user")
+            repocontainer_dict.update({"user": [{"username": usernames[user_id]}] if user_id in usernames else []})
+
+repocontainer_list = list_engine.register("repocontainers", RepoContainer, RepoContainerSerializer, "rcl",
+                                          queryset=RepoContainer.objects.filter(service__gt=0),
+                                          default_fields=("id", "user", "role"),
+                                          or_search_fields=("title", "tags"),
+                                          post_process=expand_repocontainer_users)
+
 class ListRepoContainers(RobogalsAPIView):
+    read_only = True
     #permission_classes = [AnyPermissions]
     #any_permission_classes = [IsAdminRobogals,]
         
@@ -64,133 +92,7 @@ class ListRepoContainers(RobogalsAPIView):
             logger.error("permission denied")
             return Response({"PERMISSION_DENIED"}, status=status.HTTP_400_BAD_REQUEST)
         
-        from myrg_users.serializers import RobogalsUserSerializer
-        from myrg_users.models import RobogalsUser
-
-        # request.DATA
-        try:
-            requested_fields = list(request.DATA.get("query"))
-            requested_pagination = dict(request.DATA.get("pagination"))
-        except:
-            return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if (not requested_fields) or (not requested_pagination):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Filter
-        key_title = "~"
-        key_tags = "~"
-        filter_dict = {} 
-        sort_fields = []
-        fields = ["id", "user", "role"] 
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("search")
-            field_order = field_object.get("order") 
-            field_visibility = field_object.get("visibility")  
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = str(field_name)
-            
-            # Block protected fields 
-            if field_name in RepoContainer.PROTECTED_FIELDS:
-                return Response({"detail":"`{}` is a protected field.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Non-valid field names
-            # ! Uses _meta non-documented API
-            try:
-                RepoContainer._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None):
-                if (field_name == "title" and field_query != ""):
-                    key_title = str(field_query)
-                elif (field_name == "tags" and field_query != ""):
-                    key_tags = str(field_query )
-                else:
-                    filter_dict.update({field_name+"__icontains": str(field_query)})
-            
-            if (field_order is not None):
-                field_order = str(field_order)
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = RepoContainer.objects.filter(service__gt=0)
-        if (key_title == "~" and key_tags == "~" ):
-            query = query.filter(**filter_dict)
-        else:
-            query = query.filter(Q(title__icontains=key_title) | Q(tags__icontains=key_tags))
-        query = query.order_by(*sort_fields)
-        
-            
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer = RepoContainerSerializer
-        serializer.Meta.fields = fields
-        
-        serialized_query = serializer(query, many=True)
-        
-        # Output
-        output_list = [] 
-        
-        for repocontainer_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": repocontainer_object.pop("id")})
-            new_dict.update({"data": repocontainer_object})
-            # checked user property and retrieve information for user(from user model) 
-            # http://stackoverflow.com/questions/11748234/
-            if repocontainer_object.get('user'):
-                user_id = repocontainer_object.pop("user")
-                user = RobogalsUser.objects.filter(id = user_id)
-                user_serializer = RobogalsUserSerializer
-                user_serializer.Meta.fields = ("username",)
-                user_serializer_query = user_serializer(user, many=True)
-                user_data = user_serializer_query.data
-                new_dict.update({"user": user_data})
-        
-            output_list.append(new_dict)   
-        
-        
-        return Response({ 
-                            "meta": {
-                                "size": query_size
-                            }, 
-                            "rcl": output_list
-                        })
+        return repocontainer_list.respond(request)
 
 class DeleteRepoContainers(RobogalsAPIView):
     def post(self, request, format=None):
@@ -236,6 +138,8 @@ class DeleteRepoContainers(RobogalsAPIView):
         except:
             for pk in requested_ids:
                 failed_ids.update({pk: "OBJECT_NOT_MODIFIED"})
+        else:
+            send_queryset_updated(RepoContainer, affected_ids)
 
         # Gather up non-deleted IDs
         non_deleted_ids = list(set(requested_ids)-set(affected_ids))
@@ -268,6 +172,7 @@ class EditRepoContainers(RobogalsAPIView):
                 
         failed_repocontainer_updates = {}
         completed_repocontainer_updates = []
+        repocontainer_updates = []
         
         # Filter out bad data
         for repocontainer_object in supplied_repocontaineres:
@@ -317,27 +222,12 @@ class EditRepoContainers(RobogalsAPIView):
             if skip_repocontainer:
                 continue
             
-            
-            # Fetch, serialise and save
-            try:
-                repocontainer_query = RepoContainer.objects.get(pk=repocontainer_id)
-            except:
-                failed_repocontainer_updates.update({repocontainer_id: "OBJECT_NOT_FOUND"})
-                continue
-                
-            serializer = RepoContainerSerializer
-            serialized_repocontainer = serializer(repocontainer_query, data=repocontainer_update_dict, partial=True)
+            repocontainer_updates.append((repocontainer_id, repocontainer_update_dict))
+        
+        
+        # Fetch, serialise and save
+        edit_objects(RepoContainer.objects.all(), RepoContainerBulkSerializer(partial=True), repocontainer_updates, failed_repocontainer_updates, completed_repocontainer_updates)
         
-            if serialized_repocontainer.is_valid():
-                try:
-                    with transaction.atomic():
-                        serialized_repocontainer.save()
-                        completed_repocontainer_updates.append(repocontainer_id)
-                except:
-                    failed_repocontainer_updates.update({repocontainer_id: "OBJECT_NOT_MODIFIED"})
-            else:
-                failed_repocontainer_updates.update({repocontainer_id: "DATA_VALIDATION_FAILED"})
-                
         return Response({
             "fail": {
                 "id": failed_repocontainer_updates
@@ -345,7 +235,7 @@ class EditRepoContainers(RobogalsAPIView):
             "success": {
                 "id": completed_repocontainer_updates
             },
-            "commit": serialized_repocontainer.is_valid()
+            "commit": bool(repocontainer_updates) and repocontainer_updates[-1][0] in completed_repocontainer_updates
         })
 
 class CreateRepoContainers(RobogalsAPIView):
@@ -432,114 +322,14 @@ class CreateRepoContainers(RobogalsAPIView):
         
 # RepoFile
 ################################################################################
+repofile_list = list_engine.register("repofiles", RepoFile, RepoFileSerializer, "rfl")
+
 class ListRepoFiles(RobogalsAPIView):
+    read_only = True
+    etag_models = (RepoFile,)
+    
     def post(self, request, format=None):
-        # request.DATA
-        try:
-            requested_fields = list(request.DATA.get("query"))
-            requested_pagination = dict(request.DATA.get("pagination"))
-        except:
-            return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if (not requested_fields) or (not requested_pagination):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-         
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
-         
-        # Filter
-        filter_dict = {}
-        sort_fields = []
-        fields = ["id"]  
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("search")
-            field_order = field_object.get("order")
-            field_visibility = field_object.get("visibility")
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = str(field_name)
-             
-            # Block protected fields like passwords
-            if field_name in RepoFile.PROTECTED_FIELDS:
-                return Response({"detail":"`{}` is a protected field.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Non-valid field names
-            # ! Uses _meta non-documented API 
-            try:
-                RepoFile._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None and field_name == "container"):
-                filter_dict.update({field_name+"__id__icontains": str(field_query)})
-            elif (field_query is not None):
-                filter_dict.update({field_name+"__icontains": str(field_query)})
-            
-            if (field_order is not None):
-                field_order = str(field_order) 
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = RepoFile.objects.all()
-        query = query.filter(**filter_dict)
-        query = query.order_by(*sort_fields)
-        
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer = RepoFileSerializer
-        serializer.Meta.fields = fields
-        
-        serialized_query = serializer(query, many=True)
-        
-          
-        # Output
-        output_list = []
-        
-        for repofile_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": repofile_object.pop("id")})
-            new_dict.update({"data": repofile_object})
-        
-            output_list.append(new_dict)
-        
-        
-        return Response({
-                            "meta": {
-                                "size": query_size
-                            },
-                            "rfl": output_list
-                        })
+        return repofile_list.respond(request)
 
 class DeleteRepoFiles(RobogalsAPIView):
     def post(self, request, format=None):
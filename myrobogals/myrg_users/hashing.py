@@ -0,0 +1,104 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+import atexit
+import math
+import multiprocessing
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+
+# Bulk password hashing off the request thread.
+#
+# Hashing a password with Django's default PBKDF2 hasher takes tens of
+# milliseconds of CPU, holding the GIL throughout, so creating hundreds of
+# users stalls the worker handling the request. `make_passwords` instead hashes
+# on a pool of `WORKERS` processes (by default one per core), which run in
+# parallel with each other and with the request threads, and returns the
+# encoded passwords in order.
+#
+# Only bulk paths (CreateUsers, EditUsers) hash through the pool. Single
+# passwords are hashed inline with set_password, as the pool would only add a
+# round trip; make_passwords hashes a lone password inline as well.
+#
+# Salts are drawn in the calling process and each pool process only runs the
+# hasher's encode(), so the pool needs no Django state of its own, and takes
+# none of the locks (logging, database connections) which the threads of the
+# process it was forked from, e.g. the APILog writer, may have held. The pool
+# is started on first use in each process and closed at exit; with several
+# worker processes per host, lower `WORKERS` so that they do not oversubscribe
+# the cores between them. With `ENABLED` off, or in pool processes
+# themselves, passwords are hashed inline.
+#
+# Refer to PASSWORD_HASHING in myrg_core/settings.py
+
+DEFAULTS = {
+    "ENABLED": True,
+    "WORKERS": None,
+}
+
+
+def get_hashing_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "PASSWORD_HASHING", {}))
+    return options
+
+def get_worker_count():
+    return get_hashing_settings()["WORKERS"] or multiprocessing.cpu_count()
+
+def _encode(job):
+    hasher, password, salt = job
+    return hasher.encode(password, salt)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(get_worker_count())
+
+    return _pool
+
+def close_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+
+atexit.register(close_pool)
+
+def make_passwords(passwords):
+    """Returns the encoded form of each of `passwords`, in order. A password of
+    None gives an unusable password, as with make_password.
+    """
+    if (not get_hashing_settings()["ENABLED"]) or multiprocessing.current_process().daemon:
+        return [make_password(password) for password in passwords]
+
+    hasher = get_hasher("default")
+    jobs = [(hasher, password, hasher.salt()) for password in passwords if password is not None]
+
+    if len(jobs) < 2:
+        return [make_password(password) for password in passwords]
+
+    # A few chunks per process, for balance without a round trip per password
+    chunk_size = int(math.ceil(len(jobs) / float(get_worker_count() * 4)))
+    encoded = iter(get_pool().map(_encode, jobs, chunk_size))
+
+    return [next(encoded) if password is not None else make_password(None) for password in passwords]
+
+def set_passwords(users_passwords):
+    """Sets the password of each user in `users_passwords`, [(user, raw
+    password)], without saving them.
+    """
+    encoded_passwords = make_passwords([password for user, password in users_passwords])
+
+    for (user, password), encoded_password in zip(users_passwords, encoded_passwords):
+        user.password = encoded_password
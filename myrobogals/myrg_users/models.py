@@ -8,7 +8,6 @@ from django.utils.encoding import python_2_unicode_compatible
 from django.db import models
 from django.core import validators
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
-from django.contrib.sessions.models import Session
 
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -269,6 +268,9 @@ class RobogalsUser(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = _('User')
         verbose_name_plural = _('Users')
+
+        # Lists select active users and usually sort by username
+        index_together = (("is_active", "username"),)
         
     def get_full_name(self):
         """Retrieves the full name of the user in standard format.
@@ -313,22 +315,14 @@ class RobogalsUser(AbstractBaseUser, PermissionsMixin):
     
     
     
-    # http://stackoverflow.com/a/6657043
+    # Sessions are found through UserSession; see myrg_users.sessions
     def all_unexpired_sessions(self):
-        user_sessions = []
-        all_sessions  = Session.objects.filter(expire_date__gte=timezone.now())
-        for session in all_sessions:
-            session_data = session.get_decoded()
-            if self.pk == session_data.get('_auth_user_id'):
-                user_sessions.append(session.pk)
-        return Session.objects.filter(pk__in=user_sessions)
+        from .sessions import get_unexpired_sessions
+        return get_unexpired_sessions(self)
 
     def delete_all_unexpired_sessions(self):
-        session_list = self.all_unexpired_sessions()
-        session_list_count = len(session_list)
-        session_list.delete()
-        
-        return session_list_count
+        from .sessions import delete_unexpired_sessions
+        return delete_unexpired_sessions(self)
     
     
     
@@ -340,3 +334,34 @@ class RobogalsUser(AbstractBaseUser, PermissionsMixin):
     def is_staff(self):
         # We are implying superusers = staff
         return self.is_superuser
+
+
+
+class UserSession(models.Model):
+    """
+    The user each logged in session belongs to, which Session only holds in
+    its encoded data. Maintained by the login and logout signals (see
+    myrg_users.sessions).
+    """
+    session_key = models.CharField(_('session key'),
+        max_length=40,
+        primary_key=True)
+
+    user = models.ForeignKey(RobogalsUser,
+        related_name='user_sessions')
+
+    def __str__(self):
+        return self.session_key
+
+
+# Record which user each session belongs to
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from .sessions import record_session, forget_session
+
+user_logged_in.connect(record_session, dispatch_uid="myrg_users.sessions.record_session")
+user_logged_out.connect(forget_session, dispatch_uid="myrg_users.sessions.forget_session")
+
+# Full-text search over users (see myrg_core.search)
+from myrg_core.search import search_indexes
+
+search_indexes.register("users", RobogalsUser, ("username", "given_name", "family_name", "preferred_name", "primary_email"))
@@ -5,9 +5,13 @@ import six
 
 
 from .models import RobogalsUser
+from .hashing import set_passwords
 
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
 from rest_framework import serializers
 
+from myrg_core.serializers import BulkSerializerMixin
+
 class RobogalsUserSerializer(serializers.ModelSerializer):
     display_name = serializers.Field(source='get_preferred_name')
     gravatar_hash = serializers.Field(source='get_gravatar_hash')
@@ -31,5 +35,30 @@ class RobogalsUserSerializer(serializers.ModelSerializer):
                 self._errors[key] = self.error_messages['required']
 
         return instance
+
+
+class RobogalsUserBulkSerializer(BulkSerializerMixin, RobogalsUserSerializer):
+    """
+    Passwords are only hashed by hash_passwords, for all users at once (see
+    myrg_users.hashing).
+    """
+    def restore_object(self, attrs, instance=None):
+        has_password = "password" in attrs
+        password = attrs.pop("password", None)
+        
+        instance = super(RobogalsUserBulkSerializer, self).restore_object(attrs, instance)
         
-    
\ No newline at end of file
+        if has_password:
+            instance._raw_password = password
+            instance.password = UNUSABLE_PASSWORD_PREFIX
+        
+        return instance
+    
+    def hash_passwords(self, users):
+        """
+        Sets the passwords given to `users`, restored by this serializer.
+        """
+        set_passwords([(user, user.__dict__.pop("_raw_password")) for user in users if "_raw_password" in user.__dict__])
+    
+    def prepare_objects(self, users):
+        self.hash_passwords(users)
@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+from future.builtins import *
+import six
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import smart_text
+
+# User to session mapping.
+#
+# Session rows only hold their user's id inside the encoded session data, so
+# finding the sessions of one user means decoding every session. Instead, the
+# key of each session a user logs in to is recorded in UserSession (see
+# myrg_users.models) by the user_logged_in signal, and dropped again by
+# user_logged_out; revoking a user's sessions is then one indexed DELETE.
+#
+# Sessions created before UserSession existed are not recorded. Upgrading
+# deployments run `manage.py backfill_user_sessions` once, after syncdb, to
+# record them. Until it has run, `LEGACY_SCAN` can be turned on to still find
+# them by decoding the unexpired sessions which have no UserSession row, at
+# the cost of decoding every such session on each revocation.
+#
+# Refer to USER_SESSIONS in myrg_core/settings.py
+
+DEFAULTS = {
+    "LEGACY_SCAN": False,
+}
+
+
+def get_user_session_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, "USER_SESSIONS", {}))
+    return options
+
+def get_session_user_id(session):
+    return session.get_decoded().get("_auth_user_id")
+
+
+
+################################################################################
+# Signal receivers
+################################################################################
+def record_session(sender, request, user, **kwargs):
+    """user_logged_in receiver."""
+    from .models import UserSession
+
+    session_key = request.session.session_key
+
+    if session_key is None:
+        return
+
+    # Drop the user's sessions which have since expired or been deleted
+    recorded_keys = list(UserSession.objects.filter(user=user).values_list("session_key", flat=True))
+
+    if recorded_keys:
+        live_keys = Session.objects.filter(pk__in=recorded_keys, expire_date__gte=timezone.now()).values_list("pk", flat=True)
+        UserSession.objects.filter(pk__in=set(recorded_keys) - set(live_keys)).delete()
+
+    UserSession.objects.filter(session_key=session_key).exclude(user=user).delete()
+    UserSession.objects.get_or_create(session_key=session_key, defaults={"user": user})
+
+def forget_session(sender, request, user, **kwargs):
+    """user_logged_out receiver."""
+    from .models import UserSession
+
+    session_key = request.session.session_key
+
+    if session_key is not None:
+        UserSession.objects.filter(session_key=session_key).delete()
+
+
+
+################################################################################
+# Lookup
+################################################################################
+def scan_session_keys(user, sessions):
+    """Returns the keys of `sessions` belonging to `user`, by decoding each."""
+    user_id = smart_text(user.pk)
+
+    return [session.pk for session in sessions.iterator()
+            if smart_text(get_session_user_id(session)) == user_id]
+
+def get_legacy_session_keys(user, now):
+    """Keys of the unexpired, unrecorded sessions of `user`, if `LEGACY_SCAN`
+    is on.
+    """
+    from .models import UserSession
+
+    if not get_user_session_settings()["LEGACY_SCAN"]:
+        return []
+
+    return scan_session_keys(user, Session.objects.filter(expire_date__gte=now)
+                                                  .exclude(session_key__in=UserSession.objects.values("session_key")))
+
+def get_unexpired_sessions(user):
+    from .models import UserSession
+
+    now = timezone.now()
+    sessions = Q(session_key__in=UserSession.objects.filter(user=user).values("session_key"))
+    legacy_keys = get_legacy_session_keys(user, now)
+
+    if legacy_keys:
+        sessions |= Q(pk__in=legacy_keys)
+
+    return Session.objects.filter(sessions, expire_date__gte=now)
+
+def delete_unexpired_sessions(user):
+    """Deletes the unexpired sessions of `user`. Returns how many there were."""
+    from .models import UserSession
+
+    now = timezone.now()
+    legacy_keys = get_legacy_session_keys(user, now)
+
+    connection = connections[router.db_for_write(Session)]
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+
+    # Not Session.objects...delete(), which reads the rows first
+    cursor.execute("DELETE FROM {session} WHERE {session_key} IN (SELECT {mapping_key} FROM {mapping} WHERE {mapping_user} = %s) AND {expire_date} >= %s".format(
+                       session=qn(Session._meta.db_table),
+                       session_key=qn(Session._meta.pk.column),
+                       expire_date=qn(Session._meta.get_field("expire_date").column),
+                       mapping=qn(UserSession._meta.db_table),
+                       mapping_key=qn(UserSession._meta.pk.column),
+                       mapping_user=qn(UserSession._meta.get_field("user").column)),
+                   [user.pk, connection.ops.value_to_db_datetime(now)])
+    count = cursor.rowcount
+
+    if legacy_keys:
+        Session.objects.filter(pk__in=legacy_keys).delete()
+        count += len(legacy_keys)
+
+    UserSession.objects.filter(user=user).delete()
+
+    return count
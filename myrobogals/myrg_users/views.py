@@ -11,123 +11,33 @@ from rest_framework import status
 
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models import Q
-from django.db import transaction
+from django.db import connections, router, transaction, DatabaseError
 from django.utils import timezone
 
 from .models import RobogalsUser
-from .serializers import RobogalsUserSerializer
+from .serializers import RobogalsUserSerializer, RobogalsUserBulkSerializer
+from myrg_groups.models import Role
 
+from myrg_core.bulkedit import edit_objects
+from myrg_core.listing import list_engine
+from myrg_core.serializers import serializer_for
+from myrg_core.signals import send_queryset_updated
 
-PAGINATION_MAX_LENGTH = 1000
+
+user_list = list_engine.register("users", RobogalsUser, RobogalsUserSerializer, "user",
+                                 queryset=RobogalsUser.objects.filter(is_active=True))
+
+# Users inserted per query by CreateUsers
+CREATE_BATCH_SIZE = 500
 
 
 
 class ListUsers(RobogalsAPIView):
+    read_only = True
+    etag_models = (RobogalsUser,)
+    
     def post(self, request, format=None):
-        # request.DATA
-        try:
-            requested_fields = list(request.DATA.get("query"))
-            requested_pagination = dict(request.DATA.get("pagination"))
-        except:
-            return Response({"detail":"DATA_FORMAT_INVALID"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        if (not requested_fields) or (not requested_pagination):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Pagination
-        pagination_page_index = requested_pagination.get("page")
-        pagination_page_length = requested_pagination.get("length")
-        
-        if (pagination_page_index is None) or (pagination_page_length is None):
-            return Response({"detail":"DATA_INSUFFICIENT"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        pagination_page_index = int(pagination_page_index)
-        pagination_page_length = int(pagination_page_length)
-        
-        pagination_start_index = pagination_page_index * pagination_page_length
-        pagination_end_index = pagination_start_index + (pagination_page_length if pagination_page_length < PAGINATION_MAX_LENGTH else PAGINATION_MAX_LENGTH)
-            
-        if pagination_start_index < 0 or pagination_end_index < 0:
-            return Response({"detail":"PAGINATION_NEGATIVE_INDEX_UNSUPPORTED"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        
-        # Filter
-        filter_dict = {}
-        sort_fields = []
-        fields = ["id"]
-        
-        for field_object in requested_fields:
-            field_name = field_object.get("field")
-            field_query = field_object.get("search")
-            field_order = field_object.get("order")
-            field_visibility = field_object.get("visibility")
-            
-            if (field_name is None):
-                return Response({"detail":"FIELD_IDENTIFIER_MISSING"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            field_name = smart_text(field_name)
-            
-            # Block protected fields like passwords
-            if field_name in RobogalsUser.PROTECTED_FIELDS:
-                return Response({"detail":"`{}` is a protected field.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Non-valid field names
-            # ! Uses _meta non-documented API
-            try:
-                RobogalsUser._meta.get_field_by_name(field_name)
-            except FieldDoesNotExist:
-                return Response({"detail":"`{}` is not a valid field name.".format(field_name)}, status=status.HTTP_400_BAD_REQUEST)
-                
-            if (field_query is not None):
-                filter_dict.update({field_name+"__icontains": smart_text(field_query)})
-            
-            if (field_order is not None):
-                field_order = smart_text(field_order)
-                
-                if field_order == "a":
-                    sort_fields.append(field_name)
-                if field_order == "d":
-                    sort_fields.append("-"+field_name)
-            
-            if not (field_visibility == False):
-                fields.append(field_name)
-        
-        
-        # Build query
-        query = RobogalsUser.objects.filter(is_active=True)
-        query = query.filter(**filter_dict)
-        query = query.order_by(*sort_fields)
-        
-        query_size = query.count()
-        
-        query = query[pagination_start_index:pagination_end_index]
-        
-        
-        # Serialize
-        serializer = RobogalsUserSerializer
-        serializer.Meta.fields = fields
-        
-        serialized_query = serializer(query, many=True)
-        
-        
-        # Output
-        output_user_list = []
-        
-        for user_object in serialized_query.data:
-            new_dict = {}
-            new_dict.update({"id": user_object.pop("id")})
-            new_dict.update({"data": user_object})
-        
-            output_user_list.append(new_dict)
-        
-        
-        return Response({
-                            "meta": {
-                                "size": query_size
-                            },
-                            "user": output_user_list
-                        })
+        return user_list.respond(request)
 
 class DeleteUsers(RobogalsAPIView):
     def post(self, request, format=None):
@@ -173,6 +83,8 @@ class DeleteUsers(RobogalsAPIView):
         except:
             for pk in requested_ids:
                 failed_ids.update({pk: "OBJECT_NOT_MODIFIED"})
+        else:
+            send_queryset_updated(RobogalsUser, affected_ids)
 
         # Gather up non-deleted IDs
         non_deleted_ids = list(set(requested_ids)-set(affected_ids))
@@ -202,6 +114,7 @@ class EditUsers(RobogalsAPIView):
                 
         failed_user_updates = {}
         completed_user_updates = []
+        user_updates = []
         
         # Filter out bad data
         for user_object in supplied_users:
@@ -251,27 +164,12 @@ class EditUsers(RobogalsAPIView):
             if skip_user:
                 continue
             
-            
-            # Fetch, serialise and save
-            try:
-                user_query = RobogalsUser.objects.get(is_active=True, pk=user_id)
-            except:
-                failed_user_updates.update({user_id: "OBJECT_NOT_FOUND"})
-                continue
-                
-            serializer = RobogalsUserSerializer
-            serialized_user = serializer(user_query, data=user_update_dict, partial=True)
+            user_updates.append((user_id, user_update_dict))
+        
+        
+        # Fetch, serialise and save
+        edit_objects(RobogalsUser.objects.filter(is_active=True), RobogalsUserBulkSerializer(partial=True), user_updates, failed_user_updates, completed_user_updates)
         
-            if serialized_user.is_valid():
-                try:
-                    with transaction.atomic():
-                        serialized_user.save()
-                        completed_user_updates.append(user_id)
-                except:
-                    failed_user_updates.update({user_id: "OBJECT_NOT_MODIFIED"})
-            else:
-                failed_user_updates.update({user_id: "DATA_VALIDATION_FAILED"})
-                
         return Response({
             "fail": {
                 "id": failed_user_updates
@@ -283,6 +181,57 @@ class EditUsers(RobogalsAPIView):
 
         
 
+def get_existing_identifiers(user_create_dicts):
+    """
+    Returns (primary emails, usernames) of existing users which any of
+    `user_create_dicts` would duplicate.
+    """
+    connection = connections[router.db_for_read(RobogalsUser)]
+    emails = set()
+    usernames = set()
+    
+    # In as few queries as the database's limit on query parameters allows
+    batch_size = max(connection.ops.bulk_batch_size(["primary_email", "username"], user_create_dicts), 1)
+    
+    for idx in range(0, len(user_create_dicts), batch_size):
+        batch = user_create_dicts[idx:idx + batch_size]
+        
+        existing_users = RobogalsUser.objects.filter(Q(primary_email__in=[user_create_dict.get("primary_email") for user_create_dict in batch]) |
+                                                     Q(username__in=[user_create_dict.get("username") for user_create_dict in batch]))
+        
+        for primary_email, username in existing_users.values_list("primary_email", "username"):
+            emails.add(primary_email)
+            usernames.add(username)
+    
+    return emails, usernames
+
+def create_users(users_to_create, failed_user_creations):
+    """
+    Inserts the unsaved users of `users_to_create`, [(nonce, user)], in bulk.
+    Returns those saved.
+    """
+    try:
+        with transaction.atomic():
+            RobogalsUser.objects.bulk_create([user for user_nonce, user in users_to_create])
+    except DatabaseError:
+        # e.g. a user created meanwhile; saving one at a time finds which
+        created_users = []
+        
+        for user_nonce, user in users_to_create:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                    created_users.append((user_nonce, user))
+            except:
+                failed_user_creations.update({user_nonce: "OBJECT_NOT_MODIFIED"})
+        
+        return created_users
+    
+    # bulk_create sends no post_save
+    send_queryset_updated(RobogalsUser, [user.pk for user_nonce, user in users_to_create])
+    
+    return users_to_create
+
 class CreateUsers(RobogalsAPIView): 
     def post(self, request, format=None):
         # request.DATA
@@ -293,6 +242,7 @@ class CreateUsers(RobogalsAPIView):
                 
         failed_user_creations = {}
         completed_user_creations = {}
+        user_create_dicts = []
         
         # Filter out bad data
         for user_object in supplied_users:
@@ -326,32 +276,50 @@ class CreateUsers(RobogalsAPIView):
                     skip_user = True
                     break
             
-                if field == "primary_email":
-                    if RobogalsUser.objects.filter(primary_email=value).count():
-                        failed_user_creations.update({user_nonce: "OBJECT_ALREADY_EXISTS"})
-                        skip_user = True
-                        break
-            
                 # Add to update data dict
                 user_create_dict.update({field: value})
             
             if skip_user:
                 continue
             
+            user_create_dicts.append((user_nonce, user_create_dict))
+        
+        
+        # Uniqueness is checked for all users at once. Users in the request
+        # whose primary email or username an earlier one took fail just as
+        # they would had the earlier one already been saved
+        existing_emails, existing_usernames = get_existing_identifiers([user_create_dict for user_nonce, user_create_dict in user_create_dicts])
+        
+        # Serialise
+        serializer = RobogalsUserBulkSerializer()
+        restored_users = serializer.restore_objects([user_create_dict for user_nonce, user_create_dict in user_create_dicts])
+        users_to_create = []
+        
+        for (user_nonce, user_create_dict), (user, errors) in zip(user_create_dicts, restored_users):
+            primary_email = user_create_dict.get("primary_email")
+            username = user_create_dict.get("username")
             
-            # Serialise and save
-            serializer = RobogalsUserSerializer
-            serialized_user = serializer(data=user_create_dict)
+            if primary_email is not None and primary_email in existing_emails:
+                failed_user_creations.update({user_nonce: "OBJECT_ALREADY_EXISTS"})
+                continue
             
-            if serialized_user.is_valid():
-                try:
-                    with transaction.atomic():
-                        user = serialized_user.save()
-                        completed_user_creations.update({user_nonce: user.pk})
-                except:
-                    failed_user_creations.update({user_nonce: "OBJECT_NOT_MODIFIED"})
-            else:
+            if (user is None) or (username is not None and username in existing_usernames):
                 failed_user_creations.update({user_nonce: "DATA_VALIDATION_FAILED"})
+                continue
+            
+            existing_emails.add(primary_email)
+            existing_usernames.add(username)
+            users_to_create.append((user_nonce, user))
+        
+        
+        # Save
+        serializer.prepare_objects([user for user_nonce, user in users_to_create])
+        
+        for idx in range(0, len(users_to_create), CREATE_BATCH_SIZE):
+            created_users = create_users(users_to_create[idx:idx + CREATE_BATCH_SIZE], failed_user_creations)
+            
+            for user_nonce, user in created_users:
+                completed_user_creations.update({user_nonce: user.pk})
                 
         return Response({
             "fail": {
@@ -492,6 +460,7 @@ If you did not action this, please immediately perform a new password reset and
         
 class WhoAmI(RobogalsAPIView):
     permission_classes = (IsAuthenticated,)
+    read_only = True
 
     def post(self, request, format=None):
         from myrg_groups.serializers import GroupSerializer, RoleClassSerializer
@@ -505,8 +474,7 @@ class WhoAmI(RobogalsAPIView):
         role_class_data = {}
         
         # Serialize
-        user_serializer = RobogalsUserSerializer
-        user_serializer.Meta.fields = ("display_name","username","primary_email","gravatar_hash")
+        user_serializer = serializer_for(RobogalsUserSerializer, ("display_name","username","primary_email","gravatar_hash"))
         user_serialized_query = user_serializer(self.user_obj)
         
         
@@ -521,13 +489,11 @@ class WhoAmI(RobogalsAPIView):
             role_class = role_obj.role_class
             role_class_id = role_class.id
 
-            group_serializer = GroupSerializer
-            group_serializer.Meta.fields = ("name",)
+            group_serializer = serializer_for(GroupSerializer, ("name",))
             group_serialized_query = group_serializer(group)
             group_data = group_serialized_query.data
             
-            role_class_serializer = RoleClassSerializer
-            role_class_serializer.Meta.fields = ("name",)
+            role_class_serializer = serializer_for(RoleClassSerializer, ("name",))
             role_class_serialized_query = role_class_serializer(role_class)
             role_class_data = role_class_serialized_query.data
         
@@ -550,14 +516,21 @@ class WhoAmI(RobogalsAPIView):
 
 class ListMyRoles(RobogalsAPIView):
     permission_classes = (IsAuthenticated,)
+    read_only = True
+    etag_models = (Role,)
+    etag_period = 60
 
     def get(self, request, format=None):
         from myrg_groups.serializers import RoleSerializer
+        from myrg_groups.rolecache import active_role_q, cache_active_role
+        
+        role_query = list(self.user_obj.role_set.filter(active_role_q()))
         
-        role_query = self.user_obj.role_set.filter(Q(date_start__lte=timezone.now()) & (Q(date_end__isnull=True) | Q(date_end__gte=timezone.now())))
+        # The client will usually pick one of these next
+        for role in role_query:
+            cache_active_role(role)
         
-        role_serializer = RoleSerializer
-        role_serializer.Meta.fields = ("id","group","role_class",)        
+        role_serializer = serializer_for(RoleSerializer, ("id","group","role_class",))
         role_serializer_query = role_serializer(role_query, many=True)
         
         return Response({
@@ -1,6 +1,7 @@
+from __future__ import absolute_import
 import csv
 import datetime
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.template.defaultfilters import slugify
 from django.db.models.loading import get_model
 
@@ -16,30 +17,37 @@ from django.template import RequestContext
 import re
 
 
+class Echo(object):
+    """File-like object whose write() returns the value written, so that
+    csv.writer rows can be yielded one at a time."""
+    def write(self, value):
+        return value
+
+def export_rows(qs, headers):
+    writer = csv.writer(Echo())
+    # Write headers to CSV file
+    yield writer.writerow(headers)
+    # Write data to CSV file, without caching the whole queryset
+    for obj in qs.iterator():
+        row = []
+        for field in headers:
+            val = getattr(obj, field)
+            if callable(val):
+                val = val()
+            row.append(val)
+        yield writer.writerow(row)
+
 def export(qs, fields=None):
     model = qs.model
-    response = HttpResponse(mimetype='text/csv')
-    response['Content-Disposition'] = 'attachment; filename=%s.csv' % slugify(model.__name__)
-    writer = csv.writer(response)
-    # Write headers to CSV file
     if fields:
         headers = fields
     else:
         headers = []
         for field in model._meta.fields:
             headers.append(field.name)
-    writer.writerow(headers)
-    # Write data to CSV file
-    for obj in qs:
-        row = []
-        for field in headers:
-            if field in headers:
-                val = getattr(obj, field)
-                if callable(val):
-                    val = val()
-                row.append(val)
-        writer.writerow(row)
-    # Return CSV file to browser as download
+    # Return CSV file to browser as download, streamed as it is written
+    response = StreamingHttpResponse(export_rows(qs, headers), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename=%s.csv' % slugify(model.__name__)
     return response
 
 def admin_list_export(request, model_name, app_label, queryset=None, fields=None, list_display=True):
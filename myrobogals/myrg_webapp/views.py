@@ -21,6 +21,8 @@ from django.utils.http import http_date
 
 import json
 
+from myrg_groups.rolecache import get_active_role
+
 @ensure_csrf_cookie
 def webapp(request):
     try:
@@ -57,7 +59,7 @@ def set_role_id(request):
             
             try:
                 role_id = smart_text(role_id)
-                role_query = user_obj.role_set.filter(Q(date_start__lte=timezone.now()) & (Q(date_end__isnull=True) | Q(date_end__gte=timezone.now()))).get(pk = role_id)
+                role_query = get_active_role(user_obj, role_id)
                 
                 request.session['role_id'] = role_id
                 